@@ -1,15 +1,33 @@
-from flask import Flask, request, jsonify, render_template, session
+from flask import Flask, Response, request, jsonify, render_template, session, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_cors import CORS
-import bcrypt
 import jwt
 import datetime
 import os
 from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
 import re
-import sqlite3
 import json
+import io
+
+from app_config import init_app, load_config
+from catalog_index import CatalogIndex
+from change_log import ChangeLog
+from command_router import CommandRouter
+from fuzzy_index import FuzzyNameIndex
+import migrations
+from password_hasher import HasherBusy, PasswordHasher
+from product_import import READERS, detect_format, import_products
+from product_render import ProductRenderer
+from product_search import ProductSearch
+from response_cache import ResponseCache
+from sse import sse_response
+from stock_reservations import (InsufficientStock, ReservationError, ReservationNotFound,
+                                StockReservations, UnknownProduct)
+from token_auth import RevocationList, TokenAuth, TokenError, bearer_token
+from user_cache import UserCache
 
 load_dotenv()
 
@@ -18,20 +36,47 @@ CORS(app, resources={
     r"/api/*": {
         "origins": ["http://localhost:3000"],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type"],
+        "allow_headers": ["Content-Type", "Authorization"],
         "supports_credentials": True
     }
 })
-app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key')
+load_config(app, 'sqlite:///products.db')
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
 
 # Database configuration
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///products.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Connection pool shared by all requests: connections kept open, extra ones
+# opened under load, and seconds a request waits for one before failing
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', '10'))
+app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', '30'))
+app.config['DB_POOL_TIMEOUT'] = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+# In-memory SQLite keeps its single shared connection instead
+if make_url(app.config['SQLALCHEMY_DATABASE_URI']).database not in (None, '', ':memory:'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+    }
+# Serve product reads from the in-process catalog index (set to 0 to always query SQLite)
+app.config['CATALOG_INDEX'] = os.getenv('CATALOG_INDEX', '1') == '1'
+# Page size for product listings when the client doesn't pass ?limit=, and its upper bound
+app.config['PRODUCTS_PAGE_SIZE'] = int(os.getenv('PRODUCTS_PAGE_SIZE', '100'))
+app.config['PRODUCTS_MAX_PAGE_SIZE'] = int(os.getenv('PRODUCTS_MAX_PAGE_SIZE', '1000'))
+# Full-text matches the chat search command ranks first; the other products whose
+# name contains the term are listed after them
+app.config['SEARCH_RESULT_LIMIT'] = int(os.getenv('SEARCH_RESULT_LIMIT', '50'))
+# Keep a trigram index of product names for typo-tolerant search (set to 0 to disable)
+app.config['FUZZY_SEARCH'] = os.getenv('FUZZY_SEARCH', '1') == '1'
+# Seconds a stock reservation is held before it expires and its stock is returned
+app.config['RESERVATION_TTL'] = int(os.getenv('RESERVATION_TTL', '600'))
+# Seconds between checks for expired reservations
+app.config['RESERVATION_SWEEP_INTERVAL'] = float(os.getenv('RESERVATION_SWEEP_INTERVAL', '1'))
+# bcrypt work factor; stored hashes with a different factor are rehashed on login
+app.config['BCRYPT_ROUNDS'] = int(os.getenv('BCRYPT_ROUNDS', '12'))
 
 db = SQLAlchemy(app)
+metrics, query_profiler = init_app(app, db)
 login_manager = LoginManager()
 login_manager.init_app(app)
 
@@ -43,6 +88,21 @@ class User(UserMixin, db.Model):
     password = db.Column(db.String(120), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
+class RevokedToken(db.Model):
+    # Never reuse the id of a deleted row: workers sync revocations by id
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(32), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class SessionUser(UserMixin):
+    """The parts of a User that authenticated requests need, held in the
+    session user cache instead of loading the row on every request."""
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
@@ -52,6 +112,11 @@ class Product(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
+    # Category pages filter on category and the chat commands look names up
+    # case-insensitively; migrations.py adds both to existing databases.
+    __table_args__ = (db.Index('ix_product_category', 'category'),
+                      db.Index('ix_product_name_lower', db.func.lower(name)))
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -72,9 +137,66 @@ class ChatHistory(db.Model):
 
     user = db.relationship('User', backref=db.backref('chat_histories', lazy=True))
 
+class ChatMessage(db.Model):
+    """One chat message, stored append-only. ``seq`` numbers a user's messages
+    from 1 so clients can send just the messages they haven't saved yet."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'seq', name='uq_chat_message_user_seq'),)
+
+class StockReservation(db.Model):
+    """Stock taken from one or more products, pending checkout. ``status`` is
+    held, committed, released or expired."""
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(10), nullable=False, default='held')
+    items = db.Column(db.JSON, nullable=False)  # [{"name": ..., "quantity": ...}]
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_stock_reservation_status_expires', 'status', 'expires_at'),)
+
+catalog = CatalogIndex(Product, enabled=app.config['CATALOG_INDEX'],
+                       fuzzy=FuzzyNameIndex() if app.config['FUZZY_SEARCH'] else None)
+catalog.init_app(db)
+product_changes = ChangeLog(Product.__tablename__, sync_interval=app.config['CATALOG_SYNC_INTERVAL'])
+product_changes.subscribe(catalog.refresh)
+product_search = ProductSearch(catalog, limit=app.config['SEARCH_RESULT_LIMIT'])
+passwords = PasswordHasher.bcrypt(app.config['BCRYPT_ROUNDS'],
+                                  workers=app.config['PASSWORD_HASH_WORKERS'],
+                                  max_queue=app.config['PASSWORD_HASH_QUEUE'])
+stock = StockReservations(db, Product, StockReservation, catalog=catalog,
+                          default_ttl=app.config['RESERVATION_TTL'],
+                          sweep_interval=app.config['RESERVATION_SWEEP_INTERVAL'])
+users = UserCache(User, record=SessionUser, maxsize=app.config['USER_CACHE_SIZE'],
+                  ttl=app.config['USER_CACHE_TTL'])
+users.init_app(db)
+
+tokens = None
+if app.config['AUTH_MODE'] == 'jwt':
+    tokens = TokenAuth(
+        app.config['JWT_SECRET_KEY'],
+        revocations=RevocationList(db, RevokedToken, sync_interval=app.config['TOKEN_REVOCATION_SYNC']),
+        access_ttl=app.config['ACCESS_TOKEN_TTL'],
+        refresh_ttl=app.config['REFRESH_TOKEN_TTL'],
+    )
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return users.get(int(user_id))
+
+@login_manager.request_loader
+def load_user_from_token(request):
+    token = bearer_token(request)
+    if tokens is None or token is None:
+        return None
+    try:
+        return SessionUser(tokens.user(tokens.verify(token)))
+    except TokenError:
+        return None
 
 def parse_price_range(text):
     """Extract price range from text."""
@@ -94,173 +216,153 @@ def parse_category(text):
             return category
     return None
 
-def handle_product_query(message):
+WELCOME_MESSAGE = "Welcome to our E-commerce Chatbot! I can help you with:\n1. Searching products\n2. Adding new products\n3. Updating products\n4. Deleting products\n5. Viewing all products\n\nHow can I assist you today?"
+HELP_MESSAGE = "I can help you with:\n1. Searching products\n2. Adding new products\n3. Updating products\n4. Deleting products\n5. Viewing all products\n\nPlease let me know what you'd like to do!"
+
+chat_responses = None
+if app.config['CHAT_RESPONSE_CACHE_SIZE']:
+    chat_responses = ResponseCache(maxsize=app.config['CHAT_RESPONSE_CACHE_SIZE'])
+    chat_responses.watch(db, Product)
+    product_changes.subscribe(lambda ids: chat_responses.bump())
+
+chat_router = CommandRouter(cache=chat_responses, metrics=metrics)
+renderer = ProductRenderer(max_rows=app.config['CHAT_MAX_ROWS'])
+
+def product_line(product):
+    return f"- {product['name']}: ${product['price']}, {product['stock']} in stock, {product['category']}\n"
+
+def category_line(product):
+    return f"- {product['name']}: ${product['price']}, {product['stock']} in stock\n"
+
+@chat_router.command('welcome', exact=('hi', 'hello', 'hey', 'start'))
+def welcome_command(cmd):
+    return WELCOME_MESSAGE
+
+@chat_router.command('add', prefix='add product:',
+                     pattern=r'\s*(?P<name>[^,]+),\s*(?P<price>\d+\.?\d*),\s*(?P<stock>\d+),\s*(?P<category>[^,]+)')
+def add_product_command(cmd):
     try:
-        # Convert message to lowercase for easier matching
-        message = message.lower().strip()
-        
-        # Welcome message
-        if message in ['hi', 'hello', 'hey', 'start']:
-            return "Welcome to our E-commerce Chatbot! I can help you with:\n1. Searching products\n2. Adding new products\n3. Updating products\n4. Deleting products\n5. Viewing all products\n\nHow can I assist you today?"
+        if cmd.args is None:
+            return "Please use the format: Add product: [name], [price], [stock], [category]"
+        name = cmd.args['name'].strip()
+        price = float(cmd.args['price'])
+        stock = int(cmd.args['stock'])
+        category = cmd.args['category'].strip()
 
-        # Add product
-        if message.startswith('add product:'):
-            try:
-                # Extract product details using regex
-                pattern = r'add product:\s*([^,]+),\s*(\d+\.?\d*),\s*(\d+),\s*([^,]+)'
-                match = re.match(pattern, message, re.IGNORECASE)
-                if match:
-                    name, price, stock, category = match.groups()
-                    name = name.strip()
-                    price = float(price)
-                    stock = int(stock)
-                    category = category.strip()
-
-                    # Check if product already exists
-                    existing_product = Product.query.filter_by(name=name).first()
-                    if existing_product:
-                        return f"Product '{name}' already exists. Would you like to update it instead?"
-
-                    # Create new product
-                    new_product = Product(
-                        name=name,
-                        price=price,
-                        stock=stock,
-                        category=category
-                    )
-                    db.session.add(new_product)
-                    db.session.commit()
-                    return f"Successfully added product: {name} (${price}, {stock} in stock, {category})"
-                else:
-                    return "Please use the format: Add product: [name], [price], [stock], [category]"
-            except Exception as e:
-                db.session.rollback()
-                return f"Error adding product: {str(e)}"
-
-        # Update product
-        elif message.startswith('update product:'):
-            try:
-                pattern = r'update product:\s*([^,]+),\s*([^,]+),\s*([^,]+)'
-                match = re.match(pattern, message, re.IGNORECASE)
-                if match:
-                    name, field, new_value = match.groups()
-                    name = name.strip()
-                    field = field.strip().lower()
-                    new_value = new_value.strip()
-
-                    product = Product.query.filter_by(name=name).first()
-                    if not product:
-                        return f"Product '{name}' not found."
-
-                    if field == 'price':
-                        product.price = float(new_value)
-                    elif field == 'stock':
-                        product.stock = int(new_value)
-                    elif field == 'category':
-                        product.category = new_value
-                    else:
-                        return f"Invalid field: {field}. Please use: price, stock, or category"
-
-                    db.session.commit()
-                    return f"Successfully updated {field} for {name} to {new_value}"
-                else:
-                    return "Please use the format: Update product: [name], [field], [new value]"
-            except Exception as e:
-                db.session.rollback()
-                return f"Error updating product: {str(e)}"
-
-        # Delete product
-        elif message.startswith('delete product:'):
-            try:
-                name = message.replace('delete product:', '').strip()
-                product = Product.query.filter_by(name=name).first()
-                if product:
-                    db.session.delete(product)
-                    db.session.commit()
-                    return f"Successfully deleted product: {name}"
-                return f"Product '{name}' not found."
-            except Exception as e:
-                db.session.rollback()
-                return f"Error deleting product: {str(e)}"
-
-        # List all products
-        elif message in ['show all products', 'list products', 'products']:
-            products = Product.query.all()
-            if not products:
-                return "No products found in inventory."
-            response = "Here are all products:\n\n"
-            for product in products:
-                response += f"- {product.name}: ${product.price}, {product.stock} in stock, {product.category}\n"
-            return response
-
-        # Search by name
-        elif message.startswith('search'):
-            search_term = message.replace('search', '').strip()
-            products = Product.query.filter(Product.name.ilike(f'%{search_term}%')).all()
-            if not products:
-                return f"No products found matching '{search_term}'."
-            response = f"Found {len(products)} products matching '{search_term}':\n\n"
-            for product in products:
-                response += f"- {product.name}: ${product.price}, {product.stock} in stock, {product.category}\n"
-            return response
-
-        # Filter by category
-        elif message.startswith('category'):
-            category = message.replace('category', '').strip()
-            products = Product.query.filter(Product.category.ilike(f'%{category}%')).all()
-            if not products:
-                return f"No products found in category '{category}'."
-            response = f"Products in category '{category}':\n\n"
-            for product in products:
-                response += f"- {product.name}: ${product.price}, {product.stock} in stock\n"
-            return response
-
-        # Default response
-        return "I can help you with:\n1. Searching products\n2. Adding new products\n3. Updating products\n4. Deleting products\n5. Viewing all products\n\nPlease let me know what you'd like to do!"
+        # Check if product already exists, matching names the way update and delete do
+        if Product.query.filter(db.func.lower(Product.name) == name.lower()).first():
+            return f"Product '{name}' already exists. Would you like to update it instead?"
 
+        # Create new product
+        new_product = Product(
+            name=name,
+            price=price,
+            stock=stock,
+            category=category
+        )
+        db.session.add(new_product)
+        db.session.commit()
+        return f"Successfully added product: {name} (${price}, {stock} in stock, {category})"
+    except Exception as e:
+        db.session.rollback()
+        return f"Error adding product: {str(e)}"
+
+@chat_router.command('update', prefix='update product:',
+                     pattern=r'\s*(?P<name>[^,]+),\s*(?P<field>[^,]+),\s*(?P<value>[^,]+)')
+def update_product_command(cmd):
+    try:
+        if cmd.args is None:
+            return "Please use the format: Update product: [name], [field], [new value]"
+        name = cmd.args['name'].strip()
+        field = cmd.args['field'].strip().lower()
+        new_value = cmd.args['value'].strip()
+
+        product = Product.query.filter(db.func.lower(Product.name) == name.lower()).first()
+        if not product:
+            return f"Product '{name}' not found."
+
+        if field == 'price':
+            product.price = float(new_value)
+        elif field == 'stock':
+            product.stock = int(new_value)
+        elif field == 'category':
+            product.category = new_value
+        else:
+            return f"Invalid field: {field}. Please use: price, stock, or category"
+
+        db.session.commit()
+        return f"Successfully updated {field} for {name} to {new_value}"
+    except Exception as e:
+        db.session.rollback()
+        return f"Error updating product: {str(e)}"
+
+@chat_router.command('delete', prefix='delete product:')
+def delete_product_command(cmd):
+    try:
+        name = cmd.rest.strip()
+        product = Product.query.filter(db.func.lower(Product.name) == name.lower()).first()
+        if product:
+            db.session.delete(product)
+            db.session.commit()
+            return f"Successfully deleted product: {name}"
+        return f"Product '{name}' not found."
+    except Exception as e:
+        db.session.rollback()
+        return f"Error deleting product: {str(e)}"
+
+@chat_router.command('list', exact=('show all products', 'list products', 'products'), cached=True)
+def list_products_command(cmd):
+    return renderer.reply("Here are all products:\n\n", catalog.iter_all(batch=renderer.chunk_rows),
+                          product_line, catalog.count, empty="No products found in inventory.")
+
+@chat_router.command('search', prefix='search', cached=True)
+def search_command(cmd):
+    search_term = cmd.rest.strip()
+    # The best full-text matches come first.  FTS only matches whole words by
+    # prefix, so every other product whose name contains the term follows
+    # ("phone" still finds "iPhone"); the renderer caps the reply and says so.
+    products = product_search.search(search_term)
+    ranked = {product['id'] for product in products}
+    products += [product for product in catalog.search_name(search_term) if product['id'] not in ranked]
+    if not products:
+        products = catalog.fuzzy_search(search_term, limit=5)
+        if not products:
+            return f"No products found matching '{search_term}'."
+        return renderer.reply(f"No exact matches for '{search_term}'. Did you mean:\n\n",
+                              products, product_line)
+    return renderer.reply(f"Found {len(products)} products matching '{search_term}':\n\n",
+                          products, product_line)
+
+@chat_router.command('category', prefix='category', cached=True)
+def category_command(cmd):
+    category = cmd.rest.strip()
+    return renderer.reply(f"Products in category '{category}':\n\n", catalog.category_contains(category),
+                          category_line, empty=f"No products found in category '{category}'.")
+
+@chat_router.fallback
+def default_command(message):
+    return HELP_MESSAGE
+
+def handle_product_query(message):
+    try:
+        return chat_router.dispatch(message)
     except Exception as e:
         return f"An error occurred: {str(e)}"
 
+@app.before_request
+def sync_product_changes():
+    # Catch up on products changed by other worker processes
+    product_changes.poll()
+
+@app.before_request
+def expire_reservations():
+    # Return the stock of expired holds without waiting for the next reservation
+    stock.sweep()
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
-def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create products table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            price REAL NOT NULL,
-            category TEXT,
-            stock INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-
-def get_db_connection():
-    conn = sqlite3.connect('database.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
 @app.route('/api/register', methods=['POST'])
 def register():
     try:
@@ -272,26 +374,32 @@ def register():
         if not all([username, password, email]):
             return jsonify({'error': 'All fields are required'}), 400
         
-        # Check if username or email already exists
-        if User.query.filter_by(username=username).first():
+        # Check if username or email already exists, in one query
+        taken = db.session.query(User.username).filter(
+            db.or_(User.username == username, User.email == email)).limit(2).all()
+        if any(row.username == username for row in taken):
             return jsonify({'error': 'Username already exists'}), 400
-        if User.query.filter_by(email=email).first():
+        if taken:
             return jsonify({'error': 'Email already exists'}), 400
         
-        # Hash the password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        # Don't hold a pooled connection while waiting on the hasher
+        db.session.close()
+        hashed_password = passwords.hash(password)
         
         # Create new user
         new_user = User(
             username=username,
             email=email,
-            password=hashed_password.decode('utf-8')
+            password=hashed_password
         )
         
         db.session.add(new_user)
         db.session.commit()
         
         return jsonify({'message': 'Registration successful'}), 201
+    except HasherBusy as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -307,26 +415,65 @@ def login():
             return jsonify({'error': 'Username and password are required'}), 400
         
         user = User.query.filter_by(username=username).first()
+        # Release the pooled connection while waiting on the hasher; the
+        # detached user keeps its loaded attributes
+        db.session.close()
+        ok, new_hash = passwords.verify(password, user.password) if user else (False, None)
         
-        if user and bcrypt.checkpw(password.encode('utf-8'), user.password.encode('utf-8')):
+        if ok:
+            if new_hash:
+                user.password = new_hash
+                db.session.add(user)
+                db.session.commit()
+            user_info = {
+                'id': user.id,
+                'username': user.username,
+                'email': user.email
+            }
+            if tokens is not None:
+                return jsonify({'message': 'Login successful', 'user': user_info,
+                                **tokens.issue(user)})
             login_user(user)
             session['user_id'] = user.id
             return jsonify({
                 'message': 'Login successful',
-                'user': {
-                    'id': user.id,
-                    'username': user.username,
-                    'email': user.email
-                }
+                'user': user_info
             })
         
         return jsonify({'error': 'Invalid credentials'}), 401
+    except HasherBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/token/refresh', methods=['POST'])
+def refresh_token():
+    if tokens is None:
+        return jsonify({'error': 'Token authentication is not enabled'}), 404
+
+    data = request.get_json(silent=True) or {}
+    if not data.get('refresh_token'):
+        return jsonify({'error': 'refresh_token is required'}), 400
+    try:
+        return jsonify(tokens.refresh(data['refresh_token']))
+    except TokenError as e:
+        return jsonify({'error': str(e)}), 401
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/logout', methods=['POST'])
 def logout():
     try:
+        if tokens is not None:
+            # Revoke whichever of the caller's tokens were presented
+            data = request.get_json(silent=True) or {}
+            for token, kind in ((bearer_token(request), 'access'), (data.get('refresh_token'), 'refresh')):
+                if token:
+                    try:
+                        tokens.revoke(tokens.verify(token, kind=kind))
+                    except TokenError:
+                        pass
         logout_user()
         session.pop('user_id', None)
         return jsonify({'message': 'Logged out successfully'})
@@ -349,14 +496,20 @@ def check_auth():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def chat_message():
+    """The ``message`` of a chat request body, stripped; empty when the body
+    is missing, not JSON or has no string ``message``."""
+    data = request.get_json(silent=True)
+    message = data.get('message') if isinstance(data, dict) else None
+    return message.strip() if isinstance(message, str) else ''
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     try:
         if not current_user.is_authenticated:
             return jsonify({'error': 'Authentication required'}), 401
 
-        data = request.get_json()
-        message = data.get('message', '').strip()
+        message = chat_message()
         
         if not message:
             return jsonify({'error': 'Message is required'}), 400
@@ -366,10 +519,92 @@ def chat():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Server-Sent Events variant of /api/chat: the reply is sent chunk by
+    chunk as it is produced, header line first."""
+    if not current_user.is_authenticated:
+        return jsonify({'error': 'Authentication required'}), 401
+
+    message = chat_message()
+    if not message:
+        return jsonify({'error': 'Message is required'}), 400
+
+    try:
+        return sse_response(chat_router.stream(message))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+PRODUCT_FIELDS = ('id', 'name', 'price', 'category', 'stock', 'created_at', 'updated_at')
+
+def parse_page_args(args=None):
+    """Read the keyset pagination (``after``, ``limit``) and projection
+    (``fields``) query parameters from ``args`` (default: the request's).
+    Raises ValueError on bad input."""
+    args = request.args if args is None else args
+    after = args.get('after')
+    after = int(after) if after else None
+    limit = int(args.get('limit', app.config['PRODUCTS_PAGE_SIZE']))
+    if not 1 <= limit <= app.config['PRODUCTS_MAX_PAGE_SIZE']:
+        raise ValueError(f"limit must be between 1 and {app.config['PRODUCTS_MAX_PAGE_SIZE']}")
+    fields = args.get('fields')
+    if fields:
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in PRODUCT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return after, limit, fields or None
+
+def page_body(rows, limit, fields):
+    """Build a page from up to ``limit + 1`` rows; the extra row only tells
+    us whether there is a next page."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]['id']
+    if fields:
+        rows = [{field: row[field] for field in fields} for row in rows]
+    return {'products': rows, 'next_cursor': next_cursor}
+
+def product_page(rows, limit, fields):
+    return jsonify(page_body(rows, limit, fields))
+
+def wants_ndjson():
+    """True when the client asked for a streamed export (``?stream=1`` or
+    ``Accept: application/x-ndjson``)."""
+    if request.args.get('stream') == '1':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+def stream_products(after, fields):
+    """Stream every product after ``after`` as NDJSON, one row per line.
+
+    Rows are read straight from the database in ``yield_per`` batches so the
+    export runs in constant memory regardless of catalog size."""
+    query = Product.query
+    if after is not None:
+        query = query.filter(Product.id > after)
+    query = query.order_by(Product.id).yield_per(1000)
+
+    def generate():
+        for product in query:
+            row = product.to_dict()
+            if fields:
+                row = {field: row[field] for field in fields}
+            yield json.dumps(row) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    products = Product.query.all()
-    return jsonify({'products': [product.to_dict() for product in products]})
+    try:
+        after, limit, fields = parse_page_args()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid pagination parameters: {str(e)}'}), 400
+    if wants_ndjson():
+        return stream_products(after, fields)
+    return product_page(catalog.all(after, limit + 1), limit, fields)
 
 @app.route('/api/products/search', methods=['GET'])
 def search_products():
@@ -378,9 +613,23 @@ def search_products():
         return jsonify({'error': 'Product name is required'}), 400
     
     try:
-        # Use case-insensitive search with partial matching
-        products = Product.query.filter(Product.name.ilike(f'%{name}%')).all()
-        return jsonify({'products': [product.to_dict() for product in products]})
+        after, limit, fields = parse_page_args()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid pagination parameters: {str(e)}'}), 400
+    ranked = request.args.get('fuzzy') == '1' or request.args.get('sort', 'relevance') != 'id'
+    if ranked and after is not None:
+        # Ranked results are the best `limit` matches, not pages of an ordered list
+        return jsonify({'error': 'after is only supported with sort=id'}), 400
+
+    try:
+        if request.args.get('fuzzy') == '1':
+            # Typo-tolerant match, most similar first
+            return product_page(catalog.fuzzy_search(name, limit), limit, fields)
+        if request.args.get('sort', 'relevance') == 'id':
+            # Case-insensitive substring match, paged by id
+            return product_page(catalog.search_name(name, after, limit + 1), limit, fields)
+        # Full-text prefix match, best matches first
+        return product_page(product_search.search(name, limit), limit, fields)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -396,8 +645,7 @@ def add_product():
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
         # Check if product already exists
-        existing_product = Product.query.filter_by(name=data['name']).first()
-        if existing_product:
+        if catalog.get_by_name(data['name']):
             return jsonify({'error': 'Product with this name already exists'}), 400
         
         # Create new product
@@ -417,43 +665,110 @@ def add_product():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/products/bulk', methods=['POST'])
+def bulk_add_products():
+    """Import many products at once. Accepts a JSON array (or
+    ``{"products": [...]}``), or a streamed ``text/csv`` /
+    ``application/x-ndjson`` body. Bad rows are reported, not fatal."""
+    try:
+        if request.is_json:
+            data = request.get_json()
+            products = data.get('products') if isinstance(data, dict) else data
+            if not isinstance(products, list):
+                return jsonify({'error': 'Expected a list of products'}), 400
+            rows = enumerate(products, start=1)
+        else:
+            fmt = detect_format(None, request.mimetype)
+            stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+            rows = READERS[fmt](stream)
+
+        result = import_products(db, Product, rows)
+        return jsonify(result.to_dict())
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/products/category/<category>', methods=['GET'])
 def get_products_by_category(category):
     try:
-        products = Product.query.filter_by(category=category).all()
-        return jsonify({'products': [product.to_dict() for product in products]})
+        after, limit, fields = parse_page_args()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid pagination parameters: {str(e)}'}), 400
+
+    try:
+        return product_page(catalog.by_category(category, after, limit + 1), limit, fields)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/products/reduce-stock/<name>', methods=['PUT'])
 def reduce_stock(name):
+    data = request.json
+    if not data or 'amount' not in data:
+        return jsonify({'error': 'Amount is required'}), 400
+
     try:
-        product = Product.query.filter_by(name=name).first()
-        if not product:
-            return jsonify({'error': 'Product not found'}), 404
-        
-        data = request.json
-        if not data or 'amount' not in data:
-            return jsonify({'error': 'Amount is required'}), 400
-        
         amount = int(data['amount'])
-        if amount <= 0:
-            return jsonify({'error': 'Amount must be positive'}), 400
-        
-        if product.stock < amount:
-            return jsonify({'error': 'Not enough stock available'}), 400
-        
-        product.stock -= amount
-        db.session.commit()
-        
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid amount format'}), 400
+    if amount <= 0:
+        return jsonify({'error': 'Amount must be positive'}), 400
+
+    try:
+        remaining = stock.take({name: amount})
         return jsonify({
             'message': f'Stock reduced by {amount}',
-            'stock': product.stock
+            'stock': remaining[name]
         })
-    except ValueError:
-        return jsonify({'error': 'Invalid amount format'}), 400
+    except UnknownProduct:
+        return jsonify({'error': 'Product not found'}), 404
+    except InsufficientStock:
+        return jsonify({'error': 'Not enough stock available'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reservations', methods=['POST'])
+def create_reservation():
+    data = request.json
+    if not data or 'items' not in data:
+        return jsonify({'error': 'Items are required'}), 400
+
+    try:
+        ttl = data.get('ttl')
+        reservation = stock.reserve(data['items'], ttl=int(ttl) if ttl is not None else None)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except UnknownProduct as e:
+        return jsonify({'error': str(e)}), 404
+    except InsufficientStock as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    reservation['expires_at'] = reservation['expires_at'].isoformat()
+    return jsonify(reservation), 201
+
+@app.route('/api/reservations/<reservation_id>/commit', methods=['POST'])
+def commit_reservation(reservation_id):
+    try:
+        items = stock.commit(reservation_id)
+        return jsonify({'id': reservation_id, 'status': 'committed', 'items': items})
+    except ReservationNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except ReservationError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reservations/<reservation_id>/release', methods=['POST'])
+def release_reservation(reservation_id):
+    try:
+        items = stock.release(reservation_id)
+        return jsonify({'id': reservation_id, 'status': 'released', 'items': items})
+    except ReservationNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except ReservationError as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
-        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/products/update/<name>', methods=['PUT'])
@@ -506,44 +821,96 @@ def delete_product(name):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def last_chat_seq(user_id):
+    return db.session.query(db.func.max(ChatMessage.seq)).filter_by(user_id=user_id).scalar() or 0
+
+def append_chat_messages(user_id, messages, last_seq):
+    db.session.add_all([
+        ChatMessage(user_id=user_id, seq=last_seq + i, content=message)
+        for i, message in enumerate(messages, start=1)
+    ])
+    return last_seq + len(messages)
+
+def load_chat_messages(user_id):
+    """Return the user's messages in order, folding in a legacy
+    ``ChatHistory`` blob the first time the history is read."""
+    rows = ChatMessage.query.filter_by(user_id=user_id).order_by(ChatMessage.seq).all()
+    if rows:
+        return [row.content for row in rows]
+    legacy = ChatHistory.query.filter_by(user_id=user_id).order_by(ChatHistory.updated_at.desc()).first()
+    if not legacy or not legacy.messages:
+        return []
+    append_chat_messages(user_id, legacy.messages, 0)
+    ChatHistory.query.filter_by(user_id=user_id).delete()
+    db.session.commit()
+    return legacy.messages
+
 @app.route('/api/chat/history', methods=['GET', 'POST'])
 @login_required
 def chat_history():
     try:
         if request.method == 'GET':
-            # Get the latest chat history for the user
-            history = ChatHistory.query.filter_by(user_id=current_user.id).order_by(ChatHistory.updated_at.desc()).first()
-            if history:
-                return jsonify({'history': history.messages})
-            return jsonify({'history': []})
+            messages = load_chat_messages(current_user.id)
+            return jsonify({'history': messages, 'seq': len(messages)})
 
         elif request.method == 'POST':
+            # Full-history save: only the messages past what is already
+            # stored are written. A shorter history means the client started
+            # over, so the stored one is replaced.
             data = request.get_json()
             messages = data.get('messages', [])
 
-            # Update or create chat history
-            history = ChatHistory.query.filter_by(user_id=current_user.id).order_by(ChatHistory.updated_at.desc()).first()
-            if history:
-                history.messages = messages
-                history.updated_at = datetime.datetime.utcnow()
-            else:
-                history = ChatHistory(
-                    user_id=current_user.id,
-                    messages=messages
-                )
-                db.session.add(history)
+            last_seq = last_chat_seq(current_user.id)
+            if len(messages) < last_seq:
+                ChatMessage.query.filter_by(user_id=current_user.id).delete()
+                last_seq = 0
+            seq = append_chat_messages(current_user.id, messages[last_seq:], last_seq)
 
             db.session.commit()
-            return jsonify({'message': 'Chat history saved successfully'})
+            return jsonify({'message': 'Chat history saved successfully', 'seq': seq})
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chat/history/append', methods=['POST'])
+@login_required
+def append_chat_history():
+    """Append the messages that follow sequence number ``since``.
 
+    Messages the server already has (``since`` behind the stored sequence)
+    are skipped, so retries are safe. A ``since`` ahead of the stored
+    sequence means the client missed a save and gets a 409 with the current
+    ``seq`` to resend from."""
+    try:
+        data = request.get_json() or {}
+        messages = data.get('messages', [])
+        try:
+            since = int(data.get('since', 0))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'since must be an integer'}), 400
+        if since < 0 or not isinstance(messages, list):
+            return jsonify({'error': 'Expected a non-negative since and a list of messages'}), 400
+
+        last_seq = last_chat_seq(current_user.id)
+        if since > last_seq:
+            return jsonify({'error': 'Sequence gap', 'seq': last_seq}), 409
+        seq = append_chat_messages(current_user.id, messages[last_seq - since:], last_seq)
+        db.session.commit()
+        return jsonify({'seq': seq})
+    except IntegrityError:
+        # A concurrent save claimed the same sequence numbers
+        db.session.rollback()
+        return jsonify({'error': 'Sequence conflict', 'seq': last_chat_seq(current_user.id)}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-# Initialize database
+# Initialize database: create a new one or apply pending migrations
 with app.app_context():
-    db.create_all()
+    migrations.prepare(db)
+    product_search.init_app(db)
+    product_changes.init_app(db)
 
 if __name__ == '__main__':
-    init_db()
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,85 @@
+"""Settings and database instrumentation shared by ``app.py`` and ``backend/app.py``.
+
+``load_config(app, database_url)`` fills in the configuration both apps read,
+each from the environment variable of the same name, and runs before
+``SQLAlchemy(app)``.  Settings only one app uses stay in that app.
+``init_app(app, db)`` then applies the SQLite settings and installs
+``metrics`` and ``query_profiler`` as configured, returning both (None when
+disabled).
+"""
+import os
+
+from metrics import Metrics
+from query_profiler import QueryProfiler
+from sqlite_pragmas import configure_sqlite
+from token_auth import persistent_secret
+
+
+def load_config(app, database_url):
+    """``database_url`` is the default for ``DATABASE_URL``."""
+    config = app.config
+    # Signs session cookies and, by default, bearer tokens, so it must never be
+    # a published value: without SECRET_KEY one is generated once and kept in
+    # the instance folder, shared by every worker and restart
+    config['SECRET_KEY'] = os.getenv('SECRET_KEY') or persistent_secret(os.path.join(app.instance_path, 'secret_key'))
+
+    config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', database_url)
+    config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # SQLite settings applied to every connection (see sqlite_pragmas.py); SQLite's
+    # own defaults are delete, full, 5000, 2000 and 0
+    config['SQLITE_JOURNAL_MODE'] = os.getenv('SQLITE_JOURNAL_MODE', 'wal')
+    config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'normal')
+    config['SQLITE_BUSY_TIMEOUT'] = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))  # ms
+    config['SQLITE_CACHE_SIZE'] = int(os.getenv('SQLITE_CACHE_SIZE', '16384'))  # KiB per connection
+    config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))  # bytes
+
+    # Request latency, SQL and chat command metrics served at /metrics (set to 1 to
+    # enable); with METRICS_TOKEN set, scrapers must send it as a bearer token
+    config['METRICS'] = os.getenv('METRICS', '0') == '1'
+    config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN') or None
+    # Development and CI: log repeated SQL statements within a request and those
+    # slower than QUERY_SLOW_MS (see query_profiler.py)
+    config['QUERY_PROFILER'] = os.getenv('QUERY_PROFILER', '0') == '1'
+    config['QUERY_SLOW_MS'] = float(os.getenv('QUERY_SLOW_MS', '100'))
+    # Seconds between checks for product changes committed by other processes
+    config['CATALOG_SYNC_INTERVAL'] = float(os.getenv('CATALOG_SYNC_INTERVAL', '1'))
+
+    # Threads dedicated to password hashing (0 hashes inline on the request thread)
+    # and how many logins may wait for one before new ones get a 503
+    config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+    config['PASSWORD_HASH_QUEUE'] = int(os.getenv('PASSWORD_HASH_QUEUE', '32'))
+    # Users kept in the per-process session user cache, and seconds each entry stays valid
+    config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', '1024'))
+    config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', '300'))
+    # Most products listed in one chat reply; longer lists end with "showing N of M"
+    config['CHAT_MAX_ROWS'] = int(os.getenv('CHAT_MAX_ROWS', '200'))
+    # Cached responses for read-only chat commands (0 disables the cache)
+    config['CHAT_RESPONSE_CACHE_SIZE'] = int(os.getenv('CHAT_RESPONSE_CACHE_SIZE', '1024'))
+
+    # 'session' keeps cookie sessions; 'jwt' makes /api/login return stateless
+    # bearer tokens so any worker can authenticate without shared state
+    config['AUTH_MODE'] = os.getenv('AUTH_MODE', 'session')
+    config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', config['SECRET_KEY'])
+    config['ACCESS_TOKEN_TTL'] = int(os.getenv('ACCESS_TOKEN_TTL', '900'))  # seconds
+    config['REFRESH_TOKEN_TTL'] = int(os.getenv('REFRESH_TOKEN_TTL', str(14 * 24 * 3600)))
+    # How often each worker picks up tokens revoked by the others
+    config['TOKEN_REVOCATION_SYNC'] = float(os.getenv('TOKEN_REVOCATION_SYNC', '5'))
+
+
+def init_app(app, db):
+    """Return ``(metrics, query_profiler)``."""
+    with app.app_context():
+        configure_sqlite(db.engine,
+                         journal_mode=app.config['SQLITE_JOURNAL_MODE'],
+                         synchronous=app.config['SQLITE_SYNCHRONOUS'],
+                         busy_timeout=app.config['SQLITE_BUSY_TIMEOUT'],
+                         cache_size=app.config['SQLITE_CACHE_SIZE'],
+                         mmap_size=app.config['SQLITE_MMAP_SIZE'])
+        # Registered before the other request hooks so that their queries are counted
+        metrics = Metrics() if app.config['METRICS'] else None
+        if metrics is not None:
+            metrics.init_app(app, db, token=app.config['METRICS_TOKEN'])
+        query_profiler = QueryProfiler(slow_ms=app.config['QUERY_SLOW_MS']) if app.config['QUERY_PROFILER'] else None
+        if query_profiler is not None:
+            query_profiler.init_app(app, db)
+    return metrics, query_profiler
@@ -0,0 +1,647 @@
+"""ASGI entry point serving the main API routes with async database I/O.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+The Flask app in ``app.py`` ties up a worker thread per in-flight request for
+the whole time it waits on SQLite or a password hash.  This module serves the
+same routes (auth, ``/api/chat``, ``/api/chat/history`` and ``/api/products``)
+from one event loop instead:
+
+* Database reads and writes go through SQLAlchemy's ``AsyncSession`` over
+  aiosqlite.  The session class carries the catalog index, user cache and
+  chat response cache listeners, so writes made here keep the caches of this
+  process current just as Flask writes do.
+* CPU-bound work runs on worker threads, inside a Flask app context: password
+  hashing (still capped by the ``PasswordHasher`` pool), chat commands (which
+  render from the in-memory catalog), catalog loads, token revocation checks,
+  stock decrements and bulk imports, which reuse the sync code in ``app.py``.
+
+Product reads are answered from the catalog index on the event loop once it
+is loaded; it is loaded at startup.  Logins use a signed cookie session, or
+bearer tokens when ``AUTH_MODE=jwt``, as in ``app.py``.  Models, settings and
+schema setup are shared with ``app.py``, which is imported for them.
+"""
+import asyncio
+import contextlib
+import functools
+import io
+import json
+import os
+import time
+
+import anyio
+import anyio.to_thread
+from sqlalchemy import delete, func, make_url, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from app import (ChatHistory, ChatMessage, Product, SessionUser, User,
+                 app as flask_app, catalog, chat_responses, db, handle_product_query, metrics, page_body,
+                 parse_page_args, passwords, product_changes, product_search, stock, tokens, users)
+from metrics import CONTENT_TYPE
+from password_hasher import HasherBusy
+from product_import import READERS, detect_format, import_products
+from sqlite_pragmas import configure_sqlite
+from stock_reservations import InsufficientStock, UnknownProduct
+from token_auth import TokenError, bearer_token
+
+# Async driver URL; defaults to the Flask app's database through aiosqlite
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL')
+# Worker threads for CPU-bound and sync work (hashing, chat commands, imports)
+ASGI_WORKER_THREADS = int(os.getenv('ASGI_WORKER_THREADS', '40'))
+
+
+def async_url(url):
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        return url.set(drivername='sqlite+aiosqlite')
+    return url
+
+
+class CacheSession(Session):
+    """Sync session behind each ``AsyncSession``; the process-local caches
+    listen to it as they listen to ``db.session``."""
+
+
+catalog.listen(CacheSession)
+users.listen(CacheSession)
+if chat_responses is not None:
+    chat_responses.listen(CacheSession)
+
+with flask_app.app_context():
+    engine = create_async_engine(ASYNC_DATABASE_URL or async_url(db.engine.url),
+                                 **flask_app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+configure_sqlite(engine.sync_engine,
+                 journal_mode=flask_app.config['SQLITE_JOURNAL_MODE'],
+                 synchronous=flask_app.config['SQLITE_SYNCHRONOUS'],
+                 busy_timeout=flask_app.config['SQLITE_BUSY_TIMEOUT'],
+                 cache_size=flask_app.config['SQLITE_CACHE_SIZE'],
+                 mmap_size=flask_app.config['SQLITE_MMAP_SIZE'])
+if metrics is not None:
+    metrics.watch_engine(engine.sync_engine)
+AsyncSession = async_sessionmaker(engine, sync_session_class=CacheSession, expire_on_commit=False)
+worker_threads = anyio.CapacityLimiter(ASGI_WORKER_THREADS)
+# SQLite admits one writer at a time and leaves the rest retrying in its busy
+# handler with growing sleeps; queueing this process's writers here instead
+# hands the write lock straight to the next one
+write_lock = asyncio.Lock()
+
+
+async def run_sync(fn, *args):
+    """Run blocking app code on a worker thread inside a Flask app context."""
+    def call():
+        with flask_app.app_context():
+            return fn(*args)
+    return await anyio.to_thread.run_sync(call, limiter=worker_threads)
+
+
+async def catalog_read(fn, *args):
+    """Catalog reads are plain dict lookups once the index is loaded; a cold,
+    invalidated or disabled index queries through the sync session instead,
+    so that case runs on a worker thread."""
+    if catalog.loaded:
+        return fn(*args)
+    return await run_sync(fn, *args)
+
+
+def error(message, status, headers=None):
+    return JSONResponse({'error': message}, status, headers=headers)
+
+
+def user_info(user):
+    return {'id': user.id, 'username': user.username, 'email': user.email}
+
+
+async def json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def chat_message(request):
+    """Same as ``app.chat_message``: the stripped ``message`` of the body, or
+    empty when the body is missing, not JSON or has no string ``message``."""
+    data = await json_body(request)
+    message = data.get('message') if isinstance(data, dict) else None
+    return message.strip() if isinstance(message, str) else ''
+
+
+async def current_user(request, session):
+    token = bearer_token(request)
+    if tokens is not None and token is not None:
+        try:
+            return SessionUser(tokens.user(await run_sync(tokens.verify, token)))
+        except TokenError:
+            return None
+    user_id = request.session.get('user_id')
+    if user_id is None:
+        return None
+    record = users.cached(user_id)
+    if record is None:
+        user = await session.get(User, user_id)
+        record = users.add(user) if user is not None else None
+    return record
+
+
+def login_required(view):
+    @functools.wraps(view)
+    async def wrapper(request):
+        async with AsyncSession() as session:
+            user = await current_user(request, session)
+            if user is None:
+                return error('Authentication required', 401)
+            # Hand back the connection the lookup used; the view takes one
+            # again when it first queries
+            await session.close()
+            return await view(request, session, user)
+    return wrapper
+
+
+# -- auth ------------------------------------------------------------------
+
+async def register(request):
+    data = await json_body(request) or {}
+    username, password, email = data.get('username'), data.get('password'), data.get('email')
+    if not all([username, password, email]):
+        return error('All fields are required', 400)
+
+    try:
+        async with AsyncSession() as session:
+            taken = (await session.execute(select(User.username).where(
+                or_(User.username == username, User.email == email)).limit(2))).all()
+        if any(row.username == username for row in taken):
+            return error('Username already exists', 400)
+        if taken:
+            return error('Email already exists', 400)
+        # Don't hold a pooled connection while waiting on the hasher
+        hashed_password = await run_sync(passwords.hash, password)
+        async with write_lock, AsyncSession() as session:
+            session.add(User(username=username, email=email, password=hashed_password))
+            await session.commit()
+        return JSONResponse({'message': 'Registration successful'}, 201)
+    except HasherBusy as e:
+        return error(str(e), 503, {'Retry-After': '1'})
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def login(request):
+    data = await json_body(request) or {}
+    username, password = data.get('username'), data.get('password')
+    if not username or not password:
+        return error('Username and password are required', 400)
+
+    try:
+        async with AsyncSession() as session:
+            user = await session.scalar(select(User).filter_by(username=username))
+        # The connection is released while waiting on the hasher; the
+        # detached user keeps its loaded attributes
+        ok, new_hash = await run_sync(passwords.verify, password, user.password) if user else (False, None)
+        if not ok:
+            return error('Invalid credentials', 401)
+        if new_hash:
+            async with write_lock, AsyncSession() as session:
+                user.password = new_hash
+                session.add(user)
+                await session.commit()
+        if tokens is not None:
+            return JSONResponse({'message': 'Login successful', 'user': user_info(user), **tokens.issue(user)})
+        request.session['user_id'] = user.id
+        return JSONResponse({'message': 'Login successful', 'user': user_info(user)})
+    except HasherBusy as e:
+        return error(str(e), 503, {'Retry-After': '1'})
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def refresh_token(request):
+    if tokens is None:
+        return error('Token authentication is not enabled', 404)
+    data = await json_body(request) or {}
+    if not data.get('refresh_token'):
+        return error('refresh_token is required', 400)
+    try:
+        return JSONResponse(await run_sync(tokens.refresh, data['refresh_token']))
+    except TokenError as e:
+        return error(str(e), 401)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+def revoke_presented(token_kinds):
+    for token, kind in token_kinds:
+        if token:
+            try:
+                tokens.revoke(tokens.verify(token, kind=kind))
+            except TokenError:
+                pass
+
+
+async def logout(request):
+    try:
+        if tokens is not None:
+            data = await json_body(request) or {}
+            await run_sync(revoke_presented, ((bearer_token(request), 'access'),
+                                              (data.get('refresh_token'), 'refresh')))
+        request.session.pop('user_id', None)
+        return JSONResponse({'message': 'Logged out successfully'})
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def check_auth(request):
+    async with AsyncSession() as session:
+        user = await current_user(request, session)
+    if user is None:
+        return JSONResponse({'authenticated': False}, 401)
+    return JSONResponse({'authenticated': True, 'user': user_info(user)})
+
+
+# -- chat ------------------------------------------------------------------
+
+async def chat(request):
+    async with AsyncSession() as session:
+        if await current_user(request, session) is None:
+            return error('Authentication required', 401)
+    message = await chat_message(request)
+    if not message:
+        return error('Message is required', 400)
+    try:
+        return JSONResponse({'response': await run_sync(handle_product_query, message)})
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def last_chat_seq(session, user_id):
+    return await session.scalar(select(func.max(ChatMessage.seq)).filter_by(user_id=user_id)) or 0
+
+
+def append_chat_messages(session, user_id, messages, last_seq):
+    session.add_all([
+        ChatMessage(user_id=user_id, seq=last_seq + i, content=message)
+        for i, message in enumerate(messages, start=1)
+    ])
+    return last_seq + len(messages)
+
+
+async def load_chat_messages(session, user_id):
+    rows = await session.scalars(select(ChatMessage.content).filter_by(user_id=user_id).order_by(ChatMessage.seq))
+    messages = rows.all()
+    if messages:
+        return messages
+    legacy = await session.scalar(select(ChatHistory).filter_by(user_id=user_id)
+                                  .order_by(ChatHistory.updated_at.desc()).limit(1))
+    if not legacy or not legacy.messages:
+        return []
+    async with write_lock:
+        append_chat_messages(session, user_id, legacy.messages, 0)
+        await session.execute(delete(ChatHistory).filter_by(user_id=user_id))
+        await session.commit()
+    return legacy.messages
+
+
+@login_required
+async def chat_history(request, session, user):
+    try:
+        if request.method == 'GET':
+            messages = await load_chat_messages(session, user.id)
+            return JSONResponse({'history': messages, 'seq': len(messages)})
+
+        data = await json_body(request) or {}
+        messages = data.get('messages', [])
+        async with write_lock:
+            last_seq = await last_chat_seq(session, user.id)
+            if len(messages) < last_seq:
+                await session.execute(delete(ChatMessage).filter_by(user_id=user.id))
+                last_seq = 0
+            seq = append_chat_messages(session, user.id, messages[last_seq:], last_seq)
+            await session.commit()
+        return JSONResponse({'message': 'Chat history saved successfully', 'seq': seq})
+    except Exception as e:
+        await session.rollback()
+        return error(str(e), 500)
+
+
+@login_required
+async def append_chat_history(request, session, user):
+    data = await json_body(request) or {}
+    messages = data.get('messages', [])
+    try:
+        since = int(data.get('since', 0))
+    except (TypeError, ValueError):
+        return error('since must be an integer', 400)
+    if since < 0 or not isinstance(messages, list):
+        return error('Expected a non-negative since and a list of messages', 400)
+
+    try:
+        async with write_lock:
+            last_seq = await last_chat_seq(session, user.id)
+            if since > last_seq:
+                return JSONResponse({'error': 'Sequence gap', 'seq': last_seq}, 409)
+            seq = append_chat_messages(session, user.id, messages[last_seq - since:], last_seq)
+            await session.commit()
+        return JSONResponse({'seq': seq})
+    except IntegrityError:
+        await session.rollback()
+        return JSONResponse({'error': 'Sequence conflict', 'seq': await last_chat_seq(session, user.id)}, 409)
+    except Exception as e:
+        await session.rollback()
+        return error(str(e), 500)
+
+
+# -- products --------------------------------------------------------------
+
+def wants_ndjson(request):
+    if request.query_params.get('stream') == '1':
+        return True
+    accept = request.headers.get('accept', '')
+    return 'application/x-ndjson' in accept and 'application/json' not in accept
+
+
+def stream_products(after, fields):
+    """NDJSON export read through an async server-side cursor."""
+    async def generate():
+        query = select(Product).order_by(Product.id).execution_options(yield_per=1000)
+        if after is not None:
+            query = query.where(Product.id > after)
+        async with AsyncSession() as session:
+            async for product in await session.stream_scalars(query):
+                row = product.to_dict()
+                if fields:
+                    row = {field: row[field] for field in fields}
+                yield json.dumps(row) + '\n'
+
+    return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+
+def page_args(request):
+    try:
+        return parse_page_args(request.query_params), None
+    except ValueError as e:
+        return None, error(f'Invalid pagination parameters: {str(e)}', 400)
+
+
+async def get_products(request):
+    args, bad = page_args(request)
+    if bad:
+        return bad
+    after, limit, fields = args
+    if wants_ndjson(request):
+        return stream_products(after, fields)
+    return JSONResponse(page_body(await catalog_read(catalog.all, after, limit + 1), limit, fields))
+
+
+async def search_products(request):
+    name = request.query_params.get('name', '').strip()
+    if not name:
+        return error('Product name is required', 400)
+    args, bad = page_args(request)
+    if bad:
+        return bad
+    after, limit, fields = args
+    ranked = request.query_params.get('fuzzy') == '1' or request.query_params.get('sort', 'relevance') != 'id'
+    if ranked and after is not None:
+        return error('after is only supported with sort=id', 400)
+
+    try:
+        if request.query_params.get('fuzzy') == '1':
+            rows = await catalog_read(catalog.fuzzy_search, name, limit)
+        elif request.query_params.get('sort', 'relevance') == 'id':
+            rows = await catalog_read(catalog.search_name, name, after, limit + 1)
+        else:
+            async with AsyncSession() as session:
+                ids = await product_search.ranked_ids(session, name, limit)
+            if ids is None:
+                rows = await catalog_read(catalog.search_name, name, None, limit)
+            else:
+                rows = await catalog_read(catalog.get_many, ids)
+        return JSONResponse(page_body(rows, limit, fields))
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def get_products_by_category(request):
+    args, bad = page_args(request)
+    if bad:
+        return bad
+    after, limit, fields = args
+    category = request.path_params['category']
+    try:
+        return JSONResponse(page_body(await catalog_read(catalog.by_category, category, after, limit + 1),
+                                      limit, fields))
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def add_product(request):
+    data = await json_body(request) or {}
+    for field in ('name', 'price', 'category', 'stock'):
+        if field not in data:
+            return error(f'Missing required field: {field}', 400)
+    try:
+        product = Product(name=data['name'], price=float(data['price']),
+                          category=data['category'], stock=int(data['stock']))
+    except (TypeError, ValueError) as e:
+        return error(f'Invalid data format: {str(e)}', 400)
+
+    try:
+        async with write_lock, AsyncSession() as session:
+            if await session.scalar(select(Product.id).filter_by(name=product.name)):
+                return error('Product with this name already exists', 400)
+            session.add(product)
+            await session.commit()
+        return JSONResponse(product.to_dict(), 201)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def bulk_add_products(request):
+    """Same formats as ``app.bulk_add_products``; the body is read here and
+    the batched import runs on a worker thread."""
+    try:
+        if request.headers.get('content-type', '').startswith('application/json'):
+            data = await json_body(request)
+            products = data.get('products') if isinstance(data, dict) else data
+            if not isinstance(products, list):
+                return error('Expected a list of products', 400)
+            rows = enumerate(products, start=1)
+        else:
+            mimetype = request.headers.get('content-type', '').split(';')[0].strip()
+            fmt = detect_format(None, mimetype)
+            rows = READERS[fmt](io.StringIO((await request.body()).decode('utf-8'), newline=''))
+        result = await run_sync(import_products, db, Product, rows)
+        return JSONResponse(result.to_dict())
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def reduce_stock(request):
+    name = request.path_params['name']
+    data = await json_body(request)
+    if not data or 'amount' not in data:
+        return error('Amount is required', 400)
+    try:
+        amount = int(data['amount'])
+    except (TypeError, ValueError):
+        return error('Invalid amount format', 400)
+    if amount <= 0:
+        return error('Amount must be positive', 400)
+
+    try:
+        remaining = await run_sync(stock.take, {name: amount})
+        return JSONResponse({'message': f'Stock reduced by {amount}', 'stock': remaining[name]})
+    except UnknownProduct:
+        return error('Product not found', 404)
+    except InsufficientStock:
+        return error('Not enough stock available', 400)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def update_product(request):
+    name = request.path_params['name']
+    data = await json_body(request)
+    try:
+        async with write_lock, AsyncSession() as session:
+            product = await session.scalar(select(Product).filter_by(name=name))
+            if not product:
+                return error('Product not found', 404)
+            if not data:
+                return error('No update data provided', 400)
+
+            if 'price' in data:
+                try:
+                    product.price = float(data['price'])
+                except (TypeError, ValueError):
+                    return error('Invalid price format', 400)
+            if 'category' in data:
+                product.category = data['category']
+            if 'stock' in data:
+                try:
+                    new_stock = int(data['stock'])
+                except (TypeError, ValueError):
+                    return error('Invalid stock format', 400)
+                if new_stock < 0:
+                    return error('Stock cannot be negative', 400)
+                product.stock = new_stock
+
+            await session.commit()
+            return JSONResponse(product.to_dict())
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def delete_product(request):
+    name = request.path_params['name']
+    try:
+        async with write_lock, AsyncSession() as session:
+            product = await session.scalar(select(Product).filter_by(name=name))
+            if not product:
+                return error('Product not found', 404)
+            await session.delete(product)
+            await session.commit()
+        return JSONResponse({'message': f'Product "{name}" deleted successfully'})
+    except Exception as e:
+        return error(str(e), 500)
+
+
+class ChangeSync:
+    """Catch up on products changed by other processes and release expired
+    reservations before a request, like ``app.sync_product_changes`` and
+    ``app.expire_reservations``."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            if product_changes.due():
+                await run_sync(product_changes.poll)
+            if stock.due():
+                await run_sync(stock.sweep)
+        await self.app(scope, receive, send)
+
+
+class RequestMetrics:
+    """Record each request's latency and status in ``app.metrics``, labelled
+    by the path template of the route that handled it."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_and_record_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record_status)
+        finally:
+            # The router adds the matched endpoint to the shared scope
+            route = route_paths.get(scope.get('endpoint'), 'unmatched')
+            metrics.observe(scope['method'], route, status, time.perf_counter() - start)
+
+
+async def metrics_view(request):
+    if not metrics.authorized(request.headers.get('authorization')):
+        return Response('Unauthorized\n', 401, {'WWW-Authenticate': 'Bearer'}, media_type='text/plain')
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Load the catalog index before taking traffic, so reads never wait on it
+    if catalog.enabled:
+        await run_sync(catalog.count)
+    yield
+    await engine.dispose()
+
+
+routes = [
+    Route('/api/register', register, methods=['POST']),
+    Route('/api/login', login, methods=['POST']),
+    Route('/api/token/refresh', refresh_token, methods=['POST']),
+    Route('/api/logout', logout, methods=['POST']),
+    Route('/api/check-auth', check_auth, methods=['GET']),
+    Route('/api/chat', chat, methods=['POST']),
+    Route('/api/chat/history', chat_history, methods=['GET', 'POST']),
+    Route('/api/chat/history/append', append_chat_history, methods=['POST']),
+    Route('/api/products', get_products, methods=['GET']),
+    Route('/api/products', add_product, methods=['POST']),
+    Route('/api/products/search', search_products, methods=['GET']),
+    Route('/api/products/bulk', bulk_add_products, methods=['POST']),
+    Route('/api/products/category/{category}', get_products_by_category, methods=['GET']),
+    Route('/api/products/reduce-stock/{name}', reduce_stock, methods=['PUT']),
+    Route('/api/products/update/{name}', update_product, methods=['PUT']),
+    Route('/api/products/delete/{name}', delete_product, methods=['DELETE']),
+]
+middleware = [Middleware(ChangeSync)]
+if metrics is not None:
+    routes.append(Route('/metrics', metrics_view, methods=['GET']))
+    middleware.insert(0, Middleware(RequestMetrics))
+route_paths = {route.endpoint: route.path for route in routes}
+
+app = Starlette(
+    routes=routes,
+    middleware=middleware + [
+        Middleware(CORSMiddleware, allow_origins=['http://localhost:3000'],
+                   allow_methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
+                   allow_headers=['Content-Type', 'Authorization'], allow_credentials=True),
+        Middleware(SessionMiddleware, secret_key=flask_app.secret_key, same_site='lax',
+                   https_only=flask_app.config['SESSION_COOKIE_SECURE']),
+    ],
+    lifespan=lifespan,
+)
@@ -1,20 +1,101 @@
-from flask import Flask, request, jsonify, session
+from flask import Blueprint, Flask, current_app, request, jsonify, session
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 import os
 from datetime import datetime
 import json
-
-app = Flask(__name__)
-CORS(app, supports_credentials=True)
-
-# Configuration
-app.config['SECRET_KEY'] = os.urandom(24)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///chatbot.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db = SQLAlchemy(app)
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app_config import init_app, load_config
+from change_log import ChangeLog
+from command_router import CommandRouter
+import migrations
+from password_hasher import HasherBusy, PasswordHasher
+from product_render import ProductRenderer
+from response_cache import ResponseCache
+from sse import sse_response
+from token_auth import RevocationList, TokenAuth, TokenError, bearer_token
+from user_cache import UserCache
+from write_behind import WriteBehindQueue
+
+# Importing this module reads no configuration, touches no database and starts
+# no threads: create_app() builds the app and everything that depends on its
+# settings, once per process, and sets the globals below.  serve.py and
+# __main__ call it before serving; `flask --app backend/app.py` finds it too.
+db = SQLAlchemy()
+api = Blueprint('api', __name__)
+app = None
+metrics = query_profiler = None
+passwords = None
+users = None
+product_changes = None
+tokens = None
+renderer = None
+chat_responses = None
+message_writer = None
+_setup_lock = threading.Lock()
+
+def create_app():
+    """Configure the app from the environment, apply pending schema
+    migrations (see migrations.py) and start the background work, once per
+    process; return ``app``."""
+    global app, metrics, query_profiler, passwords, users, product_changes, tokens, renderer, \
+        chat_responses, message_writer
+    with _setup_lock:
+        if app is not None:
+            return app
+        new_app = Flask(__name__)
+        CORS(new_app, supports_credentials=True)
+
+        # Configuration
+        load_config(new_app, 'sqlite:///chatbot.db')
+        new_app.config['HISTORY_PAGE_SIZE'] = 50
+        new_app.config['HISTORY_MAX_PAGE_SIZE'] = 500
+        # Buffer chat messages and insert them in batches instead of committing every turn
+        new_app.config['MESSAGE_WRITE_BEHIND'] = os.getenv('MESSAGE_WRITE_BEHIND', '0') == '1'
+        new_app.config['MESSAGE_BATCH_SIZE'] = 200
+        new_app.config['MESSAGE_BATCH_DELAY'] = 0.05  # seconds
+        # werkzeug hash method and work factor; stored hashes made differently are rehashed on login
+        new_app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+        config = new_app.config
+
+        db.init_app(new_app)
+        metrics, query_profiler = init_app(new_app, db)
+        passwords = PasswordHasher.werkzeug(config['PASSWORD_HASH_METHOD'],
+                                            workers=config['PASSWORD_HASH_WORKERS'],
+                                            max_queue=config['PASSWORD_HASH_QUEUE'])
+        users = UserCache(User, maxsize=config['USER_CACHE_SIZE'], ttl=config['USER_CACHE_TTL'])
+        users.init_app(db)
+        product_changes = ChangeLog(Product.__tablename__, sync_interval=config['CATALOG_SYNC_INTERVAL'])
+        if config['AUTH_MODE'] == 'jwt':
+            tokens = TokenAuth(
+                config['JWT_SECRET_KEY'],
+                revocations=RevocationList(db, RevokedToken, sync_interval=config['TOKEN_REVOCATION_SYNC']),
+                access_ttl=config['ACCESS_TOKEN_TTL'],
+                refresh_ttl=config['REFRESH_TOKEN_TTL'],
+            )
+        renderer = ProductRenderer(max_rows=config['CHAT_MAX_ROWS'])
+        if config['CHAT_RESPONSE_CACHE_SIZE']:
+            chat_responses = ResponseCache(maxsize=config['CHAT_RESPONSE_CACHE_SIZE'])
+            chat_responses.watch(db, Product)
+            product_changes.subscribe(lambda ids: chat_responses.bump())
+        chat_router.cache = chat_responses
+        chat_router.metrics = metrics
+        new_app.register_blueprint(api)
+
+        with new_app.app_context():
+            migrations.prepare(db)
+            product_changes.init_app(db)
+        if config['MESSAGE_WRITE_BEHIND']:
+            message_writer = WriteBehindQueue(
+                new_app, db, Message,
+                max_batch=config['MESSAGE_BATCH_SIZE'],
+                max_delay=config['MESSAGE_BATCH_DELAY'],
+            ).start()
+        app = new_app
+    return app
 
 # Models
 class User(db.Model):
@@ -26,10 +107,15 @@ class User(db.Model):
     is_new_user = db.Column(db.Boolean, default=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Check the password, rehashing it if the work factor has changed.
+        The caller commits."""
+        ok, new_hash = passwords.verify(password, self.password_hash)
+        if new_hash:
+            self.password_hash = new_hash
+        return ok
 
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -38,6 +124,17 @@ class Message(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    # History is read per user, newest first; SQLite appends the rowid to
+    # every index, so this also covers the (timestamp, id) keyset order.
+    __table_args__ = (db.Index('ix_message_user_timestamp', 'user_id', 'timestamp'),)
+
+class RevokedToken(db.Model):
+    # Never reuse the id of a deleted row: workers sync revocations by id
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(32), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -46,15 +143,39 @@ class Product(db.Model):
     category = db.Column(db.String(50), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
-# Create tables and delete existing data
-with app.app_context():
-    db.drop_all()  # This will delete all existing data
-    db.create_all()
+    # Every chat command but add is scoped to one user; add checks the name
+    # across all users.  Name lookups are case-folded and the category command
+    # matches exactly.  migrations.py adds these to existing databases.
+    __table_args__ = (db.Index('ix_product_user_name_lower', user_id, db.func.lower(name)),
+                      db.Index('ix_product_user_category', 'user_id', 'category'),
+                      db.Index('ix_product_name_lower', db.func.lower(name)))
 
 # Helper functions
+def save_messages(user_id, *messages):
+    """Persist ``(role, content)`` pairs for a user, through the
+    write-behind queue when it is enabled."""
+    if message_writer is not None:
+        now = datetime.utcnow()
+        message_writer.put(*[
+            {'role': role, 'content': content, 'user_id': user_id, 'timestamp': now}
+            for role, content in messages
+        ])
+        return
+    for role, content in messages:
+        db.session.add(Message(content=content, role=role, user_id=user_id))
+    db.session.commit()
+
 def get_current_user():
+    """Return the logged-in user's ``UserRecord`` (id, username, email)."""
+    if tokens is not None:
+        token = bearer_token(request)
+        if token is not None:
+            try:
+                return tokens.user(tokens.verify(token))
+            except TokenError:
+                return None
     if 'user_id' in session:
-        return User.query.get(session['user_id'])
+        return users.get(session['user_id'])
     return None
 
 def get_welcome_message(username):
@@ -114,7 +235,7 @@ def update_product(message, user_id):
         field = parts[1].strip().lower()
         value = parts[2].strip()
         
-        product = Product.query.filter_by(name=name, user_id=user_id).first()
+        product = Product.query.filter(Product.user_id == user_id, db.func.lower(Product.name) == name.lower()).first()
         if not product:
             return f"❌ Product '{name}' not found"
         
@@ -135,7 +256,7 @@ def update_product(message, user_id):
 def delete_product(message, user_id):
     try:
         name = message[15:].strip()
-        product = Product.query.filter_by(name=name, user_id=user_id).first()
+        product = Product.query.filter(Product.user_id == user_id, db.func.lower(Product.name) == name.lower()).first()
         if not product:
             return f"❌ Product '{name}' not found"
         
@@ -145,45 +266,39 @@ def delete_product(message, user_id):
     except Exception as e:
         return f"❌ Error deleting product: {str(e)}\nPlease use the correct format: delete product: name"
 
+def product_details(product):
+    return (f"📦 {product.name}\n💰 Price: ${product.price:.2f}\n📊 Stock: {product.stock}\n"
+            f"🏷️ Category: {product.category}\n-------------------\n")
+
+def product_details_no_category(product):
+    return f"📦 {product.name}\n💰 Price: ${product.price:.2f}\n📊 Stock: {product.stock}\n-------------------\n"
+
+def product_line(product):
+    return f"• {product.name} - ${product.price:.2f} ({product.stock} in stock) - {product.category}\n"
+
+def product_line_no_category(product):
+    return f"• {product.name} - ${product.price:.2f} ({product.stock} in stock)\n"
+
 def search_products(message, user_id):
     try:
         query = message[7:].strip()
         if not query:
             return "❌ Please provide a search query\nExample: search laptop"
             
-        products = Product.query.filter(
+        rows, count = renderer.query_rows(Product.query.filter(
             Product.name.ilike(f'%{query}%'),
             Product.user_id == user_id
-        ).all()
-        
-        if not products:
-            return f"❌ No products found matching '{query}'"
-        
-        result = "🔍 Search Results:\n\n"
-        for product in products:
-            result += f"📦 {product.name}\n"
-            result += f"💰 Price: ${product.price:.2f}\n"
-            result += f"📊 Stock: {product.stock}\n"
-            result += f"🏷️ Category: {product.category}\n"
-            result += "-------------------\n"
-        return result
+        ))
+        return renderer.render("🔍 Search Results:\n\n", rows, product_details, count,
+                               empty=f"❌ No products found matching '{query}'")
     except Exception as e:
         return f"❌ Error searching products: {str(e)}\nPlease use the correct format: search query"
 
 def show_all_products(user_id):
     try:
-        products = Product.query.filter_by(user_id=user_id).all()
-        if not products:
-            return "📦 No products found. Add some products to get started!"
-        
-        result = "📦 All Products:\n\n"
-        for product in products:
-            result += f"📦 {product.name}\n"
-            result += f"💰 Price: ${product.price:.2f}\n"
-            result += f"📊 Stock: {product.stock}\n"
-            result += f"🏷️ Category: {product.category}\n"
-            result += "-------------------\n"
-        return result
+        rows, count = renderer.query_rows(Product.query.filter_by(user_id=user_id))
+        return renderer.render("📦 All Products:\n\n", rows, product_details, count,
+                               empty="📦 No products found. Add some products to get started!")
     except Exception as e:
         return f"❌ Error listing products: {str(e)}"
 
@@ -193,33 +308,13 @@ def show_products_by_category(message, user_id):
         if not category:
             return "❌ Please provide a category\nExample: category electronics"
             
-        products = Product.query.filter_by(category=category, user_id=user_id).all()
-        
-        if not products:
-            return f"❌ No products found in category '{category}'"
-        
-        result = f"🏷️ Products in {category}:\n\n"
-        for product in products:
-            result += f"📦 {product.name}\n"
-            result += f"💰 Price: ${product.price:.2f}\n"
-            result += f"📊 Stock: {product.stock}\n"
-            result += "-------------------\n"
-        return result
+        rows, count = renderer.query_rows(Product.query.filter_by(category=category, user_id=user_id))
+        return renderer.render(f"🏷️ Products in {category}:\n\n", rows, product_details_no_category, count,
+                               empty=f"❌ No products found in category '{category}'")
     except Exception as e:
         return f"❌ Error listing category products: {str(e)}\nPlease use the correct format: category name"
 
-def process_command(message, user_id):
-    """Process user commands and return appropriate response"""
-    message = message.lower().strip()
-    
-    # Handle welcome message
-    if message == 'welcome':
-        user = User.query.get(user_id)
-        return get_welcome_message(user.username)
-    
-    # Handle help command
-    if message == 'help':
-        return """Here are the available commands:
+HELP_MESSAGE = """Here are the available commands:
 
 1. Add a product:
    add product: [name], [price], [quantity], [category]
@@ -244,249 +339,336 @@ def process_command(message, user_id):
    category [category_name]
    Example: category electronics"""
 
-    # Handle add product command
-    if message.startswith('add product:'):
-        try:
-            # Parse the command
-            parts = message[len('add product:'):].strip().split(',')
-            if len(parts) != 4:
-                return "❌ Invalid format. Use: add product: [name], [price], [quantity], [category]"
-            
-            name = parts[0].strip()
-            price = float(parts[1].strip())
-            quantity = int(parts[2].strip())
-            category = parts[3].strip()
-            
-            # Check if product already exists
-            existing_product = Product.query.filter_by(name=name).first()
-            if existing_product:
-                return f"❌ Product '{name}' already exists"
-            
-            # Create new product
-            new_product = Product(
-                name=name,
-                price=price,
-                stock=quantity,
-                category=category,
-                user_id=user_id
-            )
-            db.session.add(new_product)
-            db.session.commit()
-            
-            return f"✅ Product '{name}' added successfully!"
-            
-        except ValueError as e:
-            return f"❌ Error: {str(e)}"
-        except Exception as e:
-            return f"❌ Error adding product: {str(e)}"
-    
-    # Handle search command
-    if message.startswith('search '):
-        keyword = message[len('search '):].strip()
-        products = Product.query.filter(
-            Product.user_id == user_id,
-            Product.name.ilike(f'%{keyword}%')
-        ).all()
-        
-        if not products:
-            return f"❌ No products found matching '{keyword}'"
-        
-        result = "🔍 Search Results:\n\n"
-        for product in products:
-            result += f"• {product.name} - ${product.price:.2f} ({product.stock} in stock) - {product.category}\n"
-        return result
-    
-    # Handle update command
-    if message.startswith('update product:'):
-        try:
-            # Parse the command
-            parts = message[len('update product:'):].strip().split(',')
-            if len(parts) != 3:
-                return "❌ Invalid format. Use: update product: [name], [field], [value]"
-            
-            name = parts[0].strip()
-            field = parts[1].strip().lower()
-            value = parts[2].strip()
-            
-            # Find the product
-            product = Product.query.filter_by(name=name, user_id=user_id).first()
-            if not product:
-                return f"❌ Product '{name}' not found"
-            
-            # Update the field
-            if field == 'price':
-                product.price = float(value)
-            elif field == 'stock':
-                product.stock = int(value)
-            elif field == 'category':
-                product.category = value
-            else:
-                return f"❌ Invalid field '{field}'. Use: price, stock, or category"
-            
-            db.session.commit()
-            return f"✅ Product '{name}' updated successfully!"
-            
-        except ValueError as e:
-            return f"❌ Error: {str(e)}"
-        except Exception as e:
-            return f"❌ Error updating product: {str(e)}"
-    
-    # Handle delete command
-    if message.startswith('delete product:'):
-        name = message[len('delete product:'):].strip()
-        product = Product.query.filter_by(name=name, user_id=user_id).first()
-        
+@api.before_app_request
+def sync_product_changes():
+    # Catch up on products changed by other worker processes
+    product_changes.poll()
+
+# create_app() attaches the response cache and metrics
+chat_router = CommandRouter()
+
+@chat_router.command('welcome', exact=('welcome',))
+def welcome_command(cmd, user_id):
+    user = users.get(user_id)
+    return get_welcome_message(user.username)
+
+@chat_router.command('help', exact=('help',))
+def help_command(cmd, user_id):
+    return HELP_MESSAGE
+
+@chat_router.command('add', prefix='add product:',
+                     pattern=r'(?P<name>[^,]*),(?P<price>[^,]*),(?P<quantity>[^,]*),(?P<category>[^,]*)$')
+def add_product_command(cmd, user_id):
+    try:
+        if cmd.args is None:
+            return "❌ Invalid format. Use: add product: [name], [price], [quantity], [category]"
+
+        name = cmd.args['name'].strip()
+        price = float(cmd.args['price'].strip())
+        quantity = int(cmd.args['quantity'].strip())
+        category = cmd.args['category'].strip()
+
+        # Check if product already exists
+        existing_product = Product.query.filter(db.func.lower(Product.name) == name.lower()).first()
+        if existing_product:
+            return f"❌ Product '{name}' already exists"
+
+        # Create new product
+        new_product = Product(
+            name=name,
+            price=price,
+            stock=quantity,
+            category=category,
+            user_id=user_id
+        )
+        db.session.add(new_product)
+        db.session.commit()
+
+        return f"✅ Product '{name}' added successfully!"
+
+    except ValueError as e:
+        return f"❌ Error: {str(e)}"
+    except Exception as e:
+        return f"❌ Error adding product: {str(e)}"
+
+@chat_router.command('search', prefix='search ', cached=True)
+def search_command(cmd, user_id):
+    keyword = cmd.rest.strip()
+    rows, count = renderer.query_rows(Product.query.filter(
+        Product.user_id == user_id,
+        Product.name.ilike(f'%{keyword}%')
+    ))
+    return renderer.reply("🔍 Search Results:\n\n", rows, product_line, count,
+                          empty=f"❌ No products found matching '{keyword}'")
+
+@chat_router.command('update', prefix='update product:',
+                     pattern=r'(?P<name>[^,]*),(?P<field>[^,]*),(?P<value>[^,]*)$')
+def update_product_command(cmd, user_id):
+    try:
+        if cmd.args is None:
+            return "❌ Invalid format. Use: update product: [name], [field], [value]"
+
+        name = cmd.args['name'].strip()
+        field = cmd.args['field'].strip().lower()
+        value = cmd.args['value'].strip()
+
+        # Find the product
+        product = Product.query.filter(Product.user_id == user_id, db.func.lower(Product.name) == name.lower()).first()
         if not product:
             return f"❌ Product '{name}' not found"
-        
-        db.session.delete(product)
+
+        # Update the field
+        if field == 'price':
+            product.price = float(value)
+        elif field == 'stock':
+            product.stock = int(value)
+        elif field == 'category':
+            product.category = value
+        else:
+            return f"❌ Invalid field '{field}'. Use: price, stock, or category"
+
         db.session.commit()
-        return f"✅ Product '{name}' deleted successfully!"
-    
-    # Handle show all products command
-    if message == 'show all products':
-        products = Product.query.filter_by(user_id=user_id).all()
-        
-        if not products:
-            return "❌ No products found"
-        
-        result = "📦 All Products:\n\n"
-        for product in products:
-            result += f"• {product.name} - ${product.price:.2f} ({product.stock} in stock) - {product.category}\n"
-        return result
-    
-    # Handle category command
-    if message.startswith('category '):
-        category = message[len('category '):].strip()
-        products = Product.query.filter_by(category=category, user_id=user_id).all()
-        
-        if not products:
-            return f"❌ No products found in category '{category}'"
-        
-        result = f"📦 Products in {category}:\n\n"
-        for product in products:
-            result += f"• {product.name} - ${product.price:.2f} ({product.stock} in stock)\n"
-        return result
-    
+        return f"✅ Product '{name}' updated successfully!"
+
+    except ValueError as e:
+        return f"❌ Error: {str(e)}"
+    except Exception as e:
+        return f"❌ Error updating product: {str(e)}"
+
+@chat_router.command('delete', prefix='delete product:')
+def delete_product_command(cmd, user_id):
+    name = cmd.rest.strip()
+    product = Product.query.filter(Product.user_id == user_id, db.func.lower(Product.name) == name.lower()).first()
+
+    if not product:
+        return f"❌ Product '{name}' not found"
+
+    db.session.delete(product)
+    db.session.commit()
+    return f"✅ Product '{name}' deleted successfully!"
+
+@chat_router.command('list', exact=('show all products',), cached=True)
+def list_products_command(cmd, user_id):
+    rows, count = renderer.query_rows(Product.query.filter_by(user_id=user_id))
+    return renderer.reply("📦 All Products:\n\n", rows, product_line, count,
+                          empty="❌ No products found")
+
+@chat_router.command('category', prefix='category ', cached=True)
+def category_command(cmd, user_id):
+    category = cmd.rest.strip()
+    rows, count = renderer.query_rows(Product.query.filter_by(category=category, user_id=user_id))
+    return renderer.reply(f"📦 Products in {category}:\n\n", rows, product_line_no_category, count,
+                          empty=f"❌ No products found in category '{category}'")
+
+@chat_router.fallback
+def default_command(message, user_id):
     return "I can help you with:\n1. Searching products\n2. Adding products\n3. Updating products\n4. Deleting products\n5. Showing all products\n6. Showing products by category\n\nPlease let me know what you'd like to do!"
 
+def process_command(message, user_id):
+    """Process user commands and return appropriate response"""
+    return chat_router.dispatch(message, user_id)
+
 # Routes
-@app.route('/api/register', methods=['POST'])
+@api.route('/api/register', methods=['POST'])
 def register():
     data = request.get_json()
     
-    if User.query.filter_by(username=data['username']).first():
+    # Check if username or email already exists, in one query
+    taken = db.session.query(User.username).filter(
+        db.or_(User.username == data['username'], User.email == data['email'])).limit(2).all()
+    if any(row.username == data['username'] for row in taken):
         return jsonify({'error': 'Username already exists'}), 400
-    
-    if User.query.filter_by(email=data['email']).first():
+    if taken:
         return jsonify({'error': 'Email already exists'}), 400
     
+    # Don't hold a pooled connection while waiting on the hasher
+    db.session.close()
     user = User(username=data['username'], email=data['email'], is_new_user=True)
-    user.set_password(data['password'])
+    try:
+        user.set_password(data['password'])
+    except HasherBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     
     db.session.add(user)
     db.session.commit()
     
+    user_info = {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'is_new_user': True
+    }
+    if tokens is not None:
+        return jsonify({'message': 'Registration successful', 'user': user_info, **tokens.issue(user)})
+    
     session['user_id'] = user.id
     
     return jsonify({
         'message': 'Registration successful',
-        'user': {
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'is_new_user': True
-        }
+        'user': user_info
     })
 
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
     username = data.get('username')
     password = data.get('password')
     
     user = User.query.filter_by(username=username).first()
+    # Release the pooled connection while waiting on the hasher; the
+    # detached user keeps its loaded attributes
+    db.session.close()
     
-    if user and user.check_password(password):
+    try:
+        ok = user is not None and user.check_password(password)
+    except HasherBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    
+    if ok:
+        db.session.add(user)
+        db.session.commit()
+        user_info = {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email
+        }
+        if tokens is not None:
+            return jsonify({'message': 'Login successful', 'user': user_info, **tokens.issue(user)})
         session['user_id'] = user.id
         return jsonify({
             'message': 'Login successful',
-            'user': {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email
-            }
+            'user': user_info
         })
     return jsonify({'error': 'Invalid username or password'}), 401
 
-@app.route('/api/logout', methods=['POST'])
+@api.route('/api/token/refresh', methods=['POST'])
+def refresh_token():
+    if tokens is None:
+        return jsonify({'error': 'Token authentication is not enabled'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    if not data.get('refresh_token'):
+        return jsonify({'error': 'refresh_token is required'}), 400
+    try:
+        return jsonify(tokens.refresh(data['refresh_token']))
+    except TokenError as e:
+        return jsonify({'error': str(e)}), 401
+
+@api.route('/api/logout', methods=['POST'])
 def logout():
+    if tokens is not None:
+        # Revoke whichever of the caller's tokens were presented
+        data = request.get_json(silent=True) or {}
+        for token, kind in ((bearer_token(request), 'access'), (data.get('refresh_token'), 'refresh')):
+            if token:
+                try:
+                    tokens.revoke(tokens.verify(token, kind=kind))
+                except TokenError:
+                    pass
     session.pop('user_id', None)
     return jsonify({'message': 'Logout successful'})
 
-@app.route('/api/chat', methods=['POST'])
+def chat_message():
+    """The ``message`` of a chat request body; None when the body is missing,
+    not JSON or has no string ``message``."""
+    data = request.get_json(silent=True)
+    message = data.get('message') if isinstance(data, dict) else None
+    return message if isinstance(message, str) else None
+
+@api.route('/api/chat', methods=['POST'])
 def chat():
     user = get_current_user()
     if not user:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    data = request.get_json()
-    user_message = data.get('message')
+    user_message = chat_message()
     
     if not user_message:
         return jsonify({'error': 'Message is required'}), 400
     
     # Handle welcome message
     if user_message.lower() == 'welcome':
-        print(f"Sending welcome message to user: {user.username}")  # Debug log
+        if metrics is not None:
+            metrics.count_command('welcome')
         response = get_welcome_message(user.username)
         # Save welcome message to database
-        welcome_message = Message(
-            content=response,
-            role='assistant',
-            user_id=user.id
-        )
-        db.session.add(welcome_message)
-        db.session.commit()
-        print(f"Welcome message saved to database for user: {user.username}")  # Debug log
+        save_messages(user.id, ('assistant', response))
+        current_app.logger.debug('Welcome message saved for user %s', user.username)
         return jsonify({'response': response})
     
     # Get response from process_command
     response = process_command(user_message, user.id)
     
     # Save messages to database
-    if user_message.lower() != 'welcome':  # Don't save the welcome trigger message
-        user_msg = Message(
-            content=user_message,
-            role='user',
-            user_id=user.id
-        )
-        db.session.add(user_msg)
-    
-    assistant_msg = Message(
-        content=response,
-        role='assistant',
-        user_id=user.id
-    )
-    db.session.add(assistant_msg)
-    db.session.commit()
+    save_messages(user.id, ('user', user_message), ('assistant', response))
     
     return jsonify({'response': response})
 
-@app.route('/api/chat/history', methods=['GET'])
-def get_chat_history():
+@api.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Server-Sent Events variant of /api/chat: the reply is sent chunk by
+    chunk as it is produced and saved once the stream completes."""
     user = get_current_user()
     if not user:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    messages = Message.query.filter_by(user_id=user.id).order_by(Message.timestamp).all()
+    user_message = chat_message()
+    
+    if not user_message:
+        return jsonify({'error': 'Message is required'}), 400
+    
+    if user_message.lower() == 'welcome':
+        return sse_response(iter((get_welcome_message(user.username),)),
+                            lambda text: save_messages(user.id, ('assistant', text)))
+    
+    return sse_response(chat_router.stream(user_message, user.id),
+                        lambda text: save_messages(user.id, ('user', user_message), ('assistant', text)))
+
+@api.route('/api/chat/history', methods=['GET'])
+def get_chat_history():
+    """Return the newest ``limit`` messages, oldest first within the page.
+
+    Pass the returned ``next_before`` as ``?before=`` to fetch the page of
+    older messages; it is null once the start of the history is reached."""
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    try:
+        limit = int(request.args.get('limit', current_app.config['HISTORY_PAGE_SIZE']))
+        before = request.args.get('before')
+        before = int(before) if before else None
+    except ValueError:
+        return jsonify({'error': 'limit and before must be integers'}), 400
+    if not 1 <= limit <= current_app.config['HISTORY_MAX_PAGE_SIZE']:
+        return jsonify({'error': f"limit must be between 1 and {current_app.config['HISTORY_MAX_PAGE_SIZE']}"}), 400
+
+    if message_writer is not None:
+        # Make this user's buffered messages visible before reading
+        message_writer.flush()
+
+    query = Message.query.filter_by(user_id=user.id)
+    if before is not None:
+        anchor = db.session.get(Message, before)
+        if anchor is None or anchor.user_id != user.id:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(db.tuple_(Message.timestamp, Message.id) < (anchor.timestamp, anchor.id))
+    messages = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+
+    next_before = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_before = messages[-1].id
+    messages.reverse()
     return jsonify({
         'messages': [{
+            'id': msg.id,
             'role': msg.role,
             'content': msg.content,
             'timestamp': msg.timestamp.isoformat()
-        } for msg in messages]
+        } for msg in messages],
+        'next_before': next_before
     })
 
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,328 @@
+"""Load test of the chat and product APIs, with JSON results and a compare mode.
+
+Each run seeds a scratch SQLite database through ``seed_products.py`` with
+``--products`` synthetic products and ``--users`` users, each with
+``--messages`` chat messages.  Then ``--concurrency`` clients, each signed in
+as its own user, send a weighted mix of requests back to back for
+``--seconds``:
+
+    chat search, category and list commands, GET /api/products pages,
+    GET /api/products/search, PUT /api/products/reduce-stock/<name>,
+    GET /api/chat/history and POST /api/chat/history/append
+
+``--driver client`` runs the clients as threads on the Flask test client in
+one process: no sockets, so it isolates the app's own cost.  ``--driver
+server`` starts ``app.run(threaded=True)`` in a subprocess and drives it over
+HTTP from an asyncio client.  A reduce-stock answered "sold out" counts as a
+success.  Throughput, p50/p95/p99 latency and errors per endpoint are printed
+and written as JSON to ``--output``.
+
+``--compare`` diffs two result files.  An endpoint regresses when its
+throughput drops, or its p95 or p99 rises, by more than ``--threshold``
+percent; the command then exits with status 1.
+
+    python bench/bench_api.py [--driver client|server] [--products 10000] [--users 20] [--messages 50]
+        [--concurrency 8] [--seconds 10] [--seed 1] [--output results.json]
+    python bench/bench_api.py --compare baseline.json candidate.json [--threshold 10]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench_asgi import free_port, percentile, wait_until_up
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from seed_products import BRANDS, CATEGORIES, NOUNS, synthetic_products  # noqa: E402
+
+# (endpoint, weight)
+MIX = [
+    ('chat search', 20),
+    ('chat category', 10),
+    ('chat list', 5),
+    ('products page', 15),
+    ('products search', 15),
+    ('reduce stock', 10),
+    ('history get', 10),
+    ('history append', 15),
+]
+
+
+def next_request(endpoint, rng, names, state):
+    """Return ``(method, path, json)`` for one request to ``endpoint``."""
+    if endpoint == 'chat search':
+        return 'POST', '/api/chat', {'message': f'search {rng.choice(BRANDS)} {rng.choice(NOUNS)}'}
+    if endpoint == 'chat category':
+        return 'POST', '/api/chat', {'message': f'category {rng.choice(CATEGORIES)}'}
+    if endpoint == 'chat list':
+        return 'POST', '/api/chat', {'message': 'show all products'}
+    if endpoint == 'products page':
+        return 'GET', f'/api/products?after={rng.randrange(len(names))}&limit=20', None
+    if endpoint == 'products search':
+        return 'GET', f'/api/products/search?name={rng.choice(NOUNS).lower()}&limit=20', None
+    if endpoint == 'reduce stock':
+        return 'PUT', f'/api/products/reduce-stock/{rng.choice(names)}', {'amount': 1}
+    if endpoint == 'history get':
+        return 'GET', '/api/chat/history', None
+    return 'POST', '/api/chat/history/append', {
+        'since': state['seq'],
+        'messages': [{'role': 'user', 'content': 'search lamp'}, {'role': 'assistant', 'content': 'Reply'}],
+    }
+
+
+def succeeded(endpoint, status):
+    # A sold-out product is a valid answer, not a failure
+    return 200 <= status < 300 or (endpoint == 'reduce stock' and status == 400)
+
+
+def seed_app(args):
+    sys.path.insert(0, ROOT)
+    import app as app_module
+    from seed_products import USER_PASSWORD, seed, seed_chat_history, seed_users
+
+    with app_module.app.app_context():
+        seed(app_module.db, app_module.Product, args.products)
+        user_ids = seed_users(app_module.db, app_module.User, args.users,
+                              app_module.passwords.hash(USER_PASSWORD))
+        seed_chat_history(app_module.db, app_module.ChatMessage, user_ids, args.messages)
+    return app_module, USER_PASSWORD
+
+
+def drive_client(args):
+    """Threads on the Flask test client; returns ``(samples, elapsed)``."""
+    app_module, password = seed_app(args)
+    names = [row['name'] for row in synthetic_products(args.products)]
+    endpoints, weights = zip(*MIX)
+    samples = []  # (endpoint, ms, ok)
+    clients = []
+    for i in range(args.concurrency):
+        client = app_module.app.test_client()
+        client.post('/api/login', json={'username': f'user{i}', 'password': password})
+        clients.append(client)
+
+    def loop(index, client, barrier):
+        rng = random.Random(args.seed * 1000 + index)
+        state = {'seq': args.messages}
+        local = []
+        barrier.wait()
+        while time.monotonic() < deadline:
+            endpoint = rng.choices(endpoints, weights)[0]
+            method, path, body = next_request(endpoint, rng, names, state)
+            start = time.perf_counter()
+            response = client.open(path, method=method, json=body)
+            local.append((endpoint, (time.perf_counter() - start) * 1000,
+                          succeeded(endpoint, response.status_code)))
+            if endpoint == 'history append' and response.status_code in (200, 409):
+                state['seq'] = response.get_json()['seq']
+        samples.extend(local)
+
+    barrier = threading.Barrier(args.concurrency + 1)
+    threads = [threading.Thread(target=loop, args=(i, client, barrier)) for i, client in enumerate(clients)]
+    deadline = time.monotonic() + args.seconds
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def serve(args):
+    app_module, _ = seed_app(args)
+    app_module.app.run(port=args.port, threaded=True)
+
+
+async def drive_server(args, base):
+    """asyncio clients over HTTP; returns ``(samples, elapsed)``."""
+    import httpx
+
+    from seed_products import USER_PASSWORD
+
+    await wait_until_up(base)
+    names = [row['name'] for row in synthetic_products(args.products)]
+    endpoints, weights = zip(*MIX)
+    samples = []
+    clients = []
+    for i in range(args.concurrency):
+        client = httpx.AsyncClient(base_url=base, timeout=60)
+        await client.post('/api/login', json={'username': f'user{i}', 'password': USER_PASSWORD})
+        clients.append(client)
+    deadline = time.monotonic() + args.seconds
+
+    async def loop(index, client):
+        rng = random.Random(args.seed * 1000 + index)
+        state = {'seq': args.messages}
+        while time.monotonic() < deadline:
+            endpoint = rng.choices(endpoints, weights)[0]
+            method, path, body = next_request(endpoint, rng, names, state)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                ok = succeeded(endpoint, response.status_code)
+                if endpoint == 'history append' and response.status_code in (200, 409):
+                    state['seq'] = response.json()['seq']
+            except httpx.HTTPError:
+                ok = False
+            samples.append((endpoint, (time.perf_counter() - start) * 1000, ok))
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(loop(i, client) for i, client in enumerate(clients)))
+    finally:
+        for client in clients:
+            await client.aclose()
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples, elapsed):
+    def stats(rows):
+        latencies = sorted(ms for _, ms, ok in rows if ok)
+        if not latencies:
+            return {'requests': 0, 'errors': len(rows), 'rps': 0.0}
+        return {
+            'requests': len(latencies),
+            'errors': len(rows) - len(latencies),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+        }
+
+    by_endpoint = {}
+    for row in samples:
+        by_endpoint.setdefault(row[0], []).append(row)
+    endpoints = {endpoint: stats(by_endpoint[endpoint]) for endpoint, _ in MIX if endpoint in by_endpoint}
+    return endpoints, stats(samples)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(endpoints, total):
+    print(f"{'endpoint':<18} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, row in list(endpoints.items()) + [('total', total)]:
+        print(f"{name:<18} {row['rps']:>8.1f} {row.get('p50_ms', float('nan')):>9.2f} "
+              f"{row.get('p95_ms', float('nan')):>9.2f} {row.get('p99_ms', float('nan')):>9.2f} {row['errors']:>7}")
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, BCRYPT_ROUNDS='4', PASSWORD_HASH_QUEUE='1000',
+                   DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        common = ['--products', str(args.products), '--users', str(args.users),
+                  '--messages', str(args.messages), '--concurrency', str(args.concurrency),
+                  '--seconds', str(args.seconds), '--seed', str(args.seed)]
+        if args.driver == 'client':
+            child = subprocess.run([sys.executable, __file__, '--drive', *common],
+                                   env=env, check=True, capture_output=True, text=True)
+            samples, elapsed = json.loads(child.stdout.splitlines()[-1])
+        else:
+            port = free_port()
+            server = subprocess.Popen([sys.executable, __file__, '--serve', '--port', str(port), *common],
+                                      env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                samples, elapsed = asyncio.run(drive_server(args, f'http://127.0.0.1:{port}'))
+            finally:
+                server.terminate()
+                server.wait()
+
+    endpoints, total = summarize(samples, elapsed)
+    result = {
+        'meta': {
+            'driver': args.driver, 'products': args.products, 'users': args.users,
+            'messages': args.messages, 'concurrency': args.concurrency, 'seconds': args.seconds,
+            'seed': args.seed, 'git': git_revision(), 'python': platform.python_version(),
+            'cpus': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'endpoints': endpoints,
+        'total': total,
+    }
+    print_table(endpoints, total)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+            f.write('\n')
+        print(f'Wrote {args.output}')
+
+
+def change(before, after):
+    return (after - before) / before * 100 if before else float('nan')
+
+
+def compare(args):
+    with open(args.compare[0]) as f:
+        baseline = json.load(f)
+    with open(args.compare[1]) as f:
+        candidate = json.load(f)
+    differing = [key for key in ('driver', 'products', 'users', 'messages', 'concurrency', 'seconds')
+                 if baseline['meta'].get(key) != candidate['meta'].get(key)]
+    if differing:
+        print(f"Warning: the runs differ in {', '.join(differing)}")
+    print(f"{'endpoint':<18} {'req/s':>7} {'change':>8}  {'p50':>7}  {'p95':>7}  {'p99':>7}")
+    regressions = []
+    rows = [(name, row, candidate['endpoints'].get(name)) for name, row in baseline['endpoints'].items()]
+    rows.append(('total', baseline['total'], candidate['total']))
+    for name, before, after in rows:
+        if after is None or not before.get('requests') or not after.get('requests'):
+            print(f'{name:<18} (missing from one run)')
+            continue
+        rps = change(before['rps'], after['rps'])
+        latency = {key: change(before[key], after[key]) for key in ('p50_ms', 'p95_ms', 'p99_ms')}
+        regressed = rps < -args.threshold or max(latency['p95_ms'], latency['p99_ms']) > args.threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<18} {before['rps']:>7.1f} {rps:>+7.1f}%  "
+              + '  '.join(f'{latency[key]:>+6.1f}%' for key in ('p50_ms', 'p95_ms', 'p99_ms'))
+              + ('  REGRESSION' if regressed else ''))
+    if regressions:
+        print(f"Regressed beyond {args.threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--driver', choices=['client', 'server'], default='client')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'))
+    parser.add_argument('--threshold', type=float, default=10)
+    parser.add_argument('--drive', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args)
+        return
+    args.users = max(args.users, args.concurrency)  # one user per client
+    if args.drive:
+        samples, elapsed = drive_client(args)
+        print(json.dumps([samples, elapsed]))
+    elif args.serve:
+        serve(args)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""Load test: the Flask app under its threaded WSGI server versus ``asgi.py``.
+
+Each deployment is started in its own subprocess on a local port, against a
+scratch SQLite database seeded with synthetic products: ``wsgi`` is
+``app.run(threaded=True)`` (the current deployment, minus the debugger) and
+``asgi`` is ``asgi:app`` under uvicorn.  For each ``--connections`` level an
+asyncio client signs in that many users, one keep-alive connection each, then
+sends a mix of chat searches, product pages and chat history
+appends back to back for ``--seconds``.  Logins are not the subject here
+(see ``bench_login_storm.py``), so the hashing queue is made deep enough that
+none are shed while the clients sign in.  Reports requests/sec, p50/p99
+latency and failed requests by status code or error.  The client shares the box with
+the server, so compare the two rows rather than reading absolute numbers.
+
+    python bench/bench_asgi.py [--connections 10 50 200] [--seconds 10] [--products 5000]
+"""
+import argparse
+import asyncio
+import collections
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from seed_products import BRANDS, CATEGORIES, NOUNS, seed  # noqa: E402
+
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def serve(mode, port, products):
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    with app_module.app.app_context():
+        seed(app_module.db, app_module.Product, products)
+    if mode == 'wsgi':
+        app_module.app.run(port=port, threaded=True)
+    else:
+        import uvicorn
+        uvicorn.run('asgi:app', port=port, log_level='warning')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_up(base):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=base) as client:
+        for _ in range(300):
+            try:
+                await client.get('/api/check-auth')
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f'server at {base} did not start')
+
+
+async def sign_in(base, index, failures):
+    import httpx
+
+    client = httpx.AsyncClient(base_url=base, timeout=60)
+    credentials = {'username': f'load{index}', 'email': f'load{index}@example.com', 'password': 'secret'}
+    setup = [(await client.post('/api/register', json=credentials)).status_code,
+             (await client.post('/api/login', json=credentials)).status_code]
+    if setup != [201, 200]:
+        failures[f'sign-in {setup}'] += 1
+    return client
+
+
+async def client_loop(client, index, deadline, latencies, failures):
+    import httpx
+
+    requests = [
+        lambda i: client.post('/api/chat', json={'message': f'search {BRANDS[i % len(BRANDS)]} {NOUNS[i % len(NOUNS)]}'}),
+        lambda i: client.get('/api/products', params={'after': i * 7 % 1000, 'limit': 20}),
+        lambda i: client.get(f'/api/products/category/{CATEGORIES[i % len(CATEGORIES)]}', params={'limit': 20}),
+    ]
+    seq, i = 0, index
+    while time.monotonic() < deadline:
+        i += 1
+        start = time.perf_counter()
+        try:
+            if i % 4 == 0:
+                response = await client.post('/api/chat/history/append',
+                                             json={'since': seq, 'messages': [{'text': f'message {i}'}]})
+                if response.status_code == 200:
+                    seq = response.json()['seq']
+            else:
+                response = await requests[i % 3](i)
+            outcome = response.status_code
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        if outcome == 200:
+            latencies.append((time.perf_counter() - start) * 1000)
+        else:
+            failures[outcome] += 1
+
+
+async def load(base, connections, seconds):
+    await wait_until_up(base)
+    latencies, failures = [], collections.Counter()
+    clients = await asyncio.gather(*(sign_in(base, n, failures) for n in range(connections)))
+    deadline = time.monotonic() + seconds
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(client_loop(client, n, deadline, latencies, failures)
+                               for n, client in enumerate(clients)))
+    finally:
+        for client in clients:
+            await client.aclose()
+    return latencies, failures, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--serve', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.products)
+        return
+
+    for connections in args.connections:
+        for mode in ('wsgi', 'asgi'):
+            with tempfile.TemporaryDirectory() as tmp:
+                port = free_port()
+                env = dict(os.environ, BCRYPT_ROUNDS='4', PASSWORD_HASH_QUEUE='1000',
+                           DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+                server = subprocess.Popen(
+                    [sys.executable, __file__, '--serve', mode, '--port', str(port),
+                     '--products', str(args.products)],
+                    env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                try:
+                    latencies, failures, elapsed = asyncio.run(
+                        load(f'http://127.0.0.1:{port}', connections, args.seconds))
+                finally:
+                    server.terminate()
+                    server.wait()
+            latencies.sort()
+            p50 = percentile(latencies, 0.5) if latencies else float('nan')
+            p99 = percentile(latencies, 0.99) if latencies else float('nan')
+            print(f'{mode}  {connections:>4} connections  {len(latencies) / elapsed:8.0f} req/s  '
+                  f'p50 {p50:8.1f} ms  p99 {p99:8.1f} ms  '
+                  f'failed {dict(failures) or 0}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Request latency of the product read paths with the catalog index on and off.
+
+For each catalog size a scratch SQLite database is seeded with synthetic
+products and the app is driven through the Flask test client.  Every size runs
+in its own subprocess because ``app.py`` binds its database at import time.
+
+    python bench/bench_catalog_index.py [--sizes 10000 100000 1000000] [--requests 50]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from seed_products import NOUNS, seed  # noqa: E402
+
+
+def timed(fn, requests):
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def run_size(size, requests):
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    client = app_module.app.test_client()
+    probe = size // 2
+    cases = {
+        'GET /api/products/search (selective)':
+            lambda: client.get(f'/api/products/search?name=lamp%20{probe}'),
+        'GET /api/products/category/<c>':
+            lambda: client.get('/api/products/category/Category7'),
+        'chat: search <term>':
+            lambda: app_module.handle_product_query(f'search {NOUNS[probe % len(NOUNS)].lower()} {probe}'),
+    }
+    with app_module.app.app_context():
+        seed(app_module.db, app_module.Product, size)
+        for enabled in (False, True):
+            app_module.catalog.enabled = enabled
+            app_module.catalog.invalidate()
+            if enabled:
+                start = time.perf_counter()
+                app_module.catalog.all()
+                print(f'  index build: {(time.perf_counter() - start):.2f}s')
+            for label, fn in cases.items():
+                p50, p99 = timed(fn, requests)
+                state = 'on ' if enabled else 'off'
+                print(f'  index {state}  {label:<40} p50 {p50:9.3f} ms   p99 {p99:9.3f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.size:
+        run_size(args.size, args.requests)
+        return
+
+    for size in args.sizes:
+        print(f'{size:,} products')
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            subprocess.run([sys.executable, __file__, '--size', str(size),
+                            '--requests', str(args.requests)], env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Time to first byte of ``/api/chat`` versus ``/api/chat/stream``.
+
+For each catalog size a scratch SQLite database is seeded with synthetic
+products and ``show all products`` is sent with the row cap raised to the
+catalog size and the response cache off, so every request renders the whole
+catalog.  Reports, per endpoint, the median time until the first byte of the
+body is available and until the reply is complete.  Each size runs in its own
+subprocess because ``app.py`` reads its settings at import time.
+
+    python bench/bench_chat_stream.py [--sizes 1000 10000 50000] [--requests 20]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from seed_products import seed  # noqa: E402
+
+
+def run_size(size, requests):
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    with app_module.app.app_context():
+        seed(app_module.db, app_module.Product, size)
+    client = app_module.app.test_client()
+    credentials = {'username': 'bench', 'email': 'bench@example.com', 'password': 'secret'}
+    client.post('/api/register', json=credentials)
+    client.post('/api/login', json=credentials)
+    message = {'message': 'show all products'}
+
+    for endpoint in ('/api/chat', '/api/chat/stream'):
+        first, total = [], []
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = client.post(endpoint, json=message, buffered=False)
+            body = iter(response.response)
+            next(body)
+            first.append((time.perf_counter() - start) * 1000)
+            for _ in body:
+                pass
+            response.close()
+            total.append((time.perf_counter() - start) * 1000)
+        print(f'{size:>7,} products  {endpoint:<17} first byte {statistics.median(first):8.2f} ms  '
+              f'complete {statistics.median(total):8.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_size(args.child, args.requests)
+        return
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, CHAT_MAX_ROWS=str(size), CHAT_RESPONSE_CACHE_SIZE='0', BCRYPT_ROUNDS='4',
+                       DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            subprocess.run([sys.executable, __file__, '--child', str(size), '--requests', str(args.requests)],
+                           env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""What the removed raw ``sqlite3`` path cost: startup and per-request connections.
+
+``app.py`` used to run ``init_db()`` before ``app.run()``, creating a second
+schema in ``database.db`` next to the ``create_all()`` on the app database,
+and ``get_db_connection()`` opened a new ``sqlite3`` connection on every call.
+In a scratch directory this measures:
+
+* startup: ``create_all()`` alone versus ``create_all()`` plus the old
+  ``init_db()``, on a fresh file and on an existing one;
+* per request: one indexed product lookup through a new ``sqlite3``
+  connection (bare, and with the ``sqlite_pragmas`` settings the app now
+  applies to each connection) versus through the app's pooled engine, from
+  1 and from ``--threads`` threads.
+
+    python bench/bench_db_layer.py [--lookups 5000] [--threads 8] [--products 5000]
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from seed_products import seed, synthetic_products  # noqa: E402
+
+LOOKUP = 'SELECT id, name, price, category, stock FROM product WHERE name = ?'
+
+
+def legacy_init_db(path):
+    """The ``init_db()`` that ``app.py`` used to run at startup."""
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            price REAL NOT NULL,
+            category TEXT,
+            stock INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def time_startup(app_module, tmp, rounds):
+    """Median ms of ``create_all()`` with and without ``init_db()``, fresh and existing."""
+    from sqlalchemy import create_engine
+
+    results = {}
+    for legacy in (False, True):
+        for existing in (False, True):
+            samples = []
+            for n in range(rounds):
+                path = os.path.join(tmp, f'startup-{legacy}-{existing}-{n}')
+                if existing:
+                    engine = create_engine(f'sqlite:///{path}.db')
+                    app_module.db.metadata.create_all(engine)
+                    engine.dispose()
+                    legacy_init_db(f'{path}-legacy.db')
+                engine = create_engine(f'sqlite:///{path}.db')
+                start = time.perf_counter()
+                app_module.db.metadata.create_all(engine)
+                if legacy:
+                    legacy_init_db(f'{path}-legacy.db')
+                samples.append((time.perf_counter() - start) * 1000)
+                engine.dispose()
+            results[legacy, existing] = statistics.median(samples)
+    return results
+
+
+def run_threads(threads, lookups, lookup):
+    per_thread = lookups // threads
+
+    def worker(seed_no):
+        for i in range(per_thread):
+            lookup(seed_no * per_thread + i)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return per_thread * threads / elapsed, elapsed / (per_thread * threads) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lookups', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+        sys.path.insert(0, ROOT)
+        import app as app_module
+        from sqlite_pragmas import sqlite_pragmas
+
+        startup = time_startup(app_module, tmp, args.rounds)
+        print(f'Startup schema setup, median of {args.rounds} (ms):')
+        for existing in (False, True):
+            label = 'existing files' if existing else 'fresh files   '
+            print(f'  {label}  create_all {startup[False, existing]:6.2f}  '
+                  f'create_all + init_db {startup[True, existing]:6.2f}')
+
+        with app_module.app.app_context():
+            seed(app_module.db, app_module.Product, args.products)
+            engine = app_module.db.engine
+        names = [row['name'] for row in synthetic_products(args.products)]
+        pragmas = sqlite_pragmas(
+            journal_mode=app_module.app.config['SQLITE_JOURNAL_MODE'],
+            synchronous=app_module.app.config['SQLITE_SYNCHRONOUS'],
+            busy_timeout=app_module.app.config['SQLITE_BUSY_TIMEOUT'],
+            cache_size=app_module.app.config['SQLITE_CACHE_SIZE'],
+            mmap_size=app_module.app.config['SQLITE_MMAP_SIZE'])
+
+        def raw(i, configure=False):
+            conn = sqlite3.connect(path)
+            conn.row_factory = sqlite3.Row
+            if configure:
+                for statement in pragmas:
+                    conn.execute(statement)
+            conn.execute(LOOKUP, (names[i % len(names)],)).fetchone()
+            conn.close()
+
+        def pooled(i):
+            with engine.connect() as conn:
+                conn.exec_driver_sql(LOOKUP, (names[i % len(names)],)).fetchone()
+
+        setups = [
+            ('new sqlite3 connection', raw),
+            ('new connection + pragmas', lambda i: raw(i, configure=True)),
+            ('pooled engine', pooled),
+        ]
+        print(f'Product lookup by name, {args.lookups} lookups:')
+        for threads in sorted({1, args.threads}):
+            for name, lookup in setups:
+                rate, micros = run_threads(threads, args.lookups, lookup)
+                print(f'  {threads:>2} threads  {name:<26} {rate:8.0f} lookups/s  {micros:7.1f} us each')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Fuzzy product-name lookup latency for ``FuzzyNameIndex``.
+
+Builds the index over synthetic product names and queries it with misspelt
+versions of random names (one character dropped from each word).
+
+    python bench/bench_fuzzy.py [--sizes 100000 300000] [--queries 500]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fuzzy_index import FuzzyNameIndex
+
+SYLLABLES = ['ba', 'ke', 'lo', 'mi', 'nu', 'ra', 'so', 'ti', 've', 'zu', 'gal', 'sam', 'pho', 'lap', 'cam']
+SUFFIXES = ['pro', 'max', 'lite', 'plus', 'mini', '']
+
+
+def synthetic_names(size, rng):
+    def word():
+        return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+    brands = [word() for _ in range(2000)]
+    models = [word() for _ in range(5000)]
+    return [f'{rng.choice(brands)} {rng.choice(models)} {rng.choice(SUFFIXES)} {rng.randint(1, 999)}'
+            for _ in range(size)]
+
+
+def misspell(name, rng):
+    out = []
+    for word in name.split()[:2]:
+        i = rng.randrange(len(word))
+        out.append(word[:i] + word[i + 1:] if len(word) > 3 else word)
+    return ' '.join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 300000])
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    for size in args.sizes:
+        names = synthetic_names(size, rng)
+        index = FuzzyNameIndex()
+        start = time.perf_counter()
+        for key, name in enumerate(names):
+            index.add(key, name)
+        build = time.perf_counter() - start
+
+        queries = [misspell(name, rng) for name in rng.sample(names, args.queries)]
+        samples = []
+        for query in queries:
+            start = time.perf_counter()
+            index.query(query, 10)
+            samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        print(f'{size:>9,} names  build {build:6.2f}s  '
+              f'p50 {statistics.median(samples):.3f} ms  p99 {samples[int(len(samples) * 0.99) - 1]:.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
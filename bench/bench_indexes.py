@@ -0,0 +1,150 @@
+"""Query plans and latency of the hot product and history lookups, before and
+after ``migrations.py``.
+
+Each schema (``app.py`` and ``backend/app.py``) runs in its own subprocess
+against a scratch SQLite database.  The tables are created from the current
+models with the lookup indexes dropped again, which is what an existing
+``products.db``/``chatbot.db`` looks like; the database is seeded, every query
+is planned (``EXPLAIN QUERY PLAN``) and timed, the migrations are applied,
+and the plans and timings are taken again.
+
+    python bench/bench_indexes.py [--products 100000] [--users 100] [--messages 200] [--repeat 200]
+"""
+import argparse
+import datetime
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from seed_products import synthetic_products  # noqa: E402
+
+# Indexes migrations.py adds, dropped to recreate a database that predates them
+MIGRATED_INDEXES = ['ix_product_category', 'ix_product_name_lower', 'ix_product_user_name_lower',
+                    'ix_product_user_category', 'ix_message_user_timestamp']
+
+
+def product_name(index):
+    return next(itertools.islice(synthetic_products(index + 1), index, None))['name']
+
+
+def app_queries(db, module, products, users):
+    Product = module.Product
+    name = product_name(products // 2)
+    return [
+        ('category page', db.select(Product).where(Product.category == 'Category7')
+         .order_by(Product.id).limit(21)),
+        ('chat update/delete lookup', db.select(Product)
+         .where(db.func.lower(Product.name) == name.lower()).limit(1)),
+    ]
+
+
+def backend_queries(db, module, products, users):
+    Product, Message = module.Product, module.Message
+    index = products // 2
+    user_id = index % users + 1
+    name = product_name(index)
+    category = f'Category{index % 50}'
+    return [
+        ('chat update/delete lookup', db.select(Product)
+         .where(Product.user_id == user_id, db.func.lower(Product.name) == name.lower()).limit(1)),
+        ('chat add duplicate check', db.select(Product)
+         .where(db.func.lower(Product.name) == name.lower()).limit(1)),
+        ('chat category', db.select(Product).where(Product.category == category, Product.user_id == user_id)),
+        ('chat list', db.select(Product).where(Product.user_id == user_id)),
+        ('chat search', db.select(Product).where(Product.user_id == user_id, Product.name.ilike('%lamp%'))),
+        ('history page', db.select(Message).where(Message.user_id == user_id)
+         .order_by(Message.timestamp.desc(), Message.id.desc()).limit(51)),
+    ]
+
+
+def seed_app(db, module, products, users, messages):
+    db.session.execute(db.insert(module.Product), list(synthetic_products(products)))
+    db.session.commit()
+
+
+def seed_backend(db, module, products, users, messages):
+    db.session.execute(db.insert(module.User), [
+        {'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x'} for i in range(users)])
+    db.session.execute(db.insert(module.Product), [
+        dict(row, user_id=i % users + 1) for i, row in enumerate(synthetic_products(products))])
+    start = datetime.datetime(2024, 1, 1)
+    db.session.execute(db.insert(module.Message), [
+        {'user_id': i % users + 1, 'role': 'user' if i % 2 else 'assistant', 'content': f'message {i}',
+         'timestamp': start + datetime.timedelta(seconds=i)} for i in range(users * messages)])
+    db.session.commit()
+
+
+def measure(engine, queries, repeat):
+    with engine.connect() as conn:
+        for label, statement in queries:
+            sql = str(statement.compile(engine, compile_kwargs={'literal_binds': True}))
+            plan = [row[-1] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+            conn.execute(statement).all()
+            start = time.perf_counter()
+            for _ in range(repeat):
+                rows = conn.execute(statement).all()
+            elapsed = time.perf_counter() - start
+            print(f'  {label:<30} {elapsed / repeat * 1e6:9.1f} us  {len(rows):>5} rows')
+            for step in plan:
+                print(f'      {step}')
+
+
+def child(schema, products, users, messages, repeat):
+    import migrations
+
+    if schema == 'backend':
+        sys.path.insert(0, os.path.join(ROOT, 'backend'))
+        os.environ.setdefault('SECRET_KEY', 'bench')
+    import app as module
+
+    if hasattr(module, 'create_app'):
+        module.create_app()
+    db = module.db
+    seed, queries = (seed_backend, backend_queries) if schema == 'backend' else (seed_app, app_queries)
+    with module.app.app_context():
+        engine = db.engine
+        with engine.begin() as conn:
+            for name in MIGRATED_INDEXES:
+                conn.exec_driver_sql(f'DROP INDEX IF EXISTS {name}')
+            conn.exec_driver_sql('DELETE FROM schema_migrations')
+        seed(db, module, products, users, messages)
+        queries = queries(db, module, products, users)
+
+        print(f'{schema}: before')
+        measure(engine, queries, repeat)
+        start = time.perf_counter()
+        applied = migrations.upgrade(engine)
+        print(f'{schema}: after migrations {applied} ({time.perf_counter() - start:.2f} s)')
+        measure(engine, queries, repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=200, help='history messages per user (backend)')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--schema', choices=['app', 'backend'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.schema:
+        child(args.schema, args.products, args.users, args.messages, args.repeat)
+        return
+
+    for schema in ('app', 'backend'):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                       CATALOG_SYNC_INTERVAL='3600', METRICS='0')
+            subprocess.run([sys.executable, __file__, '--schema', schema, '--products', str(args.products),
+                            '--users', str(args.users), '--messages', str(args.messages),
+                            '--repeat', str(args.repeat)], env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Chat latency in ``app.py`` while a burst of logins hits the server.
+
+Each mode runs in its own subprocess against a scratch SQLite database:
+``inline`` hashes on the request thread (``PASSWORD_HASH_WORKERS=0``, the old
+behaviour) and ``pool`` uses the bounded hashing pool with its default size.
+``--chat-clients`` logged-in threads send chat messages back to back while
+logins arrive at ``--rate`` per second for ``--seconds``, each on its own
+thread from a pool of up to ``--rate`` threads.  Reports chat p50/p99 during
+the storm and the login status codes (503 = shed by the pool).
+
+    python bench/bench_login_storm.py [--rate 200] [--seconds 5] [--chat-clients 4] [--rounds 12]
+"""
+import argparse
+import collections
+import concurrent.futures
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def run(mode, rate, seconds, chat_clients):
+    sys.path.insert(0, ROOT)
+    from app import app
+
+    credentials = {'username': 'storm', 'email': 'storm@example.com', 'password': 'secret'}
+    app.test_client().post('/api/register', json=credentials)
+
+    stop = threading.Event()
+    latencies = []
+
+    def chat_loop():
+        client = app.test_client()
+        client.post('/api/login', json=credentials)
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.post('/api/chat', json={'message': 'help'})
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    def login():
+        return app.test_client().post('/api/login', json=credentials).status_code
+
+    chatters = [threading.Thread(target=chat_loop) for _ in range(chat_clients)]
+    for thread in chatters:
+        thread.start()
+    time.sleep(0.5)  # let the chat clients log in before the storm
+    latencies.clear()
+
+    statuses = collections.Counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=rate) as executor:
+        futures = []
+        start = time.perf_counter()
+        for i in range(rate * seconds):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(login))
+        for future in futures:
+            statuses[future.result()] += 1
+        elapsed = time.perf_counter() - start
+        storm_latencies = list(latencies)
+    stop.set()
+    for thread in chatters:
+        thread.join()
+
+    storm_latencies.sort()
+    print(f'{mode:<7} chat p50 {statistics.median(storm_latencies):8.1f} ms  '
+          f'p99 {percentile(storm_latencies, 0.99):8.1f} ms  ({len(storm_latencies)} chats)  '
+          f'logins {dict(sorted(statuses.items()))} in {elapsed:.1f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', type=int, default=200, help='logins per second')
+    parser.add_argument('--seconds', type=int, default=5)
+    parser.add_argument('--chat-clients', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=12, help='bcrypt work factor')
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.rate, args.seconds, args.chat_clients)
+        return
+
+    for mode, workers in (('inline', '0'), ('pool', None)):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, BCRYPT_ROUNDS=str(args.rounds),
+                       DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            if workers is not None:
+                env['PASSWORD_HASH_WORKERS'] = workers
+            subprocess.run([sys.executable, __file__, '--mode', mode, '--rate', str(args.rate),
+                            '--seconds', str(args.seconds), '--chat-clients', str(args.chat_clients)],
+                           env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
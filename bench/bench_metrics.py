@@ -0,0 +1,85 @@
+"""Per-request cost of the ``metrics`` hooks in ``app.py``.
+
+Two measurements, each in a subprocess against a scratch SQLite database:
+
+* ``hooks``: the before/after/teardown hooks and the two cursor listeners for
+  a request that runs ``--queries`` statements, called directly inside a test
+  request context ``--requests`` times.  This is the overhead itself.
+* ``requests``: ``GET /api/check-auth`` through the Flask test client with
+  ``METRICS=0`` and ``METRICS=1``.  The difference is the overhead as seen end
+  to end, within the noise of the rest of the request.
+
+    python bench/bench_metrics.py [--requests 20000] [--queries 3]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def hooks(requests, queries):
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    metrics = app_module.metrics
+
+    class Context:
+        pass
+
+    with app_module.app.test_request_context('/api/products/category/Books'):
+        response = app_module.app.response_class('')
+        start = time.perf_counter()
+        for _ in range(requests):
+            metrics._before_request()
+            for _ in range(queries):
+                context = Context()
+                metrics._before_cursor_execute(None, None, '', (), context, False)
+                metrics._after_cursor_execute(None, None, '', (), context, False)
+            metrics._after_request(response)
+            metrics._teardown_request(None)
+        elapsed = time.perf_counter() - start
+    print(f'hooks       {elapsed / requests * 1e6:6.1f} us per request with {queries} queries')
+
+
+def client_requests(requests):
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    client = app_module.app.test_client()
+    for _ in range(200):
+        client.get('/api/check-auth')
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get('/api/check-auth')
+    elapsed = time.perf_counter() - start
+    print(f"METRICS={os.environ['METRICS']}   {elapsed / requests * 1e6:6.1f} us per GET /api/check-auth")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=3)
+    parser.add_argument('--mode', choices=['hooks', 'requests'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode == 'hooks':
+        hooks(args.requests, args.queries)
+        return
+    if args.mode == 'requests':
+        client_requests(args.requests)
+        return
+
+    runs = [('hooks', '1'), ('requests', '0'), ('requests', '1')]
+    for mode, enabled in runs:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, METRICS=enabled, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            subprocess.run([sys.executable, __file__, '--mode', mode, '--requests', str(args.requests),
+                            '--queries', str(args.queries)], env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
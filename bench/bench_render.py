@@ -0,0 +1,65 @@
+"""Chat product-list rendering: ``+=`` loop versus ``ProductRenderer``.
+
+Renders synthetic product dicts three ways: the old per-row ``+=`` loop, the
+renderer with no effective cap (join only), and the renderer with the default
+200-row cap.  Reports time and peak memory allocated while rendering.
+
+    python bench/bench_render.py [--sizes 1000 10000 50000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from seed_products import synthetic_products
+from product_render import ProductRenderer
+
+
+def product_line(product):
+    return f"- {product['name']}: ${product['price']}, {product['stock']} in stock, {product['category']}\n"
+
+
+def concat(products):
+    response = "Here are all products:\n\n"
+    for product in products:
+        response += f"- {product['name']}: ${product['price']}, {product['stock']} in stock, {product['category']}\n"
+    return response
+
+
+def measure(fn, products, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(products)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    text = fn(products)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best * 1000, peak / 1024, len(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        products = list(synthetic_products(size))
+        uncapped = ProductRenderer(max_rows=size)
+        capped = ProductRenderer()
+        modes = [
+            ('+= loop', concat),
+            ('join', lambda rows: uncapped.render("Here are all products:\n\n", rows, product_line)),
+            ('join, capped', lambda rows: capped.render("Here are all products:\n\n", rows, product_line)),
+        ]
+        for name, fn in modes:
+            ms, kib, chars = measure(fn, products, args.repeat)
+            print(f'{size:>7,} products  {name:<13} {ms:8.2f} ms  peak {kib:8.0f} KiB  {chars:>9,} chars')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Chat command throughput in ``app.py`` with the response cache on and off.
+
+A scratch SQLite database is seeded with synthetic products, then a skewed
+stream of read commands (category browsing, searches and the occasional
+``show all products``) is dispatched through ``handle_product_query``.  A
+``--write-ratio`` fraction of the stream is a stock decrement instead, which
+bumps the catalog version and invalidates every cached response.  Each mode
+runs in its own subprocess because ``app.py`` reads its settings at import
+time.
+
+    python bench/bench_response_cache.py [--products 5000] [--messages 20000] [--write-ratio 0.01]
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from seed_products import BRANDS, CATEGORIES, NOUNS, seed, synthetic_products  # noqa: E402
+
+
+def workload(products, messages, write_ratio, rng):
+    reads = ([f'category {c}' for c in CATEGORIES] + [f'search {w}' for w in BRANDS + NOUNS]
+             + ['show all products'])
+    # Zipf-like popularity: a few commands make up most of the traffic
+    weights = [1 / (rank + 1) for rank in range(len(reads))]
+    names = [row['name'] for row in synthetic_products(products)]
+    stream = []
+    for message in rng.choices(reads, weights, k=messages):
+        if rng.random() < write_ratio:
+            stream.append((True, rng.choice(names)))
+        else:
+            stream.append((False, message))
+    return stream
+
+
+def run(products, messages, write_ratio):
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    with app_module.app.app_context():
+        seed(app_module.db, app_module.Product, products)
+        stream = workload(products, messages, write_ratio, random.Random(42))
+        app_module.catalog.all()  # load the index before timing
+        start = time.perf_counter()
+        for is_write, value in stream:
+            if is_write:
+                try:
+                    app_module.stock.take({value: 1})
+                except Exception:
+                    pass  # sold out
+            else:
+                app_module.handle_product_query(value)
+        elapsed = time.perf_counter() - start
+
+    cache = app_module.chat_responses
+    line = f'{"cache on" if cache else "cache off":<9} {messages / elapsed:8.0f} messages/sec'
+    if cache is not None:
+        stats = cache.stats()
+        line += (f'  hit rate {stats["hit_rate"]:.1%}  {stats["entries"]} entries'
+                 f'  {stats["bytes"] / 1024:.0f} KiB  {stats["version"]} invalidations')
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--write-ratio', type=float, default=0.01)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run(args.products, args.messages, args.write_ratio)
+        return
+
+    for size in ('0', '1024'):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, CHAT_RESPONSE_CACHE_SIZE=size,
+                       DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            subprocess.run([sys.executable, __file__, '--child', '--products', str(args.products),
+                            '--messages', str(args.messages), '--write-ratio', str(args.write_ratio)],
+                           env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Micro-benchmark for chat command parsing and dispatch.
+
+Measures the per-message cost of ``CommandRouter.dispatch`` for the command
+set registered by ``app.py`` and for the same set with 100 synthetic commands
+added.  Handlers are replaced by no-ops so only routing is timed.
+
+    python bench/bench_router.py [--number 200000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from command_router import CommandRouter
+
+# Mirrors the command table registered by app.py (handlers are irrelevant here).
+APP_COMMANDS = [
+    ('welcome', None, ('hi', 'hello', 'hey', 'start'),
+     None),
+    ('add', 'add product:', (),
+     r'\s*(?P<name>[^,]+),\s*(?P<price>\d+\.?\d*),\s*(?P<stock>\d+),\s*(?P<category>[^,]+)'),
+    ('update', 'update product:', (),
+     r'\s*(?P<name>[^,]+),\s*(?P<field>[^,]+),\s*(?P<value>[^,]+)'),
+    ('delete', 'delete product:', (), None),
+    ('list', None, ('show all products', 'list products', 'products'), None),
+    ('search', 'search', (), None),
+    ('category', 'category', (), None),
+]
+
+MESSAGES = [
+    'hello',
+    'Add product: Laptop, 999.99, 10, Electronics',
+    'update product: laptop, price, 899.99',
+    'delete product: laptop',
+    'show all products',
+    'search iphone',
+    'category electronics',
+    'what can you do?',
+]
+
+
+def noop(*args):
+    return None
+
+
+def build_router(synthetic=0):
+    router = CommandRouter()
+    for name, prefix, exact, pattern in APP_COMMANDS:
+        router.add(name, noop, prefix=prefix, exact=exact, pattern=pattern)
+    for i in range(synthetic):
+        router.add(f'synthetic{i}', noop, prefix=f'synthetic command {i}:',
+                   pattern=r'\s*(?P<arg>.+)')
+    router.fallback(noop)
+    return router
+
+
+def run(router, number):
+    def loop():
+        for message in MESSAGES:
+            router.dispatch(message)
+    seconds = timeit.timeit(loop, number=number)
+    return seconds / (number * len(MESSAGES)) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=200000)
+    args = parser.parse_args()
+
+    for label, synthetic in (('current command set', 0), ('+100 synthetic commands', 100)):
+        router = build_router(synthetic)
+        ns = run(router, args.number)
+        print(f"{label:<26} {len(router.commands):>4} commands  {ns:8.0f} ns/message")
+
+
+if __name__ == '__main__':
+    main()
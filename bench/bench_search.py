@@ -0,0 +1,66 @@
+"""p50/p99 product search latency: ``ilike '%term%'`` scan versus FTS5.
+
+Seeds a scratch SQLite database (1M products by default) and runs the same
+search terms through the previous ``ilike`` query and through
+``ProductSearch.search``.  Both return at most ``--limit`` rows.
+
+    python bench/bench_search.py [--size 1000000] [--requests 100] [--limit 50]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from seed_products import seed  # noqa: E402
+
+TERMS = ['lamp', 'zephyr camera', 'acm', 'kettle 4242', 'drone 99']
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[max(int(len(samples) * 0.99) - 1, 0)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=1000000)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ['CATALOG_INDEX'] = '0'
+    sys.path.insert(0, ROOT)
+    import app as app_module
+    from app import Product, db, product_search
+
+    def ilike(term):
+        return Product.query.filter(Product.name.ilike(f'%{term}%')).limit(args.limit).all()
+
+    def fts(term):
+        return product_search.search(term, args.limit)
+
+    with app_module.app.app_context():
+        start = time.perf_counter()
+        seed(db, Product, args.size)
+        print(f'seeded {args.size:,} products in {time.perf_counter() - start:.1f}s '
+              f'(fts5 available: {product_search.available})')
+        for label, fn in (('ilike', ilike), ('fts5', fts)):
+            samples = []
+            for i in range(args.requests):
+                term = TERMS[i % len(TERMS)]
+                start = time.perf_counter()
+                fn(term)
+                samples.append((time.perf_counter() - start) * 1000)
+            p50, p99 = percentiles(samples)
+            print(f'{label:<6} p50 {p50:9.3f} ms   p99 {p99:9.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
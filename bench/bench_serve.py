@@ -0,0 +1,213 @@
+"""Mixed chat load: the current server and SQLite settings versus ``serve.py``.
+
+Three setups are started in turn on a local port, each against a fresh
+scratch SQLite database seeded with synthetic products:
+
+* ``current``: ``app.run(threaded=True)`` with SQLite's default settings
+  (rollback journal, ``synchronous=FULL``, 2 MiB cache, no mmap);
+* ``wal``: the same single process with the ``sqlite_pragmas`` defaults;
+* ``serve xN``: ``serve.py`` with ``--workers`` processes and the defaults.
+
+An asyncio client signs in ``--connections`` users, then each sends requests
+back to back for ``--seconds``.  Reads are chat searches, category browsing
+and product pages.  A ``--write-ratio`` share are writes: chat
+``update product`` commands, stock decrements and chat history appends.
+Reports reads/sec and writes/sec with their p99 latency, and failed requests.
+The client shares the box with the server.
+
+Most chat reads are answered from the in-process catalog index, so the HTTP
+numbers mostly measure Python.  A second part takes HTTP out: in one process
+per setting, ``--db-threads`` reader threads run full-text product searches
+and writer threads run stock decrements, straight against SQLite, with the
+``current`` settings and then the defaults.
+
+    python bench/bench_serve.py [--connections 50] [--seconds 10] [--workers 2 4] [--write-ratio 0.2]
+"""
+import argparse
+import asyncio
+import collections
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench_asgi import free_port, percentile, sign_in, wait_until_up
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from seed_products import BRANDS, CATEGORIES, NOUNS, seed, synthetic_products  # noqa: E402
+
+SQLITE_DEFAULTS = {'SQLITE_JOURNAL_MODE': 'delete', 'SQLITE_SYNCHRONOUS': 'full',
+                   'SQLITE_CACHE_SIZE': '2000', 'SQLITE_MMAP_SIZE': '0'}
+
+
+def serve(port, products, workers):
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    with app_module.app.app_context():
+        seed(app_module.db, app_module.Product, products)
+    if workers:
+        import serve
+        serve.serve_prefork(app_module, '127.0.0.1', port, workers)
+    else:
+        app_module.app.run(port=port, threaded=True)
+
+
+def db_load(products, seconds, threads):
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    with app_module.app.app_context():
+        seed(app_module.db, app_module.Product, products)
+    names = [row['name'] for row in synthetic_products(products)]
+    counts = collections.Counter()
+    deadline = time.monotonic() + seconds
+
+    def reader(n):
+        rng = random.Random(n)
+        with app_module.app.app_context():
+            while time.monotonic() < deadline:
+                app_module.product_search.search(f'{rng.choice(BRANDS)} {rng.choice(NOUNS)}')
+                app_module.db.session.rollback()
+                counts['reads'] += 1
+
+    def writer(n):
+        rng = random.Random(-n)
+        with app_module.app.app_context():
+            while time.monotonic() < deadline:
+                try:
+                    app_module.stock.take({rng.choice(names): 1})
+                    counts['writes'] += 1
+                except Exception as e:
+                    counts[type(e).__name__] += 1
+
+    workers = [threading.Thread(target=reader, args=(n,)) for n in range(threads)]
+    workers += [threading.Thread(target=writer, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    errors = {k: v for k, v in counts.items() if k not in ('reads', 'writes')}
+    print(f"  reads {counts['reads'] / seconds:8.0f}/s  writes {counts['writes'] / seconds:8.0f}/s  "
+          f"errors {errors or 0}")
+
+
+def reads(client, rng):
+    return rng.choice([
+        lambda: client.post('/api/chat', json={'message': f'search {rng.choice(BRANDS)} {rng.choice(NOUNS)}'}),
+        lambda: client.post('/api/chat', json={'message': f'category {rng.choice(CATEGORIES)}'}),
+        lambda: client.get('/api/products', params={'after': rng.randrange(1000), 'limit': 20}),
+    ])()
+
+
+async def client_loop(client, index, names, write_ratio, deadline, results):
+    import httpx
+
+    rng = random.Random(index)
+    seq = 0
+    while time.monotonic() < deadline:
+        is_write = rng.random() < write_ratio
+        start = time.perf_counter()
+        try:
+            if not is_write:
+                response = await reads(client, rng)
+            else:
+                kind = rng.randrange(3)
+                if kind == 0:
+                    message = f'update product: {rng.choice(names)}, stock, {rng.randrange(1, 500)}'
+                    response = await client.post('/api/chat', json={'message': message})
+                elif kind == 1:
+                    response = await client.put(f'/api/products/reduce-stock/{rng.choice(names)}',
+                                                json={'amount': 1})
+                else:
+                    response = await client.post('/api/chat/history/append',
+                                                 json={'since': seq, 'messages': [{'text': 'hello'}]})
+                    if response.status_code == 200:
+                        seq = response.json()['seq']
+            # A sold-out product is a valid answer, not a failure
+            outcome = 200 if response.status_code == 400 and is_write else response.status_code
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        if outcome == 200:
+            results['writes' if is_write else 'reads'].append((time.perf_counter() - start) * 1000)
+        else:
+            results['failed'][outcome] += 1
+
+
+async def load(base, connections, seconds, products, write_ratio):
+    await wait_until_up(base)
+    names = [row['name'] for row in synthetic_products(products)]
+    results = {'reads': [], 'writes': [], 'failed': collections.Counter()}
+    clients = await asyncio.gather(*(sign_in(base, n, results['failed']) for n in range(connections)))
+    deadline = time.monotonic() + seconds
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(client_loop(client, n, names, write_ratio, deadline, results)
+                               for n, client in enumerate(clients)))
+    finally:
+        for client in clients:
+            await client.aclose()
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--db-threads', type=int, default=4)
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--db-child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.db_child:
+        db_load(args.products, args.seconds, args.db_threads)
+        return
+    if args.serve is not None:
+        serve(args.port, args.products, args.serve)
+        return
+
+    setups = [('current', 0, SQLITE_DEFAULTS), ('wal', 0, {})]
+    setups += [(f'serve x{n}', n, {}) for n in args.workers]
+    for name, workers, settings in setups:
+        with tempfile.TemporaryDirectory() as tmp:
+            port = free_port()
+            env = dict(os.environ, BCRYPT_ROUNDS='4', PASSWORD_HASH_QUEUE='1000', **settings,
+                       DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            server = subprocess.Popen(
+                [sys.executable, __file__, '--serve', str(workers), '--port', str(port),
+                 '--products', str(args.products)],
+                env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                results, elapsed = asyncio.run(load(f'http://127.0.0.1:{port}', args.connections,
+                                                    args.seconds, args.products, args.write_ratio))
+            finally:
+                server.terminate()
+                server.wait()
+        line = f'{name:<10}'
+        for kind in ('reads', 'writes'):
+            samples = sorted(results[kind])
+            p99 = percentile(samples, 0.99) if samples else float('nan')
+            line += f'  {kind} {len(samples) / elapsed:6.0f}/s p99 {p99:7.1f} ms'
+        print(f"{line}  failed {dict(results['failed']) or 0}")
+
+    print(f'Database only, {args.db_threads} reader and {args.db_threads} writer threads:')
+    for name, settings in (('current', SQLITE_DEFAULTS), ('wal', {})):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, **settings, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            print(f'{name:<10}', end='', flush=True)
+            subprocess.run([sys.executable, __file__, '--db-child', '--products', str(args.products),
+                            '--seconds', str(args.seconds), '--db-threads', str(args.db_threads)],
+                           env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Worker boot time of ``backend/app.py``: import, ``create_app()`` and the
+first request, on a new, an up-to-date and a pre-migration database.
+
+Every boot is a fresh subprocess against a scratch SQLite database:
+
+* ``new``: no database file yet, so ``create_app()`` creates the schema.
+* ``current``: a database seeded with ``--products`` products and
+  ``--messages`` messages per user by an earlier boot; ``create_app()``
+  finds no pending migrations.
+* ``legacy``: the same database with the indexes and the ``schema_migrations``
+  table removed, as a ``chatbot.db`` from before ``migrations.py``; the first
+  boot applies the migrations and the second finds none pending.
+
+Each scenario boots twice, and the product count shows the data survives.
+
+    python bench/bench_startup.py [--products 100000] [--users 100] [--messages 200]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_indexes import MIGRATED_INDEXES, seed_backend  # noqa: E402
+
+
+def boot(label):
+    start = time.perf_counter()
+    sys.path.insert(0, os.path.join(ROOT, 'backend'))
+    import app as backend
+    imported = time.perf_counter()
+    backend.create_app()
+    set_up = time.perf_counter()
+    backend.app.test_client().get('/api/chat/history')
+    served = time.perf_counter()
+    with backend.app.app_context():
+        products = backend.Product.query.count()
+    print(f'{label:<14} import {(imported - start) * 1000:7.1f} ms  create_app {(set_up - imported) * 1000:7.1f} ms  '
+          f'first request {(served - set_up) * 1000:6.1f} ms  {products:>7} products')
+
+
+def seed(products, users, messages, legacy):
+    sys.path.insert(0, os.path.join(ROOT, 'backend'))
+    import app as backend
+
+    backend.create_app()
+    with backend.app.app_context():
+        seed_backend(backend.db, backend, products, users, messages)
+        if legacy:
+            with backend.db.engine.begin() as conn:
+                for name in MIGRATED_INDEXES:
+                    conn.exec_driver_sql(f'DROP INDEX IF EXISTS {name}')
+                conn.exec_driver_sql('DROP TABLE schema_migrations')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--boot', help=argparse.SUPPRESS)
+    parser.add_argument('--seed', choices=['current', 'legacy'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.boot:
+        boot(args.boot)
+        return
+    if args.seed:
+        seed(args.products, args.users, args.messages, args.seed == 'legacy')
+        return
+
+    for scenario in ('new', 'current', 'legacy'):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                       SECRET_KEY=os.getenv('SECRET_KEY', 'bench'))
+            if scenario != 'new':
+                subprocess.run([sys.executable, __file__, '--seed', scenario, '--products', str(args.products),
+                                '--users', str(args.users), '--messages', str(args.messages)], env=env, check=True)
+            for n in (1, 2):
+                subprocess.run([sys.executable, __file__, '--boot', f'{scenario} boot {n}'], env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Concurrent ``reduce-stock`` on a single hot product.
+
+``--clients`` threads each send ``--requests`` one-unit ``PUT
+/api/products/reduce-stock/<name>`` calls through the Flask test client
+against a product that starts with ``--stock`` units (by default fewer than
+the total number of requests, so the product sells out mid-run).  The run
+checks that the successful decrements exactly account for the final stock,
+i.e. nothing was oversold and no update was lost, and reports decrements/sec.
+
+Runs in a subprocess against a scratch SQLite database because ``app.py``
+reads its settings at import time.
+
+    python bench/bench_stock.py [--clients 64] [--requests 50] [--stock 2000] [--dir /path/on/real/disk]
+"""
+import argparse
+import collections
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(clients, requests, stock):
+    sys.path.insert(0, ROOT)
+    from app import app, db, Product
+
+    with app.app_context():
+        db.session.add(Product(name='hot item', price=9.99, category='bench', stock=stock))
+        db.session.commit()
+
+    statuses = collections.Counter()
+    lock = threading.Lock()
+
+    def client_loop(barrier):
+        client = app.test_client()
+        seen = collections.Counter()
+        barrier.wait()
+        for _ in range(requests):
+            seen[client.put('/api/products/reduce-stock/hot item', json={'amount': 1}).status_code] += 1
+        with lock:
+            statuses.update(seen)
+
+    barrier = threading.Barrier(clients + 1)
+    threads = [threading.Thread(target=client_loop, args=(barrier,)) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        final = Product.query.filter_by(name='hot item').one().stock
+    sold = statuses[200]
+    ok = final >= 0 and sold + final == stock and sold == min(stock, clients * requests)
+    print(f'{clients} clients x {requests} requests, initial stock {stock}')
+    print(f'  responses   {dict(sorted(statuses.items()))}')
+    print(f'  final stock {final}  ({sold} sold) -> {"OK" if ok else "MISMATCH"}')
+    print(f'  {sold / elapsed:8.0f} decrements/sec  {clients * requests / elapsed:8.0f} requests/sec')
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--stock', type=int, default=2000)
+    parser.add_argument('--dir', help='directory for the scratch database (defaults to a temp dir)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.exit(0 if run(args.clients, args.requests, args.stock) else 1)
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        result = subprocess.run([sys.executable, __file__, '--child', '--clients', str(args.clients),
+                                 '--requests', str(args.requests), '--stock', str(args.stock)], env=env)
+    sys.exit(result.returncode)
+
+
+if __name__ == '__main__':
+    main()
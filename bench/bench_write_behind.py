@@ -0,0 +1,74 @@
+"""Chat turns/sec in ``backend/app.py`` with and without message write-behind.
+
+Each mode runs in its own subprocess against a scratch SQLite database
+(``backend/app.py`` reads its settings once per process, in ``create_app()``).  ``--clients`` threads
+each register a user and send ``--turns`` chat messages through the Flask
+test client; every turn persists a user and an assistant ``Message``.
+
+    python bench/bench_write_behind.py [--clients 8] [--turns 200] [--dir /path/on/real/disk]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_mode(clients, turns):
+    sys.path.insert(0, os.path.join(ROOT, 'backend'))
+    import app as backend
+
+    backend.create_app()
+
+    def client_loop(i, barrier):
+        client = backend.app.test_client()
+        client.post('/api/register', json={'username': f'user{i}', 'email': f'user{i}@example.com',
+                                           'password': 'secret'})
+        barrier.wait()
+        for _ in range(turns):
+            client.post('/api/chat', json={'message': 'help'})
+
+    barrier = threading.Barrier(clients + 1)
+    threads = [threading.Thread(target=client_loop, args=(i, barrier)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    if backend.message_writer is not None:
+        backend.message_writer.flush()
+    elapsed = time.perf_counter() - start
+
+    with backend.app.app_context():
+        stored = backend.Message.query.count()
+    mode = 'write-behind' if backend.message_writer is not None else 'commit per turn'
+    print(f'{mode:<16} {clients * turns / elapsed:8.0f} turns/sec  ({stored} messages stored)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--turns', type=int, default=200)
+    parser.add_argument('--dir', help='directory for the scratch database (defaults to a temp dir)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_mode(args.clients, args.turns)
+        return
+
+    for enabled in ('0', '1'):
+        with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+            env = dict(os.environ, MESSAGE_WRITE_BEHIND=enabled,
+                       DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            subprocess.run([sys.executable, __file__, '--child', '--clients', str(args.clients),
+                            '--turns', str(args.turns)], env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
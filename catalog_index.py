@@ -0,0 +1,301 @@
+"""Process-local read index over the product catalog.
+
+The index keeps a ``to_dict()`` snapshot of every product keyed by id, plus
+lookups by name, by category and by lowercase name token.  It is loaded from
+the database on first use and kept current by a ``commit_watch.CommitWatch``:
+rows flushed in a transaction are applied when it commits, and a commit that
+ran a bulk ``INSERT``/``UPDATE``/``DELETE`` against the model marks the index
+for a reload.  Code that changes rows with Core statements and knows the new
+values (e.g. from ``RETURNING``) can call ``stage_update``, which patches the
+cached row on commit without a reload.  Commits made by other processes are
+picked up through ``refresh()``, fed by ``change_log.ChangeLog``.
+
+When the index is disabled every read goes straight to the database, which
+keeps the on/off behaviour identical apart from latency.
+
+An optional ``fuzzy`` secondary index (see ``fuzzy_index.FuzzyNameIndex``) is
+maintained alongside the others; it is the only structure that has no
+database equivalent, so fuzzy lookups load the index even when ``enabled`` is
+False.
+
+List reads accept ``after``/``limit`` for keyset pagination on ``id``: only
+products with an id greater than ``after`` are returned, at most ``limit`` of
+them, in id order.
+"""
+import bisect
+import threading
+
+from commit_watch import CommitWatch
+
+
+class _Patch(dict):
+    """Column values staged by ``stage_update``, merged into the cached row."""
+
+
+class CatalogIndex:
+    def __init__(self, model, enabled=True, fuzzy=None):
+        self.model = model
+        self.enabled = enabled
+        self.fuzzy = fuzzy
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._rows = {}          # id -> product dict
+        self._ids = []           # sorted ids, for keyset pagination
+        self._by_name = {}       # name -> id
+        self._by_category = {}   # category -> set(ids)
+        self._by_token = {}      # lowercase name token -> set(ids)
+        self._watch = CommitWatch(model, self._apply, self.invalidate,
+                                  snapshot=lambda obj, deleted: (obj.id, None if deleted else obj.to_dict()))
+
+    def init_app(self, db):
+        """Keep the index current with the commits made through ``db.session``."""
+        self.db = db
+        self.listen(db.session)
+
+    def listen(self, target):
+        self._watch.listen(target)
+
+    @property
+    def loaded(self):
+        """True once reads can be answered from memory without a query."""
+        return self.enabled and self._loaded
+
+    # -- maintenance -------------------------------------------------------
+
+    def invalidate(self):
+        """Drop the index; it is rebuilt on the next read."""
+        with self._lock:
+            self._loaded = False
+            self._rows = {}
+            self._ids = []
+            self._by_name = {}
+            self._by_category = {}
+            self._by_token = {}
+            if self.fuzzy is not None:
+                self.fuzzy.clear()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for product in self.model.query.order_by(self.model.id).yield_per(1000):
+                self._put(product.to_dict())
+            self._loaded = True
+
+    def _put(self, row):
+        old = self._rows.get(row['id'])
+        renamed = old is None or old['name'] != row['name']
+        if old is not None:
+            self._remove(old, keep_fuzzy=not renamed)
+        if self.fuzzy is not None and renamed:
+            self.fuzzy.add(row['id'], row['name'])
+        if not self._ids or row['id'] > self._ids[-1]:
+            self._ids.append(row['id'])
+        else:
+            bisect.insort(self._ids, row['id'])
+        self._rows[row['id']] = row
+        self._by_name[row['name']] = row['id']
+        self._by_category.setdefault(row['category'], set()).add(row['id'])
+        for token in row['name'].lower().split():
+            self._by_token.setdefault(token, set()).add(row['id'])
+
+    def _remove(self, row, keep_fuzzy=False):
+        self._rows.pop(row['id'], None)
+        i = bisect.bisect_left(self._ids, row['id'])
+        if i < len(self._ids) and self._ids[i] == row['id']:
+            del self._ids[i]
+        if self._by_name.get(row['name']) == row['id']:
+            del self._by_name[row['name']]
+        self._discard(self._by_category, row['category'], row['id'])
+        for token in row['name'].lower().split():
+            self._discard(self._by_token, token, row['id'])
+        if self.fuzzy is not None and not keep_fuzzy:
+            self.fuzzy.remove(row['id'])
+
+    @staticmethod
+    def _discard(mapping, key, product_id):
+        ids = mapping.get(key)
+        if ids is not None:
+            ids.discard(product_id)
+            if not ids:
+                del mapping[key]
+
+    def refresh(self, ids):
+        """Re-read the products with ``ids`` after they were changed outside
+        this process's sessions (see ``change_log.ChangeLog``); None drops
+        the whole index instead."""
+        if not self._loaded:
+            return
+        if ids is None:
+            self.invalidate()
+            return
+        found = {p.id: p.to_dict() for p in self.model.query.filter(self.model.id.in_(ids))}
+        with self._lock:
+            for product_id in ids:
+                row = found.get(product_id)
+                if row is not None:
+                    self._put(row)
+                elif product_id in self._rows:
+                    self._remove(self._rows[product_id])
+
+    def stage_update(self, session, product_id, **changes):
+        """Record column values written outside the ORM, applied on commit."""
+        self._watch.stage(session, (product_id, _Patch(changes)))
+
+    def _apply(self, changes):
+        """Apply the ``(id, row)`` changes of a commit; ``row`` is None for a
+        deleted product."""
+        if not self._loaded:
+            return
+        with self._lock:
+            for product_id, row in changes:
+                old = self._rows.get(product_id)
+                if isinstance(row, _Patch):
+                    if old is not None:
+                        self._put(dict(old, **row))
+                elif row is None:
+                    if old is not None:
+                        self._remove(old)
+                else:
+                    self._put(row)
+
+    # -- reads -------------------------------------------------------------
+
+    def _query_page(self, query, after, limit):
+        if after is not None:
+            query = query.filter(self.model.id > after)
+        query = query.order_by(self.model.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return [p.to_dict() for p in query]
+
+    def all(self, after=None, limit=None):
+        """Return every product, ordered by id."""
+        if not self.enabled:
+            return self._query_page(self.model.query, after, limit)
+        self._ensure_loaded()
+        with self._lock:
+            return self._page(self._ids, after, limit)
+
+    def iter_all(self, batch=500):
+        """Yield every product in id order, one keyset page of ``batch`` at a time."""
+        after = None
+        while True:
+            page = self.all(after, batch)
+            yield from page
+            if len(page) < batch:
+                return
+            after = page[-1]['id']
+
+    def count(self):
+        if not self.enabled:
+            return self.model.query.count()
+        self._ensure_loaded()
+        return len(self._ids)
+
+    def get(self, product_id):
+        if self.enabled:
+            self._ensure_loaded()
+            row = self._rows.get(product_id)
+            if row is not None:
+                return row
+        product = self.db.session.get(self.model, product_id)
+        return self._remember(product)
+
+    def get_many(self, ids):
+        """Rows for ``ids`` in the given order; unknown ids are skipped."""
+        if self.enabled:
+            self._ensure_loaded()
+            with self._lock:
+                rows = [self._rows.get(i) for i in ids]
+            if all(row is not None for row in rows):
+                return rows
+        found = {p.id: self._remember(p) for p in self.model.query.filter(self.model.id.in_(ids))}
+        return [found[i] for i in ids if i in found]
+
+    def get_by_name(self, name):
+        if self.enabled:
+            self._ensure_loaded()
+            product_id = self._by_name.get(name)
+            if product_id is not None:
+                return self._rows.get(product_id)
+        product = self.model.query.filter_by(name=name).first()
+        return self._remember(product)
+
+    def _remember(self, product):
+        """Cache a row fetched on an index miss (e.g. written by another process)."""
+        if product is None:
+            return None
+        row = product.to_dict()
+        if self.enabled and self._loaded:
+            with self._lock:
+                self._put(row)
+        return row
+
+    def by_category(self, category, after=None, limit=None):
+        """Products whose category equals ``category``."""
+        if not self.enabled:
+            return self._query_page(self.model.query.filter_by(category=category), after, limit)
+        self._ensure_loaded()
+        with self._lock:
+            ids = sorted(self._by_category.get(category, ()))
+            return self._page(ids, after, limit)
+
+    def category_contains(self, term, after=None, limit=None):
+        """Products whose category contains ``term``, case-insensitively."""
+        if not self.enabled:
+            query = self.model.query.filter(self.model.category.ilike(f'%{term}%'))
+            return self._query_page(query, after, limit)
+        self._ensure_loaded()
+        term = term.lower()
+        with self._lock:
+            ids = set()
+            for category, category_ids in self._by_category.items():
+                if term in category.lower():
+                    ids.update(category_ids)
+            return self._page(sorted(ids), after, limit)
+
+    def search_name(self, term, after=None, limit=None):
+        """Products whose name contains ``term``, case-insensitively."""
+        if not self.enabled:
+            query = self.model.query.filter(self.model.name.ilike(f'%{term}%'))
+            return self._query_page(query, after, limit)
+        self._ensure_loaded()
+        term = term.lower()
+        words = term.split()
+        with self._lock:
+            if not words:
+                return self._page(self._ids, after, limit)
+            # Every whitespace-free run of the term sits inside one name token,
+            # so the tokens containing the longest word bound the candidates.
+            word = max(words, key=len)
+            ids = set()
+            for token, token_ids in self._by_token.items():
+                if word in token:
+                    ids.update(token_ids)
+            ids = sorted(ids)
+            start = 0 if after is None else bisect.bisect_right(ids, after)
+            rows = []
+            for product_id in ids[start:]:
+                row = self._rows[product_id]
+                if term in row['name'].lower():
+                    rows.append(row)
+                    if limit is not None and len(rows) == limit:
+                        break
+            return rows
+
+    def fuzzy_search(self, term, limit=10):
+        """Products whose names are most similar to ``term``, best first."""
+        if self.fuzzy is None:
+            return []
+        self._ensure_loaded()
+        with self._lock:
+            return [self._rows[key] for key, score in self.fuzzy.query(term, limit)]
+
+    def _page(self, ids, after, limit):
+        """Rows for the sorted ``ids`` that follow ``after``, at most ``limit``."""
+        start = 0 if after is None else bisect.bisect_right(ids, after)
+        end = None if limit is None else start + limit
+        return [self._rows[i] for i in ids[start:end]]
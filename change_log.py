@@ -0,0 +1,102 @@
+"""Cross-process feed of changed rows, recorded by SQLite triggers.
+
+``catalog_index.CatalogIndex`` and ``response_cache.ResponseCache`` see the
+commits made through their own process's sessions, and nothing else.  With
+several worker processes on one database file (see ``serve.py``), or a script
+writing to it, the others would keep serving the old rows.
+
+``ChangeLog`` installs triggers that append the id of every row inserted,
+updated or deleted in a table to ``<table>_change``.  ``poll()`` reads the
+entries past the last one this process has seen, at most once every
+``sync_interval`` seconds, and passes the changed ids to each subscriber.
+Writes made by this process come back too, which only costs a re-read of
+rows that are already current.
+
+Entries older than ``retention`` seconds are pruned (the newest is always
+kept).  A process that fell behind further than that, or that has more than
+``max_batch`` entries to catch up on, gets None instead of ids, meaning "the
+whole table may have changed".  SQLite admits one writer at a time, so ids are
+assigned in commit order and a gap can only come from pruning.
+
+If the database is not SQLite, ``available`` stays False and ``poll`` does
+nothing.
+"""
+import threading
+import time
+
+from sqlalchemy import text
+
+
+class ChangeLog:
+    def __init__(self, table, sync_interval=1.0, retention=300, max_batch=1000):
+        self.table = table
+        self.log = f'{table}_change'
+        self.sync_interval = sync_interval
+        self.retention = retention
+        self.max_batch = max_batch
+        self.available = False
+        self._subscribers = []
+        self._last_id = 0
+        self._next_poll = 0.0
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, db):
+        """Create the log table and triggers.  Must run after ``db.create_all()``."""
+        self.db = db
+        if db.engine.dialect.name != 'sqlite':
+            return
+        with db.engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {self.log} ("
+                f"id INTEGER PRIMARY KEY AUTOINCREMENT, row_id INTEGER NOT NULL, "
+                f"at REAL NOT NULL DEFAULT (julianday('now')))"))
+            for suffix, event, row in (('ai', 'INSERT', 'new'), ('au', 'UPDATE', 'new'), ('ad', 'DELETE', 'old')):
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS {self.log}_{suffix} AFTER {event} ON {self.table} BEGIN "
+                    f"INSERT INTO {self.log}(row_id) VALUES ({row}.id); END"))
+            self._last_id = conn.execute(text(f"SELECT coalesce(max(id), 0) FROM {self.log}")).scalar()
+        self.available = True
+
+    def subscribe(self, callback):
+        """Call ``callback(ids)`` with each batch of changed row ids, or
+        ``callback(None)`` when the changes could not all be listed."""
+        self._subscribers.append(callback)
+        return callback
+
+    def due(self):
+        return self.available and time.monotonic() >= self._next_poll
+
+    def poll(self, force=False):
+        """Pass changes committed since the last poll to the subscribers."""
+        if not (force or self.due()) or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_poll = time.monotonic() + self.sync_interval
+            with self.db.engine.connect() as conn:
+                rows = conn.execute(
+                    text(f"SELECT id, row_id FROM {self.log} WHERE id > :last ORDER BY id LIMIT :limit"),
+                    {'last': self._last_id, 'limit': self.max_batch + 1},
+                ).all()
+                if rows and (rows[0].id != self._last_id + 1 or len(rows) > self.max_batch):
+                    ids = None
+                    self._last_id = conn.execute(text(f"SELECT max(id) FROM {self.log}")).scalar()
+                elif rows:
+                    ids = sorted({row.row_id for row in rows})
+                    self._last_id = rows[-1].id
+            if rows:
+                for callback in self._subscribers:
+                    callback(ids)
+            if time.monotonic() >= self._next_prune:
+                self._prune()
+        finally:
+            self._lock.release()
+
+    def _prune(self):
+        with self.db.engine.begin() as conn:
+            conn.execute(
+                text(f"DELETE FROM {self.log} WHERE at < julianday('now') - :days "
+                     f"AND id < (SELECT max(id) FROM {self.log})"),
+                {'days': self.retention / 86400},
+            )
+        self._next_prune = time.monotonic() + self.retention / 2
@@ -0,0 +1,126 @@
+"""Check the SQL statement counts of the chat commands and product routes.
+
+Runs ``app.py`` through its test client against a scratch SQLite database
+with ``query_profiler`` in strict mode.  Each scenario (a chat command or a
+``/api/products*`` request) is budgeted in ``query_budgets.json`` by the number
+of statements it ran when the budget was last recorded; a scenario that now
+runs more makes the request fail with ``QueryBudgetExceeded`` and the script
+exit with status 1.  Statements a scenario repeats are listed as well.
+
+The scenarios run twice and only the second pass is checked, so one-off work
+such as loading the catalog index does not count.
+
+Usage:
+    python check_query_budgets.py            # check, for CI
+    python check_query_budgets.py --update   # record the current counts as budgets
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BUDGETS = os.path.join(ROOT, 'query_budgets.json')
+
+# (name, method, path, JSON body); {n} is the pass number
+SCENARIOS = [
+    ('register', 'POST', '/api/register',
+     {'username': 'budget{n}', 'email': 'budget{n}@example.com', 'password': 'secret'}),
+    ('chat add', 'POST', '/api/chat', {'message': 'add product: Budget Lamp {n}, 20, 5, Home'}),
+    ('chat list', 'POST', '/api/chat', {'message': 'show all products'}),
+    ('chat search', 'POST', '/api/chat', {'message': 'search lamp'}),
+    ('chat category', 'POST', '/api/chat', {'message': 'category Home'}),
+    ('chat update', 'POST', '/api/chat', {'message': 'update product: Budget Lamp {n}, stock, 9'}),
+    ('chat delete', 'POST', '/api/chat', {'message': 'delete product: Budget Lamp {n}'}),
+    ('chat help', 'POST', '/api/chat', {'message': 'what can you do'}),
+    ('products page', 'GET', '/api/products?limit=20', None),
+    ('products search', 'GET', '/api/products/search?name=lamp', None),
+    ('products category', 'GET', '/api/products/category/Home', None),
+    ('products add', 'POST', '/api/products',
+     {'name': 'Budget Desk {n}', 'price': 120, 'category': 'Home', 'stock': 3}),
+    ('products reduce stock', 'PUT', '/api/products/reduce-stock/Budget Desk {n}', {'amount': 1}),
+    ('products update', 'PUT', '/api/products/update/Budget Desk {n}', {'price': 99}),
+    ('products delete', 'DELETE', '/api/products/delete/Budget Desk {n}', None),
+]
+
+
+def fill(value, n):
+    if isinstance(value, dict):
+        return {key: fill(item, n) for key, item in value.items()}
+    return value.format(n=n) if isinstance(value, str) else value
+
+
+def run(budgets):
+    """Run the scenarios and return ``{name: (count, duplicates, error)}``
+    for the checked pass."""
+    sys.path.insert(0, ROOT)
+    import app as app_module
+    from query_profiler import QueryBudgetExceeded
+
+    profiler = app_module.query_profiler
+    profiler.strict = True
+    app_module.app.testing = True
+    urls = app_module.app.url_map.bind('localhost')
+    client = app_module.app.test_client()
+    client.post('/api/register', json={'username': 'budget', 'email': 'budget@example.com', 'password': 'secret'})
+    client.post('/api/login', json={'username': 'budget', 'password': 'secret'})
+
+    results = {}
+    for n in (1, 2):
+        for name, method, path, body in SCENARIOS:
+            path = fill(path, n)
+            rule, _ = urls.match(path.split('?')[0], method=method, return_rule=True)
+            route = f'{method} {rule.rule}'
+            profiler.budgets = {route: budgets[name]} if n == 2 and name in budgets else {}
+            error = None
+            try:
+                response = client.open(path, method=method, json=fill(body, n))
+                if response.status_code >= 400:
+                    error = f'status {response.status_code}: {response.get_data(as_text=True).strip()[:200]}'
+            except QueryBudgetExceeded as e:
+                error = str(e)
+            profile = profiler.history[-1]
+            results[name] = (profile.count, profile.duplicates, error)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check SQL statement counts against query_budgets.json.')
+    parser.add_argument('--update', action='store_true', help='record the current counts as the budgets')
+    args = parser.parse_args()
+
+    budgets = {}
+    if not args.update and os.path.exists(BUDGETS):
+        with open(BUDGETS) as f:
+            budgets = json.load(f)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'budgets.db')}", QUERY_PROFILER='1',
+                          BCRYPT_ROUNDS='4', CATALOG_SYNC_INTERVAL='3600', RESERVATION_SWEEP_INTERVAL='3600')
+        results = run(budgets)
+
+    failed = False
+    for name, (count, duplicates, error) in results.items():
+        budget = budgets.get(name)
+        line = f'{name:<24} {count:>3} statements'
+        if budget is not None:
+            line += f' (budget {budget})'
+        if error:
+            failed = True
+            line += f'  FAILED: {error}'
+        print(line)
+        for shape, times in duplicates:
+            print(f'    repeated {times}x: {shape}')
+
+    if args.update:
+        with open(BUDGETS, 'w') as f:
+            json.dump({name: count for name, (count, _, _) in results.items()}, f, indent=2)
+            f.write('\n')
+        print(f'Wrote {BUDGETS}')
+    elif failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
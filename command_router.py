@@ -0,0 +1,177 @@
+"""Chat command routing shared by ``app.py`` and ``backend/app.py``.
+
+Each command is registered once with a literal trigger (an exact phrase or a
+prefix) and an optional precompiled argument pattern.  Exact phrases are
+resolved with a dict lookup and prefixes with a character trie, so the cost of
+routing a message depends on the length of the trigger, not on how many
+commands are registered.
+
+A handler returns the reply text, or an iterator of text chunks (e.g. a
+generator) when the reply can be produced incrementally.  ``dispatch`` always returns the joined
+text; ``stream`` returns the chunks as the handler yields them.
+
+Commands registered with ``cached=True`` must be read-only: when the router
+has a ``cache`` (see ``response_cache.ResponseCache``) their responses are
+kept under the normalized message plus any extra dispatch arguments.
+
+With ``metrics`` (see ``metrics.Metrics``) every dispatched message is counted
+under its command name, or ``fallback`` when no command matched.
+"""
+import re
+from collections.abc import Iterator
+from typing import Callable, NamedTuple, Optional
+
+
+class ParsedCommand(NamedTuple):
+    """Result of routing a chat message."""
+    name: str
+    text: str               # normalized message
+    rest: str               # text after the trigger prefix ('' for exact commands)
+    args: Optional[dict]    # named groups of the argument pattern, None if it did not match
+
+
+class Command(NamedTuple):
+    name: str
+    handler: Callable
+    prefix: Optional[str]
+    exact: tuple
+    pattern: Optional[re.Pattern]
+    cached: bool
+
+
+_END = object()
+
+
+def _text(response):
+    return ''.join(response) if isinstance(response, Iterator) else response
+
+
+def _chunks(response):
+    return response if isinstance(response, Iterator) else iter((response,))
+
+
+class CommandRouter:
+    """Registry of chat commands with flat-cost dispatch."""
+
+    def __init__(self, cache=None, metrics=None):
+        self.cache = cache
+        self.metrics = metrics
+        self.commands = []
+        self._exact = {}
+        self._trie = {}
+        self._fallback = None
+
+    @staticmethod
+    def normalize(message):
+        return message.lower().strip()
+
+    def add(self, name, handler, prefix=None, exact=(), pattern=None, cached=False):
+        """Register ``handler`` for messages equal to one of ``exact`` or
+        starting with ``prefix``.  ``pattern`` is matched against the text that
+        follows the prefix and its named groups become ``ParsedCommand.args``.
+        ``cached`` marks a read-only command whose response may be cached.
+        """
+        if prefix is None and not exact:
+            raise ValueError(f"Command '{name}' needs a prefix or an exact phrase")
+        if isinstance(pattern, str):
+            pattern = re.compile(pattern)
+        command = Command(name, handler, prefix, tuple(exact), pattern, cached)
+        for phrase in command.exact:
+            self._exact[phrase] = command
+        if prefix is not None:
+            node = self._trie
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[_END] = command
+        self.commands.append(command)
+        return command
+
+    def command(self, name, prefix=None, exact=(), pattern=None, cached=False):
+        """Decorator form of :meth:`add`."""
+        def decorator(handler):
+            self.add(name, handler, prefix=prefix, exact=exact, pattern=pattern, cached=cached)
+            return handler
+        return decorator
+
+    def fallback(self, handler):
+        """Register the handler used when no command matches."""
+        self._fallback = handler
+        return handler
+
+    def _longest_prefix(self, text):
+        """Return the command with the longest prefix that starts ``text``."""
+        found = None
+        node = self._trie
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(_END, found)
+        return found
+
+    def _route(self, message):
+        text = self.normalize(message)
+        command = self._exact.get(text)
+        if command is not None:
+            return command, ParsedCommand(command.name, text, '', {})
+        command = self._longest_prefix(text)
+        if command is None:
+            return None, None
+        rest = text[len(command.prefix):]
+        if command.pattern is None:
+            args = {}
+        else:
+            match = command.pattern.match(rest)
+            args = match.groupdict() if match else None
+        return command, ParsedCommand(command.name, text, rest, args)
+
+    def _routed(self, message):
+        command, parsed = self._route(message)
+        if self.metrics is not None:
+            self.metrics.count_command(command.name if command is not None else 'fallback')
+        return command, parsed
+
+    def parse(self, message):
+        """Return a :class:`ParsedCommand` for ``message`` or None."""
+        return self._route(message)[1]
+
+    def dispatch(self, message, *extra):
+        """Parse ``message`` and call the matching handler with the parsed
+        command followed by ``extra``."""
+        command, parsed = self._routed(message)
+        if command is None:
+            if self._fallback is None:
+                return None
+            return self._fallback(message, *extra)
+        if not command.cached or self.cache is None:
+            return _text(command.handler(parsed, *extra))
+        key = (parsed.text,) + extra
+        response = self.cache.get(key)
+        if response is None:
+            version = self.cache.version
+            response = _text(command.handler(parsed, *extra))
+            self.cache.put(key, response, version)
+        return response
+
+    def stream(self, message, *extra):
+        """Like :meth:`dispatch`, but return an iterator of text chunks."""
+        command, parsed = self._routed(message)
+        if command is None:
+            if self._fallback is None:
+                return iter(())
+            return _chunks(self._fallback(message, *extra))
+        if not command.cached or self.cache is None:
+            return _chunks(command.handler(parsed, *extra))
+        key = (parsed.text,) + extra
+        response = self.cache.get(key)
+        if response is not None:
+            return iter((response,))
+        return self._stream_and_cache(key, command, parsed, extra)
+
+    def _stream_and_cache(self, key, command, parsed, extra):
+        version = self.cache.version
+        parts = []
+        for chunk in _chunks(command.handler(parsed, *extra)):
+            parts.append(chunk)
+            yield chunk
+        self.cache.put(key, ''.join(parts), version)
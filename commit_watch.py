@@ -0,0 +1,72 @@
+"""Session hooks that report committed changes to one model.
+
+The in-process caches (``catalog_index``, ``user_cache``, ``response_cache``)
+must only change once a write commits: a row changed in a transaction that
+then rolls back, or that another connection cannot see yet, must not reach
+them.  ``CommitWatch`` stages what each flush changed on the session and hands
+it to ``on_commit`` after the commit, or drops it on rollback.
+
+Bulk ``INSERT``/``UPDATE``/``DELETE`` statements against the model cannot be
+followed row by row; a commit that ran one calls ``on_bulk`` instead.  With
+``match_table`` Core statements on the model's table count as bulk too; code
+that writes through Core but knows what it changed can ``stage`` the change
+itself instead.
+"""
+import itertools
+
+from sqlalchemy import event
+
+
+class CommitWatch:
+    def __init__(self, model, on_commit, on_bulk, snapshot=None, match_table=False):
+        """``snapshot(obj, deleted)`` is what a flush stages for each changed
+        ``model`` instance (default: its id); ``on_commit`` gets the list of
+        staged values in order."""
+        self.model = model
+        self.on_commit = on_commit
+        self.on_bulk = on_bulk
+        self.snapshot = snapshot or (lambda obj, deleted: obj.id)
+        self.match_table = match_table
+
+    def listen(self, target):
+        """Watch writes made through ``target``: a session, sessionmaker or
+        ``Session`` subclass."""
+        event.listen(target, 'after_flush', self._after_flush)
+        event.listen(target, 'after_commit', self._after_commit)
+        event.listen(target, 'after_rollback', self._after_rollback)
+        event.listen(target, 'do_orm_execute', self._on_orm_execute)
+
+    def _staged(self, session):
+        return session.info.setdefault(self, {'changes': [], 'bulk': False})
+
+    def stage(self, session, value):
+        """Pass ``value`` to ``on_commit`` when ``session`` commits."""
+        self._staged(session)['changes'].append(value)
+
+    def _after_flush(self, session, flush_context):
+        for obj in itertools.chain(session.new, session.dirty, session.deleted):
+            if isinstance(obj, self.model):
+                self.stage(session, self.snapshot(obj, obj in session.deleted))
+
+    def _after_commit(self, session):
+        staged = session.info.pop(self, None)
+        if staged is None:
+            return
+        if staged['bulk']:
+            self.on_bulk()
+        elif staged['changes']:
+            self.on_commit(staged['changes'])
+
+    def _after_rollback(self, session):
+        session.info.pop(self, None)
+
+    def _on_orm_execute(self, orm_execute_state):
+        if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ is self.model:
+            self._staged(orm_execute_state.session)['bulk'] = True
+        elif self.match_table:
+            table = getattr(orm_execute_state.statement, 'table', None)
+            if getattr(table, 'name', None) == self.model.__table__.name:
+                self._staged(orm_execute_state.session)['bulk'] = True
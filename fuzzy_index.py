@@ -0,0 +1,164 @@
+"""Typo-tolerant product name matching with in-memory trigram indexes.
+
+``FuzzyNameIndex`` matches each word of a query against the vocabulary of
+words used in product names through a ``TrigramIndex``, then ranks names by
+the mean similarity of their best-matching word for every query word.  The
+vocabulary grows far more slowly than the catalog, which keeps trigram
+posting lists short.
+
+Text is split into words and each word is padded the way ``pg_trgm`` does
+(two leading spaces, one trailing) before taking trigrams, so "samsng" still
+shares most of its trigrams with "samsung".  As with ``pg_trgm``'s
+``word_similarity``, a name scores by the share of the query's trigrams it
+contains, so a short query is not penalised for matching a long name; ties
+are broken by the Jaccard index of the two sets.
+
+A query only probes the posting lists of its rarest trigrams: a name scoring
+>= ``threshold`` must share at least ``ceil(threshold * |q|)`` of the query's
+``|q|`` trigrams, so it is guaranteed to appear in the postings of any
+``|q| - ceil(threshold * |q|) + 1`` of them.  Candidates are then scored
+exactly by checking them against the remaining trigrams' postings.
+"""
+import heapq
+import math
+import re
+from collections import Counter
+from operator import itemgetter
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def words(text):
+    return _WORD_RE.findall(text.lower())
+
+
+def trigrams(text):
+    grams = set()
+    for word in words(text):
+        padded = f'  {word} '
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return frozenset(grams)
+
+
+class TrigramIndex:
+    def __init__(self, threshold=0.5):
+        self.threshold = threshold
+        self._grams = {}      # id -> frozenset of trigrams
+        self._postings = {}   # trigram -> set(ids)
+
+    def __len__(self):
+        return len(self._grams)
+
+    def clear(self):
+        self._grams = {}
+        self._postings = {}
+
+    def add(self, key, name):
+        self.remove(key)
+        grams = trigrams(name)
+        self._grams[key] = grams
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key):
+        grams = self._grams.pop(key, None)
+        if grams is None:
+            return
+        for gram in grams:
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(key)
+                if not ids:
+                    del self._postings[gram]
+
+    def query(self, text, k=10):
+        """Return up to ``k`` ``(key, similarity)`` pairs, most similar first."""
+        query = trigrams(text)
+        if not query:
+            return []
+        min_overlap = max(1, math.ceil(self.threshold * len(query)))
+        ordered = sorted(query, key=lambda g: len(self._postings.get(g, ())))
+        split = len(query) - min_overlap + 1
+        overlaps = Counter()
+        for gram in ordered[:split]:
+            overlaps.update(self._postings.get(gram, ()))
+        # The remaining (most common) trigrams only need checking against the
+        # candidates; set intersection and Counter.update keep this in C.
+        candidates = set(overlaps)
+        for gram in ordered[split:]:
+            overlaps.update(candidates.intersection(self._postings.get(gram, ())))
+
+        # Take the top k by overlap plus anything tied with the k-th, then
+        # break ties by Jaccard.
+        best = []
+        for key, overlap in overlaps.most_common():
+            if overlap < min_overlap or (len(best) >= k and overlap < best[-1][0]):
+                break
+            grams = self._grams[key]
+            best.append((overlap, overlap / (len(query) + len(grams) - overlap), key))
+        best.sort(reverse=True)
+        return [(key, overlap / len(query)) for overlap, jaccard, key in best[:k]]
+
+
+class FuzzyNameIndex:
+    def __init__(self, threshold=0.5, word_candidates=8):
+        self.word_candidates = word_candidates
+        self._vocab = TrigramIndex(threshold)
+        self._words = {}         # id -> tuple of name words
+        self._ids_by_word = {}   # word -> set(ids)
+
+    def __len__(self):
+        return len(self._words)
+
+    def clear(self):
+        self._vocab.clear()
+        self._words = {}
+        self._ids_by_word = {}
+
+    def add(self, key, name):
+        self.remove(key)
+        name_words = tuple(set(words(name)))
+        self._words[key] = name_words
+        for word in name_words:
+            ids = self._ids_by_word.get(word)
+            if ids is None:
+                ids = self._ids_by_word[word] = set()
+                self._vocab.add(word, word)
+            ids.add(key)
+
+    def remove(self, key):
+        for word in self._words.pop(key, ()):
+            ids = self._ids_by_word.get(word)
+            if ids is not None:
+                ids.discard(key)
+                if not ids:
+                    del self._ids_by_word[word]
+                    self._vocab.remove(word)
+
+    def query(self, text, k=10):
+        """Return up to ``k`` ``(key, similarity)`` pairs, most similar first."""
+        per_word = []
+        for word in set(words(text)):
+            # id -> similarity of the best match for this query word. Matches
+            # are applied weakest first so stronger ones overwrite them, which
+            # keeps the work in dict.update/dict.fromkeys.
+            best = {}
+            matches = self._vocab.query(word, self.word_candidates)
+            for vocab_word, similarity in reversed(matches):
+                best.update(dict.fromkeys(self._ids_by_word[vocab_word], similarity))
+            per_word.append(best)
+        if not per_word:
+            return []
+        if len(per_word) == 1:
+            scores = per_word[0]
+        else:
+            # Names matching every query word, topped up with each word's k
+            # best matches when that leaves fewer than k results.
+            candidates = set(per_word[0]).intersection(*per_word[1:])
+            if len(candidates) < k:
+                for best in per_word:
+                    candidates.update(key for key, _ in heapq.nlargest(k, best.items(), key=itemgetter(1)))
+            scores = {key: sum(best.get(key, 0.0) for best in per_word) / len(per_word)
+                      for key in candidates}
+        return heapq.nlargest(k, scores.items(), key=itemgetter(1))
@@ -0,0 +1,231 @@
+"""Request, SQL and chat command metrics in the Prometheus text format.
+
+``Metrics.init_app(app, db)`` times every request between ``before_request``
+and ``teardown_request`` and counts the SQL statements each one runs, through
+``before_cursor_execute``/``after_cursor_execute`` listeners on the engine.
+Everything is labelled by the route's URL rule (``/api/products/<int:id>``,
+not the concrete path) and method, so the number of series stays bounded.
+``GET /metrics`` renders:
+
+* ``http_requests_total{method,route,status}``
+* ``http_request_duration_seconds{method,route}``, a histogram.  Replies
+  streamed with ``stream_with_context`` (SSE chat) are timed to their last
+  chunk; other streamed responses until the generator is handed to the server.
+* ``http_request_queries{method,route}``, a histogram of statements per
+  request, and ``http_request_query_seconds_total{method,route}`` (Flask
+  apps only)
+* ``db_queries_total`` and ``db_query_seconds_total`` for every statement,
+  including those run outside a request (startup, background threads)
+* ``chat_commands_total{command}``, fed by ``command_router.CommandRouter``
+
+The endpoint is off unless ``METRICS=1`` (see ``app_config.py``) and, with a
+``token``, answers 401 to requests without ``Authorization: Bearer <token>``
+(Prometheus' ``authorization`` scrape setting).
+
+``asgi.py`` records latency through ``observe()`` and counts the statements
+of its async engine, which it cannot attribute to single requests.
+
+Recording is a few dict updates under one lock, a few microseconds per
+request; see ``bench/bench_metrics.py``.
+"""
+import bisect
+import hmac
+import threading
+import time
+
+from flask import Response, request
+from sqlalchemy import event
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # Counts per bucket, made cumulative when rendered
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def copy(self):
+        other = Histogram(self.buckets)
+        other.counts, other.sum, other.count = self.counts[:], self.sum, self.count
+        return other
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class _RequestState:
+    __slots__ = ('start', 'queries', 'query_seconds', 'status')
+
+    def __init__(self, start):
+        self.start = start
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.status = 500
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    def __init__(self, duration_buckets=DURATION_BUCKETS, query_buckets=QUERY_BUCKETS):
+        self.duration_buckets = duration_buckets
+        self.query_buckets = query_buckets
+        self.requests = {}       # (method, route, status) -> count
+        self.durations = {}      # (method, route) -> Histogram
+        self.queries = {}        # (method, route) -> Histogram
+        self.query_seconds = {}  # (method, route) -> seconds
+        self.commands = {}       # command name -> count
+        self.db_queries = 0
+        self.db_query_seconds = 0.0
+        self.token = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db=None, path='/metrics', token=None):
+        """Install the request hooks and the ``path`` endpoint, and count the
+        SQL run by ``db``'s engine.  Must run inside an app context when ``db``
+        is given."""
+        self.token = token
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule(path, 'metrics', self.view)
+        if db is not None:
+            self.watch_engine(db.engine)
+
+    def watch_engine(self, engine):
+        """Count and time the statements run through ``engine`` (a sync
+        engine; pass ``AsyncEngine.sync_engine`` for an async one)."""
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def count_command(self, name):
+        with self._lock:
+            self.commands[name] = self.commands.get(name, 0) + 1
+
+    def observe(self, method, route, status, seconds, queries=None, query_seconds=0.0):
+        """Record one request.  ``queries`` is None when the statements
+        could not be attributed to the request."""
+        key = (method, route)
+        count_key = key + (status,)
+        with self._lock:
+            self.requests[count_key] = self.requests.get(count_key, 0) + 1
+            histogram = self.durations.get(key)
+            if histogram is None:
+                histogram = self.durations[key] = Histogram(self.duration_buckets)
+            histogram.observe(seconds)
+            if queries is not None:
+                histogram = self.queries.get(key)
+                if histogram is None:
+                    histogram = self.queries[key] = Histogram(self.query_buckets)
+                histogram.observe(queries)
+                self.query_seconds[key] = self.query_seconds.get(key, 0.0) + query_seconds
+
+    def _before_request(self):
+        self._local.state = _RequestState(time.perf_counter())
+
+    def _after_request(self, response):
+        state = getattr(self._local, 'state', None)
+        if state is not None:
+            state.status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        state = getattr(self._local, 'state', None)
+        if state is None:
+            return
+        self._local.state = None
+        rule = request.url_rule
+        self.observe(request.method, rule.rule if rule is not None else 'unmatched', state.status,
+                     time.perf_counter() - state.start, state.queries, state.query_seconds)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the execution context rather than the thread: async
+        # sessions interleave statements on one thread
+        if context is not None:
+            context._metrics_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_metrics_start', None)
+        elapsed = time.perf_counter() - start if start is not None else 0.0
+        state = getattr(self._local, 'state', None)
+        if state is not None:
+            state.queries += 1
+            state.query_seconds += elapsed
+        with self._lock:
+            self.db_queries += 1
+            self.db_query_seconds += elapsed
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            requests = sorted(self.requests.items())
+            durations = sorted((key, h.copy()) for key, h in self.durations.items())
+            queries = sorted((key, h.copy()) for key, h in self.queries.items())
+            query_seconds = sorted(self.query_seconds.items())
+            commands = sorted(self.commands.items())
+            db_queries, db_query_seconds = self.db_queries, self.db_query_seconds
+
+        def labels(method, route):
+            return f'method="{method}",route="{_escape(route)}"'
+
+        def histograms(name, help, rows):
+            yield f'# HELP {name} {help}'
+            yield f'# TYPE {name} histogram'
+            for (method, route), histogram in rows:
+                yield from histogram.lines(name, labels(method, route))
+
+        lines = ['# HELP http_requests_total Requests handled, by route and status.',
+                 '# TYPE http_requests_total counter']
+        lines += [f'http_requests_total{{{labels(method, route)},status="{status}"}} {count}'
+                  for (method, route, status), count in requests]
+        lines += histograms('http_request_duration_seconds', 'Request latency in seconds.',
+                            durations)
+        lines += histograms('http_request_queries', 'SQL statements run per request.',
+                            queries)
+        lines += ['# HELP http_request_query_seconds_total Seconds spent in SQL statements, by route.',
+                  '# TYPE http_request_query_seconds_total counter']
+        lines += [f'http_request_query_seconds_total{{{labels(method, route)}}} {seconds}'
+                  for (method, route), seconds in query_seconds]
+        lines += ['# HELP db_queries_total SQL statements run, in or outside requests.',
+                  '# TYPE db_queries_total counter',
+                  f'db_queries_total {db_queries}',
+                  '# HELP db_query_seconds_total Seconds spent in SQL statements.',
+                  '# TYPE db_query_seconds_total counter',
+                  f'db_query_seconds_total {db_query_seconds}',
+                  '# HELP chat_commands_total Chat messages routed, by command.',
+                  '# TYPE chat_commands_total counter']
+        lines += [f'chat_commands_total{{command="{_escape(name)}"}} {count}' for name, count in commands]
+        return '\n'.join(lines) + '\n'
+
+    def authorized(self, authorization):
+        """Whether an ``Authorization`` header value may read the metrics."""
+        if self.token is None:
+            return True
+        return hmac.compare_digest((authorization or '').encode(), f'Bearer {self.token}'.encode())
+
+    def view(self):
+        if not self.authorized(request.headers.get('Authorization')):
+            return Response('Unauthorized\n', 401, {'WWW-Authenticate': 'Bearer'}, content_type='text/plain')
+        return Response(self.render(), content_type=CONTENT_TYPE)
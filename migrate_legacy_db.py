@@ -0,0 +1,96 @@
+"""Fold the legacy ``database.db`` into the app's database.
+
+Earlier versions of ``app.py`` also created ``users`` and ``products`` tables
+in a second file, ``database.db``, through raw ``sqlite3`` connections.  Nothing
+reads that file any more; this copies whatever it holds into the tables of
+``SQLALCHEMY_DATABASE_URI`` so it can be deleted.
+
+* Products go through ``product_import`` and get the same validation and
+  duplicate handling as a bulk import.  The legacy ``description`` column has
+  no counterpart and is dropped.
+* Users whose username or email already exists are skipped, and so are users
+  whose password is not a bcrypt hash, since the app could never verify it.
+  They have to register again.
+
+The legacy file is opened read-only and left in place.
+
+Usage:
+    python migrate_legacy_db.py
+    python migrate_legacy_db.py path/to/database.db
+"""
+import argparse
+import os
+import sqlite3
+import sys
+
+from product_import import import_products
+
+BCRYPT_PREFIXES = ('$2a$', '$2b$', '$2y$')
+
+
+def legacy_rows(conn, table):
+    """Yield ``(row_no, dict)`` for each row of ``table``, or nothing if the
+    legacy file does not have it."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    if not exists:
+        return
+    for row_no, row in enumerate(conn.execute(f'SELECT * FROM {table} ORDER BY id'), start=1):
+        yield row_no, dict(row)
+
+
+def fold_users(db, model, rows):
+    """Insert legacy users that don't clash with existing ones; returns
+    ``(inserted, [(row_no, reason)])``."""
+    taken_names = {name for (name,) in db.session.query(model.username)}
+    taken_emails = {email for (email,) in db.session.query(model.email)}
+    inserted, skipped = [], []
+    for row_no, row in rows:
+        if row['username'] in taken_names or row['email'] in taken_emails:
+            skipped.append((row_no, f"User '{row['username']}' already exists"))
+        elif not str(row['password']).startswith(BCRYPT_PREFIXES):
+            skipped.append((row_no, f"User '{row['username']}' has a password the app cannot verify"))
+        else:
+            taken_names.add(row['username'])
+            taken_emails.add(row['email'])
+            inserted.append({'username': row['username'], 'email': row['email'], 'password': row['password']})
+    if inserted:
+        db.session.execute(db.insert(model), inserted)
+        db.session.commit()
+    return len(inserted), skipped
+
+
+def fold_legacy_database(db, user_model, product_model, path):
+    """Copy the users and products of the legacy SQLite file at ``path``.
+    Must run inside an app context."""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        users, skipped = fold_users(db, user_model, legacy_rows(conn, 'users'))
+        products = import_products(db, product_model, legacy_rows(conn, 'products'))
+    finally:
+        conn.close()
+    return users, skipped, products
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Copy the legacy database.db into the app database.')
+    parser.add_argument('path', nargs='?', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database.db'))
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        print(f'{args.path} does not exist; nothing to migrate')
+        return
+
+    from app import app, db, Product, User
+
+    with app.app_context():
+        users, skipped, products = fold_legacy_database(db, User, Product, args.path)
+    for row_no, reason in skipped:
+        print(f'users row {row_no}: {reason}', file=sys.stderr)
+    for error in products.errors:
+        print(f"products row {error['row']}: {error['error']}", file=sys.stderr)
+    print(f'Copied {users} users ({len(skipped)} skipped) and {products.inserted} products '
+          f'({products.failed} skipped) from {args.path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""Schema migrations for existing database files.
+
+``db.create_all()`` creates missing tables but never alters existing ones, so
+an index added to a model only reaches databases created after it.  Each
+migration here brings an older ``products.db`` (``app.py``) or ``chatbot.db``
+(``backend/app.py``) file up to date.  ``upgrade(engine)`` applies the ones
+not yet recorded in the ``schema_migrations`` table, each in its own
+transaction, and returns their ids.  ``prepare(db)`` is what the apps run at
+startup: it checks the recorded migrations against this list and the tables
+against the models, and only does schema work when something is missing.
+
+Migrations look at the tables they find rather than at the current models:
+both apps' schemas go through the same list, and a step whose table does not
+exist is recorded without doing anything (``create_all`` will create that
+table with the index already on it).  Add new migrations at the end with the
+next id; never renumber or edit one that has shipped.
+
+Usage:
+    python migrations.py                    # instance/products.db
+    python migrations.py --app backend      # backend/instance/chatbot.db
+    python migrations.py path/to/file.db
+    python migrations.py --list path/to/file.db
+"""
+import argparse
+import os
+from typing import Callable, NamedTuple
+
+from sqlalchemy import create_engine, inspect, text
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Where Flask-SQLAlchemy puts each app's default relative sqlite:/// file
+DEFAULT_DATABASES = {
+    'app': os.path.join(ROOT, 'instance', 'products.db'),
+    'backend': os.path.join(ROOT, 'backend', 'instance', 'chatbot.db'),
+}
+
+
+class Migration(NamedTuple):
+    id: int
+    description: str
+    apply: Callable
+
+
+MIGRATIONS = []
+
+
+def migration(id, description):
+    def register(fn):
+        MIGRATIONS.append(Migration(id, description, fn))
+        return fn
+    return register
+
+
+def _columns(conn, table):
+    inspector = inspect(conn)
+    if not inspector.has_table(table):
+        return set()
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+@migration(1, 'index product category and lower(name)')
+def product_lookup_indexes(conn):
+    columns = _columns(conn, 'product')
+    if not columns:
+        return
+    if 'user_id' in columns:
+        # backend/app.py: every product query is scoped to one user
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_product_user_name_lower ON product (user_id, lower(name))'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_product_user_category ON product (user_id, category)'))
+    else:
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_product_category ON product (category)'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_product_name_lower ON product (lower(name))'))
+
+
+@migration(2, 'index message user_id, timestamp')
+def message_history_index(conn):
+    if {'user_id', 'timestamp'} <= _columns(conn, 'message'):
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_message_user_timestamp ON message (user_id, timestamp)'))
+
+
+@migration(3, 'refresh planner statistics')
+def analyze(conn):
+    conn.execute(text('ANALYZE'))
+
+
+@migration(4, 'never reuse revoked_token ids')
+def revoked_token_autoincrement(conn):
+    # Workers pick up revocations by id, so an id freed by pruning expired rows
+    # must not be handed out again; SQLite only adds AUTOINCREMENT by rebuilding
+    sql = conn.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'revoked_token'")).scalar()
+    if sql is None or 'AUTOINCREMENT' in sql.upper():
+        return
+    conn.execute(text(
+        'CREATE TABLE revoked_token_new (id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, '
+        'jti VARCHAR(32) NOT NULL, expires_at DATETIME NOT NULL, UNIQUE (jti))'))
+    conn.execute(text('INSERT INTO revoked_token_new (id, jti, expires_at) '
+                      'SELECT id, jti, expires_at FROM revoked_token'))
+    conn.execute(text('DROP TABLE revoked_token'))
+    conn.execute(text('ALTER TABLE revoked_token_new RENAME TO revoked_token'))
+    conn.execute(text('CREATE INDEX ix_revoked_token_expires_at ON revoked_token (expires_at)'))
+
+
+@migration(5, 'index backend product lower(name)')
+def backend_product_name_index(conn):
+    # backend/app.py: adding a product checks the name across all users
+    if 'user_id' in _columns(conn, 'product'):
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_product_name_lower ON product (lower(name))'))
+
+
+def _ensure_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'id INTEGER PRIMARY KEY, description VARCHAR(200) NOT NULL, '
+        'applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)'))
+
+
+def applied(engine):
+    """Ids of the migrations already applied to ``engine``'s database."""
+    with engine.begin() as conn:
+        _ensure_table(conn)
+        return {row[0] for row in conn.execute(text('SELECT id FROM schema_migrations'))}
+
+
+def pending(engine):
+    done = applied(engine)
+    return [m for m in sorted(MIGRATIONS) if m.id not in done]
+
+
+def _claim(conn, m):
+    # Recording the migration first takes the write lock, so a process that
+    # starts the same migration concurrently waits here and then skips it
+    return conn.execute(text(
+        'INSERT INTO schema_migrations (id, description) SELECT :id, :description '
+        'WHERE NOT EXISTS (SELECT 1 FROM schema_migrations WHERE id = :id)'),
+        {'id': m.id, 'description': m.description}).rowcount == 1
+
+
+def upgrade(engine):
+    """Apply the pending migrations in order; return the ids applied."""
+    ids = []
+    for m in pending(engine):
+        with engine.begin() as conn:
+            if not _claim(conn, m):
+                continue
+            m.apply(conn)
+        ids.append(m.id)
+    return ids
+
+
+def prepare(db):
+    """Bring ``db``'s schema up to date at startup; return the ids applied.
+
+    When every migration is recorded and every model's table exists this is
+    two queries.  Otherwise ``db.create_all()`` adds the missing tables, then a
+    database that had no tables gets every migration recorded without running
+    it (the tables it just got are already current) and any other gets its
+    pending migrations applied.  Must run inside an app context.
+    """
+    engine = db.engine
+    todo = pending(engine)
+    tables = set(inspect(engine).get_table_names())
+    if not todo and set(db.metadata.tables) <= tables:
+        return []
+    fresh = tables == {'schema_migrations'}
+    db.create_all()
+    if fresh:
+        with engine.begin() as conn:
+            for m in todo:
+                _claim(conn, m)
+        return []
+    return upgrade(engine)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply pending schema migrations to a SQLite database.')
+    parser.add_argument('path', nargs='?', help="database file (default: the --app's instance database)")
+    parser.add_argument('--app', choices=sorted(DEFAULT_DATABASES), default='app')
+    parser.add_argument('--list', action='store_true', help='show the pending migrations without applying them')
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.path) if args.path else DEFAULT_DATABASES[args.app]
+    if not os.path.exists(path):
+        parser.error(f'{path} does not exist')
+    engine = create_engine(f'sqlite:///{path}')
+    if args.list:
+        for m in pending(engine):
+            print(f'{m.id:>4}  {m.description}')
+        return
+    ids = upgrade(engine)
+    print(f"Applied {len(ids)} migration(s) to {path}" + (f": {ids}" if ids else ''))
+
+
+if __name__ == '__main__':
+    main()
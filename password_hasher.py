@@ -0,0 +1,119 @@
+"""Password hashing on a small, bounded thread pool.
+
+bcrypt, scrypt and PBKDF2 are deliberately CPU-heavy.  Run inline, a burst of
+logins gives every request thread a hash to compute at once and starves the
+rest of the app.  ``PasswordHasher`` sends the work to ``workers`` dedicated
+threads instead (the hash functions release the GIL, so the pool really does
+cap the CPU spent on hashing) and refuses new work with ``HasherBusy`` once
+``max_queue`` calls are already waiting, so the caller can answer 503 straight
+away rather than queueing behind the storm.
+
+The work factor is fixed when the hasher is built.  ``verify`` reports when a
+stored hash was made with a different factor and returns a fresh hash, so
+existing users are upgraded (or downgraded) the next time they log in.
+
+``workers=0`` hashes inline on the calling thread with no limit, which is the
+old behaviour and is kept for comparison.
+"""
+import concurrent.futures
+import functools
+import os
+import threading
+
+
+class HasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, hash_fn, verify_fn, needs_rehash_fn, workers=None, max_queue=32, timeout=30):
+        self._hash = hash_fn
+        self._verify = verify_fn
+        self.needs_rehash = needs_rehash_fn
+        self.workers = max(1, (os.cpu_count() or 2) // 2) if workers is None else workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.rejected = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        if self.workers:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix='password-hash')
+
+    @classmethod
+    def bcrypt(cls, rounds=12, **kwargs):
+        import bcrypt
+
+        def hash_fn(password):
+            return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+        def verify_fn(password, hashed):
+            return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+        def needs_rehash(hashed):
+            # $2b$<rounds>$<salt+hash>
+            return int(hashed.split('$')[2]) != rounds
+
+        return cls(hash_fn, verify_fn, needs_rehash, **kwargs)
+
+    @classmethod
+    def werkzeug(cls, method='scrypt:32768:8:1', **kwargs):
+        from werkzeug.security import check_password_hash, generate_password_hash
+
+        @functools.cache
+        def prefix():
+            # Expand shorthands such as 'scrypt' into the prefix werkzeug
+            # stores.  This costs a full hash, so it waits for the first login
+            # instead of slowing down every worker's startup.
+            return generate_password_hash('', method).split('$', 1)[0]
+
+        def hash_fn(password):
+            return generate_password_hash(password, method)
+
+        def verify_fn(password, hashed):
+            return check_password_hash(hashed, password)
+
+        def needs_rehash(hashed):
+            return hashed.split('$', 1)[0] != prefix()
+
+        return cls(hash_fn, verify_fn, needs_rehash, **kwargs)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _run(self, fn, *args):
+        if self._executor is None:
+            return fn(*args)
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise HasherBusy('Too many password checks in progress, try again shortly')
+            self._pending += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            raise HasherBusy('Password check timed out, try again shortly')
+
+    def hash(self, password):
+        return self._run(self._hash, password)
+
+    def verify(self, password, hashed):
+        """Return ``(ok, new_hash)``; ``new_hash`` is set when the password
+        matched and ``hashed`` should be replaced to apply the current work
+        factor."""
+        if not hashed or not self._run(self._verify, password, hashed):
+            return False, None
+        if not self.needs_rehash(hashed):
+            return True, None
+        try:
+            return True, self.hash(password)
+        except HasherBusy:
+            return True, None  # upgrade on a quieter login
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
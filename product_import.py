@@ -0,0 +1,206 @@
+"""Bulk product import from CSV or NDJSON.
+
+Rows are read from the input as a stream and inserted in chunked
+transactions.  For each chunk the names are checked against the database in a
+single ``IN`` query and inserted with one ``executemany``.  Invalid or
+duplicate rows are reported by line number and skipped; they never abort the
+rest of the chunk.  If the chunk insert itself fails (for instance another
+writer inserted the same name in the meantime) the chunk is retried row by
+row so only the offending rows are rejected.
+
+Usage:
+    python product_import.py feed.csv
+    python product_import.py feed.ndjson --batch-size 2000
+    cat feed.csv | python product_import.py - --format csv
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+REQUIRED_FIELDS = ('name', 'price', 'category', 'stock')
+# Stay well under SQLite's bound-parameter limit for the duplicate check
+_IN_CHUNK = 500
+
+
+def read_csv(stream):
+    """Yield ``(line_no, row)`` from a text stream with a header line."""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_ndjson(stream):
+    """Yield ``(line_no, row)``; unparsable lines yield the error instead."""
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError(f'Invalid JSON: {e}')
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+def clean_row(row):
+    """Validate a raw row and return the column mapping to insert."""
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError('Row must be an object')
+    missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f"Missing required field: {', '.join(missing)}")
+    name = str(row['name']).strip()
+    category = str(row['category']).strip()
+    if not name or not category:
+        raise ValueError('name and category must not be blank')
+    try:
+        price = float(row['price'])
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid price: {row['price']!r}")
+    try:
+        stock = int(row['stock'])
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid stock: {row['stock']!r}")
+    if stock < 0:
+        raise ValueError('Stock cannot be negative')
+    return {'name': name, 'price': price, 'category': category, 'stock': stock}
+
+
+class ImportResult:
+    def __init__(self, max_errors=1000):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+        self.seconds = 0.0
+
+    def error(self, line_no, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': line_no, 'error': message})
+
+    @property
+    def rows_per_sec(self):
+        total = self.inserted + self.failed
+        return total / self.seconds if self.seconds else 0.0
+
+    def to_dict(self):
+        return {
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+            'seconds': round(self.seconds, 3),
+            'rows_per_sec': round(self.rows_per_sec),
+        }
+
+
+def _existing_names(db, model, names):
+    existing = set()
+    names = list(names)
+    for i in range(0, len(names), _IN_CHUNK):
+        chunk = names[i:i + _IN_CHUNK]
+        existing.update(n for (n,) in db.session.query(model.name).filter(model.name.in_(chunk)))
+    return existing
+
+
+def _insert_batch(db, model, batch, result):
+    """Insert ``[(line_no, mapping)]`` in one transaction, falling back to
+    one savepoint per row if the batch as a whole is rejected."""
+    existing = _existing_names(db, model, (mapping['name'] for _, mapping in batch))
+    rows = []
+    for line_no, mapping in batch:
+        if mapping['name'] in existing:
+            result.error(line_no, f"Product '{mapping['name']}' already exists")
+        else:
+            rows.append((line_no, mapping))
+    if not rows:
+        return
+    try:
+        db.session.execute(db.insert(model), [mapping for _, mapping in rows])
+        db.session.commit()
+        result.inserted += len(rows)
+        return
+    except IntegrityError:
+        db.session.rollback()
+
+    for line_no, mapping in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(model), [mapping])
+            result.inserted += 1
+        except IntegrityError as e:
+            result.error(line_no, f"Product '{mapping['name']}' could not be inserted: {e.orig}")
+    db.session.commit()
+
+
+def import_products(db, model, rows, batch_size=1000, max_errors=1000):
+    """Import ``(line_no, row)`` pairs and return an :class:`ImportResult`."""
+    result = ImportResult(max_errors=max_errors)
+    start = time.perf_counter()
+    batch = []
+    seen = set()
+    for line_no, row in rows:
+        try:
+            mapping = clean_row(row)
+        except ValueError as e:
+            result.error(line_no, str(e))
+            continue
+        if mapping['name'] in seen:
+            result.error(line_no, f"Duplicate product '{mapping['name']}' in input")
+            continue
+        seen.add(mapping['name'])
+        batch.append((line_no, mapping))
+        if len(batch) >= batch_size:
+            _insert_batch(db, model, batch, result)
+            batch = []
+    if batch:
+        _insert_batch(db, model, batch, result)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def detect_format(filename, content_type=None):
+    if content_type:
+        if 'csv' in content_type:
+            return 'csv'
+        if 'ndjson' in content_type or 'jsonl' in content_type:
+            return 'ndjson'
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    return 'ndjson'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import products from CSV or NDJSON.')
+    parser.add_argument('path', help="input file, or '-' for stdin")
+    parser.add_argument('--format', choices=sorted(READERS), help='defaults to the file extension')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    from app import app, db, Product
+
+    fmt = args.format or detect_format(args.path)
+    if args.path == '-':
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+    else:
+        stream = open(args.path, encoding='utf-8', newline='')
+    with stream, app.app_context():
+        result = import_products(db, Product, READERS[fmt](stream), batch_size=args.batch_size)
+
+    for error in result.to_dict()['errors']:
+        print(f"row {error['row']}: {error['error']}", file=sys.stderr)
+    print(f"Imported {result.inserted} products, {result.failed} failed "
+          f"in {result.seconds:.2f}s ({result.rows_per_sec:.0f} rows/sec)")
+
+
+if __name__ == '__main__':
+    main()
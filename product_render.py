@@ -0,0 +1,69 @@
+"""Text rendering of product lists for chat replies.
+
+Chat replies used to grow one string with ``+=`` per product, with no limit
+on how many products a reply could hold.  ``ProductRenderer`` renders at most
+``max_rows`` rows, each through a caller-supplied ``line`` function, and
+closes with a "showing N of M" summary when rows were left out.  Output is
+produced as chunks of ``chunk_rows`` lines joined in one go, so the work is
+linear in the rows shown and a reply never holds more than ``max_rows`` lines
+however large the catalog is.
+
+``reply()`` returns those chunks as a lazy iterator (rows are pulled from
+``rows`` only as chunks are consumed, so a streaming response can send the
+header before the rest of the query has run); ``render()`` joins them into
+one string.
+"""
+import itertools
+
+SUMMARY = '\nShowing {shown} of {total} products. Use search or category to narrow it down.\n'
+
+_MISSING = object()
+
+
+class ProductRenderer:
+    def __init__(self, max_rows=200, chunk_rows=50, summary=SUMMARY):
+        self.max_rows = max_rows
+        self.chunk_rows = chunk_rows
+        self.summary = summary
+
+    def chunks(self, header, rows, line, total=None):
+        """Yield ``header``, then the rendered rows in chunks, then the
+        summary if rows remain after ``max_rows``.  ``total`` is the full row
+        count, or a callable returning it that is only called in that case;
+        by default the remaining rows are counted."""
+        yield header
+        rows = iter(rows)
+        shown = 0
+        while shown < self.max_rows:
+            chunk = [line(row) for row in itertools.islice(rows, min(self.chunk_rows, self.max_rows - shown))]
+            if not chunk:
+                return
+            shown += len(chunk)
+            yield ''.join(chunk)
+        if next(rows, _MISSING) is _MISSING:
+            return
+        if total is None:
+            total = shown + 1 + sum(1 for _ in rows)
+        elif callable(total):
+            total = total()
+        yield self.summary.format(shown=shown, total=total)
+
+    def reply(self, header, rows, line, total=None, empty=''):
+        """Return ``empty`` if ``rows`` yields nothing (only the first row is
+        fetched to tell), otherwise the lazy iterator of ``chunks()``."""
+        rows = iter(rows)
+        first = next(rows, _MISSING)
+        if first is _MISSING:
+            return empty
+        return self.chunks(header, itertools.chain((first,), rows), line, total)
+
+    def render(self, header, rows, line, total=None, empty=''):
+        reply = self.reply(header, rows, line, total, empty)
+        return reply if isinstance(reply, str) else ''.join(reply)
+
+    def query_rows(self, query):
+        """Return ``(rows, count)`` for a SQLAlchemy query: a cursor over at
+        most ``max_rows + 1`` rows, fetched ``chunk_rows`` at a time, and a
+        callable for the full count."""
+        rows = query.limit(self.max_rows + 1).yield_per(self.chunk_rows)
+        return iter(rows), query.order_by(None).count
@@ -0,0 +1,92 @@
+"""Ranked product search backed by an SQLite FTS5 index.
+
+``product_fts`` is an external-content FTS5 table over ``product.name`` and
+``product.category``.  Triggers on ``product`` keep it in sync, so ORM writes,
+bulk statements and other processes writing the same file are all covered.
+Queries match every word of the search term as a prefix and are ordered by
+BM25, with name matches weighted above category matches.
+
+If the database is not SQLite or was built without FTS5, ``available`` stays
+False and searches fall back to the catalog index substring match.
+"""
+import re
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        name, category, content='product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, name, category) VALUES (new.id, new.name, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, category)
+        VALUES ('delete', old.id, old.name, old.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, category ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, category)
+        VALUES ('delete', old.id, old.name, old.category);
+        INSERT INTO product_fts(rowid, name, category) VALUES (new.id, new.name, new.category);
+    END""",
+]
+
+# bm25() column weights: (name, category)
+_RANKED_IDS = text(
+    "SELECT rowid FROM product_fts WHERE product_fts MATCH :query "
+    "ORDER BY bm25(product_fts, 10.0, 1.0) LIMIT :limit"
+)
+
+
+def match_query(term):
+    """Turn free text into an FTS5 query: every word must match as a prefix."""
+    words = _WORD_RE.findall(term.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+class ProductSearch:
+    def __init__(self, catalog, limit=20):
+        self.catalog = catalog
+        self.limit = limit
+        self.available = False
+
+    def init_app(self, db):
+        """Create the FTS table and triggers, backfilling on first creation.
+        Must run after ``db.create_all()``."""
+        self.db = db
+        if db.engine.dialect.name != 'sqlite':
+            return
+        try:
+            with db.engine.begin() as conn:
+                exists = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_fts'"
+                )).first()
+                for statement in _SCHEMA:
+                    conn.execute(text(statement))
+                if not exists:
+                    conn.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+        except OperationalError:
+            # SQLite built without FTS5
+            return
+        self.available = True
+
+    def search(self, term, limit=None):
+        """Return up to ``limit`` product rows matching ``term``, best first."""
+        limit = limit or self.limit
+        query = match_query(term)
+        if not self.available or not query:
+            return self.catalog.search_name(term, limit=limit)
+        ids = [row[0] for row in self.db.session.execute(_RANKED_IDS, {'query': query, 'limit': limit})]
+        return self.catalog.get_many(ids)
+
+    async def ranked_ids(self, session, term, limit=None):
+        """Ids of the best FTS matches for ``term``, queried on an
+        ``AsyncSession``; None when ``search`` would fall back to the catalog."""
+        query = match_query(term)
+        if not self.available or not query:
+            return None
+        result = await session.execute(_RANKED_IDS, {'query': query, 'limit': limit or self.limit})
+        return [row[0] for row in result]
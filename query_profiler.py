@@ -0,0 +1,141 @@
+"""Opt-in per-request SQL profiler: repeated statements, slow ones and budgets.
+
+``QueryProfiler.init_app(app, db)`` records every statement a request runs
+(through the engine's cursor events) under its normalized shape: literals and
+bound values become ``?`` and ``IN`` lists collapse to ``IN (?)``, so the
+same lookup with different arguments is one shape.  When the request ends the
+profile is appended to ``history`` and a warning is logged if:
+
+* a shape ran more than once (the usual sign of an N+1 loop or of separate
+  single-row checks that one query could answer);
+* a statement took longer than ``slow_ms``;
+* the request ran more statements than its budget.  ``budgets`` maps
+  ``"METHOD /url/<rule>"`` to the most statements that route may run.
+
+With ``strict`` an over-budget request raises ``QueryBudgetExceeded`` from
+``after_request``, which fails the request and, under the test client, the
+test.  ``check_query_budgets.py`` locks in the statement counts of the chat
+commands and product routes this way.
+
+Profiling costs a regex substitution per statement, so it is meant for
+development and CI (``QUERY_PROFILER=1``), not production.
+"""
+import collections
+import re
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from flask import request
+from sqlalchemy import event
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+_POSTCOMPILE = re.compile(r'\(__\[POSTCOMPILE_\w+\]\)')
+
+
+def normalize(statement):
+    """Return the shape of ``statement`` with its values replaced by ``?``."""
+    shape = _STRING.sub('?', statement)
+    shape = _NUMBER.sub('?', shape)
+    shape = _SPACE.sub(' ', shape).strip()
+    # (__[POSTCOMPILE_x]) and expanded "IN (?, ?, ?)" lists alike
+    shape = _POSTCOMPILE.sub('(?)', shape)
+    return _IN_LIST.sub('IN (?)', shape)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestProfile(NamedTuple):
+    route: str                # "METHOD /url/<rule>"
+    count: int
+    seconds: float
+    shapes: dict              # shape -> number of times it ran
+    duplicates: list          # [(shape, times)] for shapes that ran more than once
+    slow: list                # [(shape, ms)] for statements over slow_ms
+    budget: Optional[int] = None
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.count > self.budget
+
+
+class QueryProfiler:
+    def __init__(self, slow_ms=100, budgets=None, strict=False, history=100):
+        self.slow_ms = slow_ms
+        self.budgets = dict(budgets or {})
+        self.strict = strict
+        self.history = collections.deque(maxlen=history)
+        self._local = threading.local()
+
+    def init_app(self, app, db):
+        """Install the request hooks and the cursor listeners on ``db``'s
+        engine.  Must run inside an app context."""
+        self.logger = app.logger
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        event.listen(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_request(self):
+        self._local.statements = []
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._profiler_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        statements = getattr(self._local, 'statements', None)
+        if statements is None:
+            return
+        start = getattr(context, '_profiler_start', None)
+        statements.append((statement, time.perf_counter() - start if start is not None else 0.0))
+
+    def profile(self):
+        """Profile of the statements the current request has run so far."""
+        statements = getattr(self._local, 'statements', None) or []
+        rule = request.url_rule
+        route = f"{request.method} {rule.rule if rule is not None else request.path}"
+        shapes = collections.Counter()
+        slow = []
+        for statement, seconds in statements:
+            shape = normalize(statement)
+            shapes[shape] += 1
+            if seconds * 1000 > self.slow_ms:
+                slow.append((shape, round(seconds * 1000, 1)))
+        return RequestProfile(
+            route=route,
+            count=len(statements),
+            seconds=sum(seconds for _, seconds in statements),
+            shapes=dict(shapes),
+            duplicates=[(shape, times) for shape, times in shapes.items() if times > 1],
+            slow=slow,
+            budget=self.budgets.get(route),
+        )
+
+    def _after_request(self, response):
+        if self.strict and getattr(self._local, 'statements', None) is not None:
+            profile = self.profile()
+            if profile.over_budget:
+                raise QueryBudgetExceeded(
+                    f'{profile.route} ran {profile.count} SQL statements, budget is {profile.budget}')
+        return response
+
+    def _teardown_request(self, exc):
+        if getattr(self._local, 'statements', None) is None:
+            return
+        profile = self.profile()
+        self._local.statements = None
+        self.history.append(profile)
+        for shape, times in profile.duplicates:
+            self.logger.warning('%s ran the same statement %d times: %s', profile.route, times, shape)
+        for shape, ms in profile.slow:
+            self.logger.warning('%s ran a statement for %.1f ms: %s', profile.route, ms, shape)
+        if profile.over_budget:
+            self.logger.warning('%s ran %d SQL statements, budget is %d',
+                                profile.route, profile.count, profile.budget)
@@ -0,0 +1,83 @@
+"""LRU cache of chat responses, invalidated by a catalog version.
+
+Read-only chat commands (listing, searching, browsing a category) produce the
+same text until the catalog changes.  ``ResponseCache`` stores those
+responses, bounded to ``maxsize`` entries, each tagged with the catalog
+``version`` it was computed at.  ``watch(db, model)`` bumps the version after
+every commit that wrote the model, whether through the ORM, bulk
+``INSERT``/``UPDATE``/``DELETE`` or Core statements run on the session, so a
+stale entry is never served; it is simply dropped on its next lookup.
+
+A response computed while a write commits would be stored under the wrong
+version, so callers read ``version`` before computing and pass it to ``put``,
+which discards the entry if the version has moved on since.
+"""
+import collections
+import sys
+import threading
+
+from commit_watch import CommitWatch
+
+
+class ResponseCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries = collections.OrderedDict()  # key -> (version, response, size)
+        self._lock = threading.Lock()
+
+    def watch(self, db, model):
+        """Bump the version after each commit that changed ``model`` rows."""
+        self._watch = CommitWatch(model, lambda changes: self.bump(), self.bump, match_table=True)
+        self.listen(db.session)
+
+    def listen(self, target):
+        self._watch.listen(target)
+
+    def get(self, key):
+        """Return the cached response for ``key``, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == self.version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._discard(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, response, version):
+        """Store ``response``, computed when the catalog was at ``version``."""
+        size = sys.getsizeof(response) + sum(sys.getsizeof(part) for part in key)
+        with self._lock:
+            if version != self.version:
+                return
+            self._discard(key)
+            self._entries[key] = (version, response, size)
+            self.bytes += size
+            while len(self._entries) > self.maxsize:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def bump(self):
+        with self._lock:
+            self.version += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'version': self.version,
+        }
@@ -1,150 +1,117 @@
-<<<<<<< HEAD
-from app import app, db, Product
-import random
+"""Seed the database of ``app.py``.
 
-def seed_database():
-    # Create all tables
-    with app.app_context():
-        db.create_all()
-        
-        # Clear existing products
-        Product.query.delete()
-        
-        # Sample products
-        products = [
-            {
-                'name': 'iPhone 13',
-                'price': 799.99,
-                'category': 'Electronics',
-                'stock': 50
-            },
-            {
-                'name': 'Samsung Galaxy S21',
-                'price': 699.99,
-                'category': 'Electronics',
-                'stock': 45
-            },
-            {
-                'name': 'MacBook Pro',
-                'price': 1299.99,
-                'category': 'Electronics',
-                'stock': 30
-            },
-            {
-                'name': 'Nike Air Max',
-                'price': 129.99,
-                'category': 'Footwear',
-                'stock': 100
-            },
-            {
-                'name': 'Adidas T-Shirt',
-                'price': 29.99,
-                'category': 'Clothing',
-                'stock': 200
-            },
-            {
-                'name': 'Sony Headphones',
-                'price': 199.99,
-                'category': 'Electronics',
-                'stock': 75
-            },
-            {
-                'name': 'Levi\'s Jeans',
-                'price': 59.99,
-                'category': 'Clothing',
-                'stock': 150
-            },
-            {
-                'name': 'Canon Camera',
-                'price': 899.99,
-                'category': 'Electronics',
-                'stock': 25
-            }
-        ]
-
-        # Add products to database
-        for product_data in products:
-            product = Product(**product_data)
-            db.session.add(product)
-
-        # Commit changes
-        db.session.commit()
-        print("Database seeded successfully!")
+    python seed_products.py
+    python seed_products.py --products 100000 --users 50 --messages 200
 
-if __name__ == '__main__':
-=======
-from app import app, db, Product
-import random
+Without options the products are replaced by eight sample products.  With
+``--products N`` they are replaced by N synthetic ones instead, named
+"<Brand> <Noun> <i>" across 50 categories; the benchmarks in ``bench/`` seed
+the same catalog, so names and categories are predictable.  ``--users N`` adds
+users ``user0`` .. ``user<N-1>`` (password ``password``, hashed once and
+shared) and ``--messages M`` gives each of them M chat messages, alternating
+user and assistant turns.
+
+The app is imported inside ``seed_database()``, so the generators can be imported
+without binding a database.
+"""
+import argparse
+
+BRANDS = ['Acme', 'Zephyr', 'Nimbus', 'Orion', 'Vertex', 'Helix', 'Quasar', 'Pulse']
+NOUNS = ['Phone', 'Laptop', 'Lamp', 'Chair', 'Shoe', 'Shirt', 'Camera', 'Watch', 'Kettle', 'Drone']
+CATEGORIES = [f'Category{i}' for i in range(50)]
+
+SAMPLE_PRODUCTS = [
+    {'name': 'iPhone 13', 'price': 799.99, 'category': 'Electronics', 'stock': 50},
+    {'name': 'Samsung Galaxy S21', 'price': 699.99, 'category': 'Electronics', 'stock': 45},
+    {'name': 'MacBook Pro', 'price': 1299.99, 'category': 'Electronics', 'stock': 30},
+    {'name': 'Nike Air Max', 'price': 129.99, 'category': 'Footwear', 'stock': 100},
+    {'name': 'Adidas T-Shirt', 'price': 29.99, 'category': 'Clothing', 'stock': 200},
+    {'name': 'Sony Headphones', 'price': 199.99, 'category': 'Electronics', 'stock': 75},
+    {'name': 'Levi\'s Jeans', 'price': 59.99, 'category': 'Clothing', 'stock': 150},
+    {'name': 'Canon Camera', 'price': 899.99, 'category': 'Electronics', 'stock': 25},
+]
+
+USER_PASSWORD = 'password'
+
+
+def synthetic_products(size):
+    for i in range(size):
+        yield {
+            'name': f'{BRANDS[i % len(BRANDS)]} {NOUNS[i % len(NOUNS)]} {i}',
+            'price': round(5 + (i * 7919) % 2000 + 0.99, 2),
+            'category': CATEGORIES[i % len(CATEGORIES)],
+            'stock': (i * 31) % 500,
+        }
+
+
+def _insert_chunked(db, model, rows, chunk):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == chunk:
+            db.session.execute(db.insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(model), batch)
+    db.session.commit()
+
+
+def seed(db, Product, size, chunk=10000):
+    """Insert ``size`` synthetic products."""
+    _insert_chunked(db, Product, synthetic_products(size), chunk)
+
+
+def seed_users(db, User, count, password_hash, prefix='user'):
+    """Insert ``count`` users sharing ``password_hash``; return their ids."""
+    last_id = db.session.query(db.func.max(User.id)).scalar() or 0
+    _insert_chunked(db, User, ({'username': f'{prefix}{i}', 'email': f'{prefix}{i}@example.com',
+                                'password': password_hash} for i in range(count)), 10000)
+    return [user_id for (user_id,) in db.session.query(User.id).filter(User.id > last_id).order_by(User.id)]
+
+
+def seed_chat_history(db, ChatMessage, user_ids, messages):
+    """Give each user ``messages`` chat messages numbered from 1."""
+    def rows():
+        for user_id in user_ids:
+            for seq in range(1, messages + 1):
+                if seq % 2:
+                    content = {'role': 'user', 'content': f'search {NOUNS[seq % len(NOUNS)].lower()}'}
+                else:
+                    content = {'role': 'assistant', 'content': f'Reply {seq}'}
+                yield {'user_id': user_id, 'seq': seq, 'content': content}
+    _insert_chunked(db, ChatMessage, rows(), 10000)
+
+
+def seed_database(products=None, users=0, messages=0):
+    """Replace the products with the samples (or ``products`` synthetic
+    ones) and add ``users`` users with ``messages`` chat messages each."""
+    from app import app, db, ChatMessage, Product, User, passwords
 
-def seed_database():
-    # Create all tables
     with app.app_context():
         db.create_all()
-        
-        # Clear existing products
         Product.query.delete()
-        
-        # Sample products
-        products = [
-            {
-                'name': 'iPhone 13',
-                'price': 799.99,
-                'category': 'Electronics',
-                'stock': 50
-            },
-            {
-                'name': 'Samsung Galaxy S21',
-                'price': 699.99,
-                'category': 'Electronics',
-                'stock': 45
-            },
-            {
-                'name': 'MacBook Pro',
-                'price': 1299.99,
-                'category': 'Electronics',
-                'stock': 30
-            },
-            {
-                'name': 'Nike Air Max',
-                'price': 129.99,
-                'category': 'Footwear',
-                'stock': 100
-            },
-            {
-                'name': 'Adidas T-Shirt',
-                'price': 29.99,
-                'category': 'Clothing',
-                'stock': 200
-            },
-            {
-                'name': 'Sony Headphones',
-                'price': 199.99,
-                'category': 'Electronics',
-                'stock': 75
-            },
-            {
-                'name': 'Levi\'s Jeans',
-                'price': 59.99,
-                'category': 'Clothing',
-                'stock': 150
-            },
-            {
-                'name': 'Canon Camera',
-                'price': 899.99,
-                'category': 'Electronics',
-                'stock': 25
-            }
-        ]
-
-        # Add products to database
-        for product_data in products:
-            product = Product(**product_data)
-            db.session.add(product)
-
-        # Commit changes
-        db.session.commit()
-        print("Database seeded successfully!")
+        if products is None:
+            db.session.execute(db.insert(Product), SAMPLE_PRODUCTS)
+            db.session.commit()
+        else:
+            seed(db, Product, products)
+        user_ids = []
+        if users:
+            user_ids = seed_users(db, User, users, passwords.hash(USER_PASSWORD))
+        if messages:
+            seed_chat_history(db, ChatMessage, user_ids, messages)
+        print(f"Database seeded with {products if products is not None else len(SAMPLE_PRODUCTS)} products, "
+              f"{len(user_ids)} users and {len(user_ids) * messages} chat messages")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed the product database.')
+    parser.add_argument('--products', type=int, help='synthetic products instead of the eight samples')
+    parser.add_argument('--users', type=int, default=0)
+    parser.add_argument('--messages', type=int, default=0, help='chat messages per user')
+    args = parser.parse_args()
+    seed_database(args.products, args.users, args.messages)
+
 
 if __name__ == '__main__':
->>>>>>> 8c8c283ab03ce3aa65304dd6ba76fd59ace1705e
-    seed_database() 
\ No newline at end of file
+    main()
@@ -0,0 +1,150 @@
+"""Production launcher: a pre-forked pool of worker processes on one port.
+
+    python serve.py [--app app|backend|asgi] [--workers N] [--host 0.0.0.0] [--port 5000]
+
+Both Flask apps end in ``app.run(debug=True)``: one process running the
+development server with the debugger and reloader.  ``serve.py`` instead
+imports the app once and calls its ``create_app()`` if it has one, so schema
+setup runs a single time, binds the listening socket and forks ``--workers``
+processes that each accept connections on it with a threaded WSGI server.  A worker that dies is replaced.  SIGTERM or
+Ctrl-C stops the workers, and each flushes its write-behind queue on exit.
+
+Each worker keeps its own in-process caches.  Product changes made by other
+workers reach them through ``change_log.ChangeLog`` within
+``CATALOG_SYNC_INTERVAL`` seconds; cached users and tokens expire on their own
+TTLs as before.  Run with SQLite in WAL mode (the default, see
+``sqlite_pragmas.py``) so that the workers' readers do not wait for each other's
+commits.
+
+``--app asgi`` runs ``asgi:app`` under uvicorn with the same number of
+workers.  Where ``os.fork`` is not available (Windows) the WSGI apps run in a
+single process.
+
+The number of workers defaults to ``$WEB_CONCURRENCY`` or the CPU count.
+"""
+import argparse
+import importlib
+import os
+import signal
+import socket
+import sys
+import time
+
+from werkzeug.serving import make_server
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APPS = {'app': 'app', 'backend': 'backend.app', 'asgi': 'asgi'}
+
+
+def run_worker(module, sock):
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # Connections opened by the parent must not be shared with the workers
+    with module.app.app_context():
+        module.db.engine.dispose(close=False)
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, module.app, threaded=True, fd=sock.fileno())
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def stop_worker(module):
+    """Write the worker's buffered chat messages and close its connections."""
+    writer = getattr(module, 'message_writer', None)
+    if writer is not None:
+        writer.stop()
+    with module.app.app_context():
+        module.db.engine.dispose()
+
+
+def spawn(module, sock):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(module, sock)
+        except SystemExit as e:
+            code = e.code or 0
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            code = 1
+        finally:
+            try:
+                stop_worker(module)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = code or 1
+            # Never return into the parent's supervision loop
+            os._exit(code)
+    return pid
+
+
+def serve_prefork(module, host, port, workers):
+    sock = socket.create_server((host, port), backlog=2048)
+    sock.set_inheritable(True)
+    print(f'Serving {module.__name__} on http://{host}:{port} with {workers} worker processes', flush=True)
+
+    stopping = False
+    children = set()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    children.update(spawn(module, sock) for _ in range(workers))
+    while children:
+        try:
+            pid, status = os.waitpid(-1, 0)
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f'Worker {pid} exited with status {status}; starting a new one', file=sys.stderr, flush=True)
+            time.sleep(0.1)
+            children.add(spawn(module, sock))
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app', choices=sorted(APPS), default='app')
+    parser.add_argument('--workers', type=int,
+                        default=int(os.getenv('WEB_CONCURRENCY', os.cpu_count() or 1)))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    if args.app == 'asgi':
+        import uvicorn
+
+        # Create the schema once before the workers import the app
+        importlib.import_module('app')
+        uvicorn.run('asgi:app', host=args.host, port=args.port, workers=args.workers)
+        return
+
+    module = importlib.import_module(APPS[args.app])
+    if hasattr(module, 'create_app'):
+        # Apps that defer their setup do it here, once, before the fork
+        module.create_app()
+    if not hasattr(os, 'fork'):
+        print('os.fork is not available; serving from a single process', file=sys.stderr)
+        make_server(args.host, args.port, module.app, threaded=True).serve_forever()
+        return
+    serve_prefork(module, args.host, args.port, max(1, args.workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Per-connection SQLite settings, applied through an engine ``connect`` hook.
+
+SQLite's defaults suit a single process: the rollback journal makes readers
+and the writer block each other, ``synchronous=FULL`` syncs to disk on every
+commit and the page cache is 2 MiB per connection.  ``configure_sqlite``
+sets, on every new connection of an engine:
+
+* ``journal_mode`` (``wal``): readers keep reading while a writer commits,
+  across threads and processes.  The mode is stored in the database file.
+* ``synchronous`` (``normal``): in WAL mode a commit survives an application
+  crash and only the last transactions can be lost on power failure.
+* ``busy_timeout`` (ms): how long a connection waits for the write lock
+  before failing with "database is locked".
+* ``cache_size`` (KiB of page cache per connection) and ``mmap_size`` (bytes
+  of the file read through memory mapping).
+
+A setting of None leaves SQLite's default in place.  Engines for other
+databases are left untouched.
+"""
+from sqlalchemy import event
+
+
+def sqlite_pragmas(journal_mode='wal', synchronous='normal', busy_timeout=5000,
+                   cache_size=16384, mmap_size=256 * 1024 * 1024):
+    """Return the ``PRAGMA`` statements for the given settings."""
+    settings = [
+        ('journal_mode', journal_mode),
+        ('synchronous', synchronous),
+        ('busy_timeout', busy_timeout),
+        # A negative cache_size is a size in KiB rather than in pages
+        ('cache_size', -cache_size if cache_size is not None else None),
+        ('mmap_size', mmap_size),
+    ]
+    return [f'PRAGMA {name} = {value}' for name, value in settings if value is not None]
+
+
+def configure_sqlite(engine, **settings):
+    """Apply ``sqlite_pragmas(**settings)`` to every connection ``engine``
+    opens from now on; returns False if it is not an SQLite engine."""
+    if engine.dialect.name != 'sqlite':
+        return False
+    statements = sqlite_pragmas(**settings)
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    return True
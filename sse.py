@@ -0,0 +1,30 @@
+"""Server-Sent Events responses for streamed chat replies.
+
+Each chunk of the reply is sent as soon as it is produced, as a default
+``message`` event whose data is ``{"text": chunk}``.  The stream ends with a
+``done`` event, or an ``error`` event (``{"error": ...}``) if producing the
+reply failed part way through.
+"""
+import json
+
+from flask import Response, stream_with_context
+
+
+def sse_response(chunks, on_complete=None):
+    """Stream ``chunks`` as SSE.  ``on_complete(text)`` is called with the
+    full reply once every chunk has been sent, e.g. to store it."""
+    def events():
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield f'data: {json.dumps({"text": chunk})}\n\n'
+            if on_complete is not None:
+                on_complete(''.join(parts))
+        except Exception as e:
+            yield f'event: error\ndata: {json.dumps({"error": str(e)})}\n\n'
+            return
+        yield 'event: done\ndata: {}\n\n'
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
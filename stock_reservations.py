@@ -0,0 +1,217 @@
+"""Atomic stock decrements and reservations.
+
+Every stock change is a single conditional statement::
+
+    UPDATE product SET stock = stock - :qty WHERE name = :name AND stock >= :qty
+
+so concurrent checkouts can neither oversell nor lose updates, and no row is
+read into Python before it is changed.  The statement is issued first in its
+transaction, which lets SQLite take the write lock up front instead of
+upgrading a read transaction (the usual source of ``database is locked``
+errors under contention).
+
+A reservation decrements stock for several products in one transaction and
+records them with an expiry time.  It is then either committed (the stock
+stays taken) or released (the stock is put back); reservations still held
+after their TTL are released by ``expire()``.  ``sweep()`` runs it at most once
+every ``sweep_interval`` seconds; ``take()`` and ``reserve()`` call it, and the
+apps call it before every request, so an abandoned hold is returned within
+about ``sweep_interval`` of expiring whatever traffic follows.
+"""
+import datetime
+import time
+import uuid
+
+
+class StockError(Exception):
+    pass
+
+
+class UnknownProduct(StockError):
+    def __init__(self, name):
+        super().__init__(f"Product '{name}' not found")
+        self.name = name
+
+
+class InsufficientStock(StockError):
+    def __init__(self, name, requested, available):
+        super().__init__(f"Not enough stock for '{name}': requested {requested}, available {available}")
+        self.name = name
+        self.requested = requested
+        self.available = available
+
+
+class ReservationError(StockError):
+    pass
+
+
+class ReservationNotFound(ReservationError):
+    pass
+
+
+def normalize_items(items):
+    """Accept ``{name: qty}`` or ``[{'name': ..., 'quantity': ...}]`` and
+    return ``{name: qty}`` with positive integer quantities."""
+    if isinstance(items, dict):
+        pairs = items.items()
+    else:
+        try:
+            pairs = [(item['name'], item['quantity']) for item in items]
+        except (KeyError, TypeError):
+            raise ValueError('Each item needs a name and a quantity')
+    normalized = {}
+    for name, quantity in pairs:
+        quantity = int(quantity)
+        if quantity <= 0:
+            raise ValueError('Quantity must be positive')
+        normalized[name] = normalized.get(name, 0) + quantity
+    if not normalized:
+        raise ValueError('At least one item is required')
+    return normalized
+
+
+class StockReservations:
+    def __init__(self, db, product_model, reservation_model, catalog=None,
+                 default_ttl=600, sweep_interval=1.0):
+        self.db = db
+        self.products = product_model.__table__
+        self.reservations = reservation_model.__table__
+        self.catalog = catalog
+        self.default_ttl = default_ttl
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+
+    def _adjust(self, name, delta):
+        """Apply ``stock += delta``, refusing to go below zero. Returns the
+        new stock or None if the condition failed."""
+        table = self.products
+        row = self.db.session.execute(
+            table.update()
+            .where(table.c.name == name, table.c.stock >= -delta)
+            .values(stock=table.c.stock + delta)
+            .returning(table.c.id, table.c.stock, table.c.updated_at)
+        ).first()
+        if row is None:
+            return None
+        if self.catalog is not None:
+            self.catalog.stage_update(self.db.session, row.id, stock=row.stock,
+                                      updated_at=row.updated_at.isoformat())
+        return row.stock
+
+    def _take(self, items):
+        """Decrement every item in the current transaction, in name order."""
+        remaining = {}
+        for name, quantity in sorted(items.items()):
+            stock = self._adjust(name, -quantity)
+            if stock is None:
+                available = self.db.session.execute(
+                    self.db.select(self.products.c.stock).where(self.products.c.name == name)
+                ).scalar()
+                if available is None:
+                    raise UnknownProduct(name)
+                raise InsufficientStock(name, quantity, available)
+            remaining[name] = stock
+        return remaining
+
+    def take(self, items):
+        """Decrement stock immediately. Returns ``{name: remaining stock}``;
+        nothing is changed if any item cannot be fulfilled."""
+        items = normalize_items(items)
+        self.sweep()
+        try:
+            remaining = self._take(items)
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+        return remaining
+
+    def reserve(self, items, ttl=None):
+        """Hold stock for ``items`` until committed, released or expired."""
+        items = normalize_items(items)
+        self.sweep()
+        ttl = self.default_ttl if ttl is None else ttl
+        reservation = {
+            'id': uuid.uuid4().hex,
+            'status': 'held',
+            'items': [{'name': name, 'quantity': quantity} for name, quantity in sorted(items.items())],
+            'expires_at': datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl),
+        }
+        try:
+            self._take(items)
+            self.db.session.execute(self.reservations.insert().values(**reservation))
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+        return reservation
+
+    def _close(self, reservation_id, status, require_unexpired=False):
+        table = self.reservations
+        condition = [table.c.id == reservation_id, table.c.status == 'held']
+        if require_unexpired:
+            condition.append(table.c.expires_at > datetime.datetime.utcnow())
+        row = self.db.session.execute(
+            table.update().where(*condition)
+            .values(status=status).returning(table.c['items'])
+        ).first()
+        if row is None:
+            current = self.db.session.execute(
+                self.db.select(table.c.status, table.c.expires_at).where(table.c.id == reservation_id)
+            ).first()
+            if current is None:
+                raise ReservationNotFound(f"Reservation '{reservation_id}' not found")
+            if current.status == 'held':
+                raise ReservationError(f"Reservation '{reservation_id}' has expired")
+            raise ReservationError(f"Reservation '{reservation_id}' is already {current.status}")
+        return row[0]
+
+    def commit(self, reservation_id):
+        """Make a held reservation permanent."""
+        try:
+            items = self._close(reservation_id, 'committed', require_unexpired=True)
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+        return items
+
+    def release(self, reservation_id, status='released'):
+        """Return a held reservation's stock."""
+        try:
+            items = self._close(reservation_id, status)
+            for item in items:
+                self._adjust(item['name'], item['quantity'])
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+        return items
+
+    def due(self):
+        return time.monotonic() >= self._next_sweep
+
+    def sweep(self):
+        """``expire()`` if ``sweep_interval`` seconds have passed since the last
+        sweep; returns the number of reservations released."""
+        if not self.due():
+            return 0
+        self._next_sweep = time.monotonic() + self.sweep_interval
+        return self.expire()
+
+    def expire(self):
+        """Release every held reservation past its expiry time."""
+        table = self.reservations
+        expired = self.db.session.execute(
+            self.db.select(table.c.id)
+            .where(table.c.status == 'held', table.c.expires_at <= datetime.datetime.utcnow())
+        ).scalars().all()
+        self.db.session.rollback()
+        released = 0
+        for reservation_id in expired:
+            try:
+                self.release(reservation_id, status='expired')
+                released += 1
+            except ReservationError:
+                pass  # committed or released concurrently
+        return released
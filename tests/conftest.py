@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py binds its database at import time, so point it at a scratch file first
+os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}",
+                  SECRET_KEY='test', BCRYPT_ROUNDS='4', CATALOG_SYNC_INTERVAL='3600')
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture
+def app_context(app_module):
+    with app_module.app.app_context():
+        yield
+
+
+@pytest.fixture(scope='session')
+def asgi_client(app_module):
+    from starlette.testclient import TestClient
+
+    import asgi
+    with TestClient(asgi.app) as client:
+        credentials = {'username': 'asgi', 'email': 'asgi@example.com', 'password': 'pw'}
+        client.post('/api/register', json=credentials)
+        client.post('/api/login', json=credentials)
+        yield client
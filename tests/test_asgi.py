@@ -0,0 +1,14 @@
+import pytest
+
+
+@pytest.mark.parametrize('body', [{'message': 5}, ['show all products']])
+def test_chat_rejects_body_without_message_string(asgi_client, body):
+    response = asgi_client.post('/api/chat', json=body)
+    assert response.status_code == 400
+    assert response.json() == {'error': 'Message is required'}
+
+
+def test_chat_rejects_non_json_body(asgi_client):
+    response = asgi_client.post('/api/chat', content=b'show all products', headers={'Content-Type': 'text/plain'})
+    assert response.status_code == 400
+    assert response.json() == {'error': 'Message is required'}
@@ -0,0 +1,24 @@
+import pytest
+
+
+@pytest.fixture
+def products(app_module, app_context):
+    db, Product = app_module.db, app_module.Product
+    db.session.add(Product(name='iPhone 15', price=799, stock=3, category='Electronics'))
+    db.session.add_all([Product(name=f'Phone case {i}', price=9, stock=1, category='Accessories')
+                        for i in range(60)])
+    db.session.commit()
+    yield
+    db.session.execute(db.delete(Product))
+    db.session.commit()
+
+
+def test_search_matches_inside_words(app_module, products):
+    reply = app_module.handle_product_query('search phone')
+    assert '- iPhone 15:' in reply
+
+
+def test_search_lists_every_match(app_module, products):
+    reply = app_module.handle_product_query('search phone')
+    assert reply.startswith("Found 61 products matching 'phone'")
+    assert reply.count('- Phone case') == 60
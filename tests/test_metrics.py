@@ -0,0 +1,22 @@
+from flask import Flask
+
+from metrics import Metrics
+
+
+def client(token):
+    app = Flask(__name__)
+    Metrics().init_app(app, token=token)
+    return app.test_client()
+
+
+def test_metrics_require_the_configured_token():
+    metrics = client('scrape-secret')
+    assert metrics.get('/metrics').status_code == 401
+    assert metrics.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = metrics.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    assert response.status_code == 200
+    assert b'http_requests_total' in response.data
+
+
+def test_metrics_without_token_are_open():
+    assert client(None).get('/metrics').status_code == 200
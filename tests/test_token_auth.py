@@ -0,0 +1,18 @@
+import time
+
+from token_auth import RevocationList
+
+
+def test_revocation_reaches_worker_after_expired_rows_are_pruned(app_module, app_context):
+    db, RevokedToken = app_module.db, app_module.RevokedToken
+    this_worker = RevocationList(db, RevokedToken, sync_interval=3600)
+    other_worker = RevocationList(db, RevokedToken, sync_interval=3600)
+
+    expired = time.time() - 1
+    this_worker.revoke('expired-1', expired)
+    this_worker.revoke('expired-2', expired)
+    assert not other_worker.is_revoked('expired-1', sync=True)
+
+    # Pruning the expired rows frees the highest id the other worker has seen
+    this_worker.revoke('refresh', time.time() + 14 * 24 * 3600)
+    assert other_worker.is_revoked('refresh', sync=True)
@@ -0,0 +1,191 @@
+"""Stateless bearer-token authentication.
+
+``TokenAuth`` issues short-lived access tokens and longer-lived refresh
+tokens, both HS256 JWTs carrying the user's id, username and email, so any
+worker that knows the secret can authenticate a request without a session
+store or a user lookup.  Decoded tokens are cached per process (LRU, bounded
+by ``cache_size``, dropped once expired).
+
+Revoked token ids live in a database table that every worker reads
+incrementally: ``RevocationList`` keeps the unexpired ids in memory and pulls
+rows with a higher id than the last it saw at most once every ``sync_interval``
+seconds, so checking a token costs a set lookup.  The table must therefore
+never reuse ids (``sqlite_autoincrement``), even after pruning expired rows.  A revocation made on one worker
+therefore reaches the others within ``sync_interval``.  Refreshing always
+syncs first and revokes the refresh token it used (rotation), so a stolen
+refresh token cannot be replayed after its owner has refreshed.
+"""
+import collections
+import datetime
+import os
+import secrets
+import threading
+import time
+import uuid
+
+import jwt
+from sqlalchemy.exc import IntegrityError
+
+from user_cache import UserRecord
+
+
+class TokenError(Exception):
+    pass
+
+
+def persistent_secret(path):
+    """Return the key stored at ``path``, creating it on first use.
+
+    Used when no secret is configured, so that every worker on this host and
+    every restart sign sessions and tokens with the same key."""
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    key = secrets.token_hex(32)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another worker created it first
+        with open(path) as f:
+            return f.read().strip()
+    with os.fdopen(fd, 'w') as f:
+        f.write(key)
+    return key
+
+
+def bearer_token(request):
+    """Return the token from an ``Authorization: Bearer`` header, if any."""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() == 'bearer' and token:
+        return token.strip()
+    return None
+
+
+class RevocationList:
+    def __init__(self, db, model, sync_interval=5):
+        self.db = db
+        self.model = model
+        self.sync_interval = sync_interval
+        self._revoked = {}  # jti -> exp (epoch seconds)
+        self._last_id = 0
+        self._next_sync = 0.0
+        self._lock = threading.Lock()
+
+    def revoke(self, jti, exp):
+        """Revoke ``jti``; returns False if it was already revoked."""
+        expires_at = datetime.datetime.utcfromtimestamp(exp)
+        try:
+            # Rows for tokens that have expired anyway are no longer needed
+            self.db.session.execute(self.db.delete(self.model).where(
+                self.model.expires_at <= datetime.datetime.utcnow()))
+            self.db.session.add(self.model(jti=jti, expires_at=expires_at))
+            self.db.session.commit()
+            revoked = True
+        except IntegrityError:
+            self.db.session.rollback()
+            revoked = False
+        with self._lock:
+            self._revoked[jti] = exp
+        return revoked
+
+    def _sync(self):
+        model = self.model
+        rows = self.db.session.execute(
+            self.db.select(model.id, model.jti, model.expires_at)
+            .where(model.id > self._last_id).order_by(model.id)
+        ).all()
+        now = time.time()
+        for row in rows:
+            self._revoked[row.jti] = row.expires_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+            self._last_id = row.id
+        for jti in [jti for jti, exp in self._revoked.items() if exp <= now]:
+            del self._revoked[jti]
+        self._next_sync = time.monotonic() + self.sync_interval
+
+    def is_revoked(self, jti, sync=False):
+        if sync or time.monotonic() >= self._next_sync:
+            with self._lock:
+                self._sync()
+        return jti in self._revoked
+
+
+class TokenAuth:
+    def __init__(self, secret, revocations=None, access_ttl=900, refresh_ttl=14 * 24 * 3600,
+                 algorithm='HS256', cache_size=4096):
+        self.secret = secret
+        self.revocations = revocations
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self.algorithm = algorithm
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()  # token -> claims
+        self._lock = threading.Lock()
+
+    def _encode(self, user, kind, ttl):
+        now = int(time.time())
+        claims = {
+            'sub': str(user.id),
+            'username': user.username,
+            'email': user.email,
+            'type': kind,
+            'jti': uuid.uuid4().hex,
+            'iat': now,
+            'exp': now + ttl,
+        }
+        return jwt.encode(claims, self.secret, algorithm=self.algorithm)
+
+    def issue(self, user):
+        """Return a new access/refresh token pair for ``user``."""
+        return {
+            'access_token': self._encode(user, 'access', self.access_ttl),
+            'refresh_token': self._encode(user, 'refresh', self.refresh_ttl),
+            'token_type': 'Bearer',
+            'expires_in': self.access_ttl,
+        }
+
+    def _decode(self, token):
+        with self._lock:
+            claims = self._cache.get(token)
+            if claims is not None:
+                if claims['exp'] > time.time():
+                    self._cache.move_to_end(token)
+                    return claims
+                del self._cache[token]
+        try:
+            claims = jwt.decode(token, self.secret, algorithms=[self.algorithm],
+                                options={'require': ['exp', 'sub', 'jti']})
+        except jwt.InvalidTokenError as e:
+            raise TokenError(str(e))
+        with self._lock:
+            self._cache[token] = claims
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return claims
+
+    def verify(self, token, kind='access', sync=False):
+        """Return the token's claims, or raise ``TokenError``."""
+        claims = self._decode(token)
+        if claims.get('type') != kind:
+            raise TokenError(f'Expected an {kind} token')
+        if self.revocations is not None and self.revocations.is_revoked(claims['jti'], sync=sync):
+            raise TokenError('Token has been revoked')
+        return claims
+
+    @staticmethod
+    def user(claims):
+        return UserRecord(int(claims['sub']), claims['username'], claims['email'])
+
+    def refresh(self, refresh_token):
+        """Exchange a refresh token for a new token pair, revoking the old one."""
+        claims = self.verify(refresh_token, kind='refresh', sync=True)
+        if not self.revoke(claims):
+            raise TokenError('Token has been revoked')  # lost a race with another refresh
+        return self.issue(self.user(claims))
+
+    def revoke(self, claims):
+        if self.revocations is None:
+            raise TokenError('Token revocation is not configured')
+        return self.revocations.revoke(claims['jti'], claims['exp'])
@@ -0,0 +1,93 @@
+"""Process-local cache of lightweight user records for per-request auth.
+
+Authenticated requests only need a user's id, username and email, yet each
+one used to load the full ``User`` row.  ``UserCache`` keeps small records
+keyed by id, bounded to ``maxsize`` entries (least recently used evicted
+first) and each valid for ``ttl`` seconds.
+
+Entries are dropped when a session commits a change to, or deletion of, that
+user, and a commit that ran a bulk statement against the model clears the
+whole cache (see ``commit_watch.CommitWatch``).
+"""
+import collections
+import threading
+import time
+from typing import NamedTuple
+
+from commit_watch import CommitWatch
+
+
+class UserRecord(NamedTuple):
+    id: int
+    username: str
+    email: str
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.email)
+
+
+class UserCache:
+    def __init__(self, model, record=UserRecord.from_user, maxsize=1024, ttl=300):
+        self.model = model
+        self.record = record
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()  # id -> (expires_at, record)
+        self._lock = threading.Lock()
+        self._watch = CommitWatch(model, self._invalidate_many, self.clear)
+
+    def init_app(self, db):
+        """Drop users changed by the commits made through ``db.session``."""
+        self.db = db
+        self.listen(db.session)
+
+    def listen(self, target):
+        self._watch.listen(target)
+
+    def get(self, user_id):
+        """Return the record for ``user_id``, or None if there is no such user."""
+        record = self.cached(user_id)
+        if record is not None:
+            return record
+        user = self.db.session.get(self.model, user_id)
+        return self.add(user) if user is not None else None
+
+    def cached(self, user_id):
+        """Return the cached record for ``user_id`` without querying, or None."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def add(self, user):
+        """Cache and return the record for a freshly loaded ``user``."""
+        record = self.record(user)
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, record)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return record
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def _invalidate_many(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
@@ -0,0 +1,117 @@
+"""Write-behind buffer for append-only rows.
+
+Rows are queued as plain dicts and inserted by a background thread in one
+``executemany`` transaction per batch.  A batch is written once it reaches
+``max_batch`` rows or its oldest row has waited ``max_delay`` seconds,
+whichever comes first, so a burst of chat turns shares a single commit.
+
+``flush()`` drains the queue synchronously (use it before reading rows back)
+and ``stop()`` flushes and joins the thread; ``start()`` registers ``stop`` with
+``atexit`` so buffered rows are written on a clean shutdown.  A worker process
+forked after ``start()`` (see ``serve.py``) starts its own writer thread with
+an empty queue.
+"""
+import atexit
+import os
+import threading
+import time
+
+
+class WriteBehindQueue:
+    def __init__(self, app, db, model, max_batch=200, max_delay=0.05, retries=3):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retries = retries
+        self._rows = []
+        self._first_at = None
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+        return self
+
+    def _after_fork(self):
+        # Only the forking thread survives; the parent still owns its rows
+        self._rows = []
+        self._first_at = None
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def put(self, *rows):
+        with self._cond:
+            if not self._rows:
+                self._first_at = time.monotonic()
+            self._rows.extend(rows)
+            if len(self._rows) >= self.max_batch or len(self._rows) == len(rows):
+                self._cond.notify()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _take(self):
+        rows, self._rows = self._rows[:self.max_batch], self._rows[self.max_batch:]
+        self._first_at = time.monotonic() if self._rows else None
+        return rows
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    if self._rows:
+                        wait = self._first_at + self.max_delay - time.monotonic()
+                        if len(self._rows) >= self.max_batch or wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                rows = self._take()
+            self._write(rows)
+
+    def _write(self, rows):
+        with self._write_lock, self.app.app_context():
+            for attempt in range(1, self.retries + 1):
+                try:
+                    self.db.session.execute(self.db.insert(self.model), rows)
+                    self.db.session.commit()
+                    return
+                except Exception:
+                    self.db.session.rollback()
+                    if attempt == self.retries:
+                        self.app.logger.exception('Dropping %d buffered %s rows', len(rows), self.model.__name__)
+                        return
+                    time.sleep(self.max_delay * attempt)
+
+    def flush(self):
+        """Write every queued row before returning."""
+        while True:
+            with self._cond:
+                if not self._rows:
+                    break
+                rows = self._take()
+            self._write(rows)
+        # Wait for a batch the background thread may be writing right now
+        with self._write_lock:
+            pass
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()